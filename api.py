@@ -7,6 +7,10 @@ from websocket_manager import WebsocketManager
 from model_manager import ModelManager
 from news_ingestor import NewsIngestor
 from bots_manager import BotManager
+from sync_jobs import SyncJobManager
+from training_scheduler import TrainingScheduler
+from backtest import Backtester, DEFAULTS as BACKTEST_DEFAULTS
+import indicators
 from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 import threading
@@ -17,7 +21,7 @@ api_bp = Blueprint("api", __name__)
 logger = logging.getLogger("api")
 
 class Services:
-    def __init__(self, db, data, ws, models, news, bots, executor, loop):
+    def __init__(self, db, data, ws, models, news, bots, executor, loop, sync, trainer, backtester):
         self.db = db
         self.data = data
         self.ws = ws
@@ -26,11 +30,21 @@ class Services:
         self.bots = bots
         self.executor = executor
         self.loop = loop
+        self.sync = sync
+        self.trainer = trainer
+        self.backtester = backtester
 
 def make_services(app):
     db = DatabaseManager()
     data = CCXTDataManager(db)
-    ws = WebsocketManager() if Config.ENABLE_WS else None
+    if db.candles_migration_pending():
+        # перенос старой historical_data в candles — в фоне, чанками
+        threading.Thread(target=db.run_candles_migration, daemon=True).start()
+    ws_url = None
+    if Config.ENABLE_WS and Config.EXCHANGE_MODE == "fake":
+        from fake_exchange import FakeKlineServer
+        ws_url = FakeKlineServer().start_in_thread().url
+    ws = WebsocketManager(url=ws_url) if Config.ENABLE_WS else None
     if ws: ws.start(); ws.subscribe(Config.SYMBOLS, Config.TIMEFRAMES)
     models = ModelManager(db)
     news = NewsIngestor(db)
@@ -40,7 +54,10 @@ def make_services(app):
     asyncio.run_coroutine_threadsafe(news.start(), loop)
     bots = BotManager(db, data, models, ws)
     executor = ThreadPoolExecutor(max_workers=Config.MAX_WORKERS)
-    return Services(db, data, ws, models, news, bots, executor, loop)
+    sync = SyncJobManager(db, data)
+    trainer = TrainingScheduler(db, models)
+    backtester = Backtester(db, models)
+    return Services(db, data, ws, models, news, bots, executor, loop, sync, trainer, backtester)
 
 @api_bp.route("/keys", methods=["GET","POST"])
 def keys():
@@ -67,19 +84,11 @@ def keys():
 
 @api_bp.route("/account", methods=["GET"])
 def account():
-    # Простая “заглушка”: баланс и позиции из нашей БД торговли
+    # Баланс и позиции из материализованной сводки сделок (trade_summary)
     sv: Services = current_app.extensions["services"]
     network = request.args.get("network","mainnet")
-    trades = sv.db.get_trades(limit=1000)
-    total_closed = [t for t in trades if t["status"]=="closed"]
-    pnl = sum([t["pnl_percent"] for t in total_closed if t["pnl_percent"] is not None]) if total_closed else 0.0
-    resp = {
-        "network": network,
-        "balance_usdt": None,  # можно добавить интеграцию с API биржи для реального баланса
-        "open_positions": len([t for t in trades if t["status"]=="open"]),
-        "closed_trades": len(total_closed),
-        "total_pnl_percent": pnl
-    }
+    resp = sv.db.account_summary(network)
+    resp["balance_usdt"] = None  # можно добавить интеграцию с API биржи для реального баланса
     return jsonify({"data": resp})
 
 @api_bp.route("/pairs_status", methods=["GET"])
@@ -103,34 +112,126 @@ def sync_history():
     symbol = body.get("symbol")
     timeframes = body.get("timeframes") or Config.TIMEFRAMES
     years = int(body.get("years", Config.HISTORY_YEARS))
-    if symbol:
-        for tf in timeframes:
-            sv.data.fetch_ohlcv_incremental(symbol, tf, years)
-    else:
-        for sym in Config.SYMBOLS:
-            for tf in timeframes:
-                sv.data.fetch_ohlcv_incremental(sym, tf, years)
-    return jsonify({"status":"ok"})
+    symbols = [symbol] if symbol else Config.SYMBOLS
+    job_id, job_ids = sv.sync.submit(symbols, timeframes, years)
+    return jsonify({"job_id": job_id, "jobs": job_ids, "status": "queued"})
+
+@api_bp.route("/sync", methods=["GET"])
+def sync_jobs():
+    sv: Services = current_app.extensions["services"]
+    jobs = sv.db.list_sync_jobs(status=request.args.get("status"), limit=int(request.args.get("limit", "50")))
+    return jsonify({"data": jobs, "active": sv.sync.active()})
+
+@api_bp.route("/sync/<int:job_id>", methods=["GET"])
+def sync_status(job_id):
+    sv: Services = current_app.extensions["services"]
+    job = sv.db.get_sync_job(job_id)
+    if not job: return jsonify({"error":"not found"}),404
+    return jsonify({"data": job})
+
+@api_bp.route("/derive/verify", methods=["GET"])
+def derive_verify():
+    sv: Services = current_app.extensions["services"]
+    symbol = request.args.get("symbol", "BTC/USDT")
+    tf = request.args.get("tf", "1h")
+    limit = min(int(request.args.get("limit", "500")), 1000)
+    return jsonify({"data": sv.data.verify_derived(symbol, tf, limit)})
+
+@api_bp.route("/data/completeness", methods=["GET"])
+def data_completeness():
+    # rescan=1 — пересканирование дыр фоновой задачей (id в scan_job, опрос через /sync/<id>);
+    # data — по итогам последнего завершённого скана
+    sv: Services = current_app.extensions["services"]
+    scan_job = sv.sync.submit_maintenance("scan") if request.args.get("rescan") == "1" else None
+    return jsonify({"data": sv.db.candle_completeness(), "scan_job": scan_job})
+
+@api_bp.route("/data/gaps", methods=["GET"])
+def data_gaps():
+    sv: Services = current_app.extensions["services"]
+    status = request.args.get("status", "open")
+    gaps = sv.db.list_candle_gaps(request.args.get("symbol"), request.args.get("tf"),
+                                  status=None if status == "all" else status, limit=int(request.args.get("limit", "1000")))
+    return jsonify({"data": gaps})
+
+@api_bp.route("/data/gaps/repair", methods=["POST"])
+def data_gaps_repair():
+    sv: Services = current_app.extensions["services"]
+    # догрузка с биржи в фоне, как /sync_history: результат — в /sync/<job_id> (result)
+    body = request.get_json(silent=True) or {}
+    job_id = sv.sync.submit_maintenance("repair", body.get("symbol"), body.get("timeframe"), int(body.get("max_gaps", 200)))
+    return jsonify({"job_id": job_id, "status": "queued"})
+
+@api_bp.route("/backfill/status", methods=["GET"])
+def backfill_status():
+    sv: Services = current_app.extensions["services"]
+    return jsonify({"data": sv.data.backfill_status()})
+
+@api_bp.route("/indicators", methods=["GET","POST"])
+def indicator_settings():
+    # symbol не задан или '*' — общие настройки; у символа — переопределения поверх общих
+    sv: Services = current_app.extensions["services"]
+    if request.method == "GET":
+        symbol = request.args.get("symbol") or "*"
+        settings = sv.db.get_indicator_settings(symbol)
+        try:
+            columns = indicators.plan_for(settings).columns
+        except ValueError as e:
+            columns = []
+            logger.warning("indicator settings for %s invalid: %s", symbol, e)
+        out = {"symbol": symbol, "data": indicators.describe(settings), "columns": columns, "symbols": Config.SYMBOLS}
+        if symbol != "*":
+            # для формы символа: что переопределено и какие значения наследуются от общих
+            out["overrides"] = sv.db.get_indicator_settings(symbol, inherit=False)
+            out["global"] = {d["name"]: {"enabled": d["enabled"], "params": d["params"]}
+                             for d in indicators.describe(sv.db.get_indicator_settings("*"))}
+        return jsonify(out)
+    body = request.get_json(force=True)
+    symbol = body.get("symbol") or "*"
+    try:
+        items = {i["name"]: {"enabled": bool(i.get("enabled", True)), "params": i.get("params") or {}}
+                 for i in body.get("indicators", [])}
+        merged = sv.db.get_indicator_settings("*") if symbol != "*" else {}
+        if symbol != "*":
+            # параметры, совпадающие с общими, не сохраняем — иначе символ перестанет видеть их изменения
+            base = {d["name"]: d["params"] for d in indicators.describe(merged)}
+            for name, s in items.items():
+                s["params"] = {k: v for k, v in s["params"].items() if v != base.get(name, {}).get(k)}
+        # проверяем итоговый набор символа вместе с общими настройками
+        for name, s in items.items():
+            cur = merged.setdefault(name, {"enabled": True, "params": {}})
+            cur["enabled"] = s["enabled"]
+            cur["params"] = dict(cur["params"], **s["params"])
+        plan = indicators.plan_for(merged)
+    except (ValueError, KeyError) as e:
+        return jsonify({"error": str(e)}), 400
+    sv.db.save_indicator_settings(symbol, items)
+    return jsonify({"status": "ok", "symbol": symbol, "columns": plan.columns})
 
 @api_bp.route("/train", methods=["POST"])
 def train():
+    # symbol="*" (или universe=true) — все Config.SYMBOLS x timeframes одной задачей.
+    # priority: high | incremental | full; по умолчанию — по наличию модели у пары
     sv: Services = current_app.extensions["services"]
     body = request.get_json(force=True)
-    symbol = body["symbol"]
+    universe = bool(body.get("universe")) or body.get("symbol") == "*"
+    symbol = "*" if universe else body["symbol"]
+    symbols = (body.get("symbols") or Config.SYMBOLS) if universe else [symbol]
     timeframes = body.get("timeframes") or Config.TIMEFRAMES
     years = int(body.get("years", Config.HISTORY_YEARS))
-    job_id = sv.db.create_training_job(symbol, timeframes)
-    def task():
-        try:
-            sv.db.update_training_job(job_id, status="running", progress=0.0, message="started")
-            # убедиться, что история подгружена
-            for tf in timeframes:
-                sv.data.fetch_ohlcv_incremental(symbol, tf, years)
-            sv.models.train_symbol(symbol, timeframes, years, job_id=job_id)
-        except Exception as e:
-            sv.db.update_training_job(job_id, status="error", message=str(e))
-    sv.executor.submit(task)
-    return jsonify({"job_id": job_id, "status": "queued"})
+    # убедиться, что история подгружена (если эти пары уже синхронизируются — ждём ту задачу)
+    sync_id, sync_ids = sv.sync.submit(symbols, timeframes, years)
+    try:
+        job_id = sv.trainer.submit(symbols, timeframes, priority=body.get("priority"),
+                                   before=lambda: sv.sync.wait(sync_ids), label=symbol)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify({"job_id": job_id, "sync_jobs": sync_ids, "status": "queued"})
+
+@api_bp.route("/training", methods=["GET"])
+def training_jobs():
+    sv: Services = current_app.extensions["services"]
+    jobs = sv.db.list_training_jobs(status=request.args.get("status"), limit=int(request.args.get("limit", "50")))
+    return jsonify({"data": jobs, "queue": sv.trainer.stats()})
 
 @api_bp.route("/training/<int:job_id>", methods=["GET"])
 def training_status(job_id):
@@ -139,6 +240,56 @@ def training_status(job_id):
     if not job: return jsonify({"error":"not found"}),404
     return jsonify({"data": job})
 
+@api_bp.route("/training/<int:job_id>/cancel", methods=["POST"])
+def training_cancel(job_id):
+    sv: Services = current_app.extensions["services"]
+    if not sv.trainer.cancel(job_id):
+        return jsonify({"error": "job is not queued or running"}), 409
+    return jsonify({"status": "cancelled"})
+
+@api_bp.route("/predict_universe", methods=["GET"])
+def predict_universe():
+    # иерархический консенсус по всем символам одним вызовом (то же, что predict_hierarchical по каждому)
+    sv: Services = current_app.extensions["services"]
+    symbols = request.args.getlist("symbol") or Config.SYMBOLS
+    timeframes = request.args.getlist("timeframe") or Config.TIMEFRAMES
+    windows = {s: sv.bots.latest_windows(s, timeframes) for s in symbols}
+    return jsonify({"data": sv.models.predict_universe(timeframes, windows)})
+
+@api_bp.route("/backtest", methods=["POST"])
+def backtest_start():
+    # walk-forward прогон по сохранённой истории в фоне; параметры — backtest.DEFAULTS
+    sv: Services = current_app.extensions["services"]
+    body = request.get_json(force=True) or {}
+    symbols = body.get("symbols") or ([body["symbol"]] if body.get("symbol") else Config.SYMBOLS)
+    timeframes = body.get("timeframes") or Config.TIMEFRAMES
+    try:
+        years = float(body.get("years", Config.HISTORY_YEARS))
+        params = {k: (int if isinstance(v, int) else float)(body[k])
+                  for k, v in BACKTEST_DEFAULTS.items() if body.get(k) is not None}
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": str(e)}), 400
+    if any(v < 0 for v in params.values()) or params.get("hold_bars") == 0 or params.get("retrain_days") == 0:
+        return jsonify({"error": "backtest parameters must be positive"}), 400
+    run_id = sv.db.create_backtest_run(symbols, timeframes, dict(BACKTEST_DEFAULTS, **params, years=years))
+    sv.executor.submit(sv.backtester.run, symbols, timeframes, years, run_id, **params)
+    return jsonify({"run_id": run_id, "status": "queued"})
+
+@api_bp.route("/backtest", methods=["GET"])
+def backtest_runs():
+    sv: Services = current_app.extensions["services"]
+    return jsonify({"data": sv.db.list_backtest_runs(limit=int(request.args.get("limit", "50")))})
+
+@api_bp.route("/backtest/<int:run_id>", methods=["GET"])
+def backtest_status(run_id):
+    # прогон с метриками; сделки — ?symbol=..&limit=..
+    sv: Services = current_app.extensions["services"]
+    run = sv.db.get_backtest_run(run_id)
+    if not run: return jsonify({"error":"not found"}),404
+    run["trades"] = sv.db.get_backtest_trades(run_id, symbol=request.args.get("symbol"),
+                                              limit=int(request.args.get("limit", "1000")))
+    return jsonify({"data": run})
+
 @api_bp.route("/bots/start", methods=["POST"])
 def bots_start():
     sv: Services = current_app.extensions["services"]
@@ -185,4 +336,32 @@ def news():
     hours = int(request.args.get("hours","24"))
     since = datetime.utcnow() - timedelta(hours=hours)
     df = sv.db.news_since(since)
-    return jsonify({"data": df.to_dict(orient="records")})
\ No newline at end of file
+    return jsonify({"data": df.to_dict(orient="records")})
+
+@api_bp.route("/news/search", methods=["GET"])
+def news_search():
+    sv: Services = current_app.extensions["services"]
+    q = request.args.get("q", "").strip()
+    symbol = request.args.get("symbol") or None
+    hours = request.args.get("hours")
+    since = datetime.utcnow() - timedelta(hours=int(hours)) if hours else None
+    limit = min(int(request.args.get("limit", "200")), 1000)
+    df = sv.db.search_news(q, symbol=symbol, since_dt=since, limit=limit)
+    return jsonify({"data": df.to_dict(orient="records")})
+
+@api_bp.route("/db_stats", methods=["GET"])
+def db_stats():
+    sv: Services = current_app.extensions["services"]
+    data = {"pool": sv.db.pool_stats(), "schema": sv.db.candles_migration_status()}
+    if sv.db.ohlcv_cache is not None:
+        data["ohlcv_cache"] = sv.db.ohlcv_cache.stats()
+    data["models"] = sv.db.model_registry.stats()
+    if sv.db.writer is not None:
+        data["writer"] = sv.db.writer_stats()
+    data["training_queue"] = sv.trainer.stats()
+    data["predictions"] = sv.models.prediction_stats()
+    if sv.models.feature_store is not None:
+        data["feature_store"] = sv.models.feature_store.stats()
+    if sv.models.features is not None:
+        data["feature_stream"] = sv.models.features.stats()
+    return jsonify({"data": data})
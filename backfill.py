@@ -0,0 +1,189 @@
+import random
+import threading
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+import ccxt
+from config import Config
+
+logger = logging.getLogger("backfill")
+
+class TokenBucket:
+    # Общий бюджет "веса" запросов к бирже (Binance считает REQUEST_WEIGHT в минуту на IP).
+    # acquire() блокирует, пока не накопится нужный вес; penalize() — пауза для всех после 429/418.
+    def __init__(self, weight_per_min, capacity=None):
+        self.rate = weight_per_min / 60.0
+        self.capacity = float(capacity or max(1.0, self.rate))
+        self._tokens = self.capacity
+        self._last = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = threading.Lock()
+        self._stats = {"acquired": 0, "weight": 0, "wait_time_sec": 0.0, "penalties": 0}
+
+    def acquire(self, weight=1):
+        t0 = time.monotonic()
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if now < self._blocked_until:
+                    wait = self._blocked_until - now
+                elif self._tokens >= weight:
+                    self._tokens -= weight
+                    self._stats["acquired"] += 1
+                    self._stats["weight"] += weight
+                    self._stats["wait_time_sec"] += now - t0
+                    return now - t0
+                else:
+                    wait = (weight - self._tokens) / self.rate
+            time.sleep(wait)
+
+    def penalize(self, seconds):
+        with self._lock:
+            self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+            self._tokens = 0.0
+            self._stats["penalties"] += 1
+
+    def stats(self):
+        with self._lock:
+            out = dict(self._stats)
+        out.update(weight_per_min=self.rate * 60, capacity=self.capacity)
+        return out
+
+class BackfillJob:
+    def __init__(self, symbol, timeframe, since_ms, end_ms):
+        self.symbol = symbol
+        self.timeframe = timeframe
+        self.since_ms = since_ms
+        self.end_ms = end_ms
+        self.cursor_ms = since_ms
+        self.status = "queued"
+        self.pages = 0
+        self.candles = 0
+        self.retries = 0
+        self.error = None
+        self.started_at = None
+        self.finished_at = None
+
+    def progress(self):
+        if self.status == "done":
+            return 1.0
+        span = self.end_ms - self.since_ms
+        return min(1.0, max(0.0, (self.cursor_ms - self.since_ms) / span)) if span > 0 else 0.0
+
+    def as_dict(self):
+        elapsed = ((self.finished_at or time.time()) - self.started_at) if self.started_at else 0.0
+        return {
+            "symbol": self.symbol, "timeframe": self.timeframe, "status": self.status,
+            "progress": round(self.progress(), 4), "pages": self.pages, "candles": self.candles,
+            "retries": self.retries, "error": self.error, "elapsed_sec": round(elapsed, 3),
+        }
+
+class BackfillScheduler:
+    # Параллельная догрузка истории по многим (symbol, timeframe): все задачи делят один TokenBucket,
+    # повторы/бэкофф — здесь, а не в каждом цикле загрузки. Каждая страница коммитится сразу,
+    # поэтому прерванная догрузка продолжается с последней сохранённой свечи.
+    def __init__(self, data, exchange=None, concurrency=None, weight_per_min=None, burst=None, max_retries=None):
+        self.data = data
+        # встроенный троттлинг ccxt сериализует запросы — бюджетом управляет bucket
+        self.exchange = exchange or data.make_exchange(rate_limited=False)
+        self.concurrency = concurrency or Config.BACKFILL_CONCURRENCY
+        self.max_retries = Config.BACKFILL_MAX_RETRIES if max_retries is None else max_retries
+        self.bucket = TokenBucket(weight_per_min or Config.BACKFILL_WEIGHT_PER_MIN, burst or Config.BACKFILL_BURST)
+        self._lock = threading.Lock()
+        self._markets_loaded = False
+        self.jobs = {}  # (symbol, timeframe) -> BackfillJob последнего запуска
+
+    def run(self, pairs, years, on_progress=None):
+        # on_progress(jobs) вызывается после каждой сохранённой страницы (из потоков пула)
+        now_ms = int(time.time() * 1000)
+        return self._run_jobs([BackfillJob(symbol, timeframe, self.data.next_since_ms(symbol, timeframe, years), now_ms)
+                               for symbol, timeframe in pairs], on_progress)
+
+    def run_ranges(self, ranges):
+        # (symbol, timeframe, start_ms, end_ms): догрузка только указанных интервалов (ремонт дыр)
+        return self._run_jobs([BackfillJob(symbol, timeframe, start_ms, end_ms) for symbol, timeframe, start_ms, end_ms in ranges])
+
+    def _run_jobs(self, jobs, on_progress=None):
+        if not jobs:
+            return []
+        with self._lock:
+            for job in jobs:
+                self.jobs[(job.symbol, job.timeframe)] = job
+        t0 = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=max(1, min(self.concurrency, len(jobs))), thread_name_prefix="backfill") as ex:
+            notify = (lambda: on_progress(jobs)) if on_progress else None
+            list(ex.map(lambda job: self._run_job(job, notify), jobs))
+        logger.info("backfill of %d jobs done in %.1fs: %d candles", len(jobs), time.perf_counter() - t0,
+                    sum(j.candles for j in jobs))
+        return [j.as_dict() for j in jobs]
+
+    def status(self):
+        with self._lock:
+            jobs = list(self.jobs.values())
+        return {"jobs": [j.as_dict() for j in jobs], "bucket": self.bucket.stats()}
+
+    def _ensure_markets(self):
+        with self._lock:
+            if self._markets_loaded:
+                return
+            self._call(None, self.exchange.load_markets, weight=Config.BACKFILL_MARKETS_WEIGHT)
+            self._markets_loaded = True
+
+    def _run_job(self, job, notify=None):
+        job.status = "running"
+        job.started_at = time.time()
+        limit = Config.BACKFILL_PAGE_LIMIT
+        since_ms = job.since_ms
+        try:
+            self._ensure_markets()
+            market = self.data.exchange_symbol(job.symbol)
+            while since_ms < job.end_ms:
+                chunk = self._call(job, self.exchange.fetch_ohlcv, market, job.timeframe, since_ms, limit,
+                                   weight=Config.BACKFILL_KLINES_WEIGHT)
+                if not chunk:
+                    break
+                job.pages += 1
+                rows = [r for r in chunk if r[0] < job.end_ms]
+                if rows:
+                    df = self.data.page_to_frame(rows)
+                    self.data.db.upsert_ohlcv_bulk(job.symbol, job.timeframe, df, source="binance")
+                    job.candles += len(df)
+                since_ms = int(chunk[-1][0]) + self.data.tf_ms(job.timeframe)
+                job.cursor_ms = since_ms
+                if notify:
+                    notify()
+                if len(chunk) < limit:
+                    break
+            job.status = "done"
+        except Exception as e:
+            job.status = "error"
+            job.error = str(e)
+            logger.warning("backfill %s %s failed: %s", job.symbol, job.timeframe, e)
+        finally:
+            job.finished_at = time.time()
+        return job
+
+    def _call(self, job, fn, *args, weight=1):
+        delay = Config.BACKFILL_BACKOFF_SEC
+        attempt = 0
+        while True:
+            self.bucket.acquire(weight)
+            try:
+                return fn(*args)
+            except (ccxt.RateLimitExceeded, ccxt.DDoSProtection) as e:
+                # биржа считает, что бюджет превышен — тормозим всех, а не только этот поток
+                err, pause = e, 0.0
+                self.bucket.penalize(delay * 4)
+            except (ccxt.NetworkError, ccxt.ExchangeNotAvailable) as e:
+                err, pause = e, delay * (1 + random.random())
+            if attempt >= self.max_retries:
+                raise err
+            attempt += 1
+            if job is not None:
+                job.retries += 1
+            logger.debug("retry %d after %s (%.2fs)", attempt, type(err).__name__, pause)
+            if pause:
+                time.sleep(pause)
+            delay = min(delay * 2, 30.0)
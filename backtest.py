@@ -0,0 +1,278 @@
+import time
+import logging
+import numpy as np
+import pandas as pd
+from concurrent.futures import wait, FIRST_COMPLETED
+from config import Config
+from features import make_labels
+from indicators import compile_plan
+from ohlcv_resample import TF_TO_MS
+from ohlcv_store import index_to_ms
+from training_pool import fit_model, share_arrays, _attach
+
+logger = logging.getLogger("backtest")
+
+# Walk-forward бэктест: признаки (план индикаторов символа = build_features) и метки make_labels
+# считаются по всей истории одним проходом — оба причинные; модели (пайплайн ModelManager) обучаются на
+# первых train_days и дообучаются partial_fit каждые retrain_days только на строках, чьи метки уже известны
+# на границе. Предсказания сегмента между границами — один predict_proba. Консенсус иерархии и сделки
+# считаются по шкале самого мелкого ТФ: решение на закрытии его свечи, каждый ТФ — по последней закрытой
+# свече (без заглядывания вперёд), правила входа как у BotManager: consensus != 0 и confidence >= порога.
+
+HIERARCHY = ["1w", "1d", "4h", "1h", "15m"]
+DAY_MS = 86_400_000
+
+DEFAULTS = {
+    "train_days": 365,       # начальное обучение
+    "retrain_days": 7,       # период partial_fit
+    "hold_bars": 1,          # выход через hold_bars свечей мелкого ТФ (горизонт make_labels)
+    "threshold": None,       # None — Config.SIGNAL_THRESHOLD
+    "fee_bps": 0.0,          # комиссия за сторону, б.п.
+    "min_train_rows": 50,
+}
+
+def _tf_predictions(t_open, ohlc, tf, spec, cfg, start_ms, end_ms):
+    # -> (close_ms, pred, buy, sell, stats): предсказание модели для каждой свечи ТФ (NaN до первой модели)
+    close_ms = t_open + TF_TO_MS[tf]
+    n = len(t_open)
+    pred = np.full(n, np.nan)
+    buy = np.full(n, np.nan)
+    sell = np.full(n, np.nan)
+    stats = {"rows": int(n), "retrains": 0, "hits": 0, "scored": 0}
+    plan = compile_plan(spec)
+    X = plan.evaluate(*ohlc).T
+    y = make_labels(pd.DataFrame({"close": ohlc[3]})).to_numpy()
+    # метка строки i известна после закрытия свечи i + 1
+    label_ms = np.append(close_ms[1:], np.iinfo(np.int64).max)
+    step = cfg["retrain_days"] * DAY_MS
+    bounds = np.arange(start_ms, end_ms + step, step)
+    model = None
+    seen = 0
+    for k, b in enumerate(bounds[:-1]):
+        m = int(np.searchsorted(label_ms, b, side="right"))
+        if model is None:
+            if m < cfg["min_train_rows"]:
+                continue
+            model, _ = fit_model(X[:m], y[:m])
+        elif m > seen:
+            model, _ = fit_model(X[seen:m], y[seen:m], model)
+        else:
+            continue
+        seen = m
+        stats["retrains"] += 1
+        # строки, закрывшиеся в [b, следующая граница) — признаки известны, модель уже обучена
+        j0, j1 = np.searchsorted(close_ms, [b, bounds[k + 1]], side="left")
+        if j1 <= j0:
+            continue
+        pr = model.predict_proba(X[j0:j1])
+        cls = model.named_steps["clf"].classes_.tolist()
+        p_buy = pr[:, cls.index(1)] if 1 in cls else np.zeros(j1 - j0)
+        p_hold = pr[:, cls.index(0)] if 0 in cls else np.zeros(j1 - j0)
+        p_sell = pr[:, cls.index(-1)] if -1 in cls else np.zeros(j1 - j0)
+        # то же правило, что ModelManager._signal
+        seg = np.where((p_buy >= p_sell) & (p_buy >= p_hold), 1, np.where(p_sell > p_hold, -1, 0))
+        pred[j0:j1], buy[j0:j1], sell[j0:j1] = seg, p_buy, p_sell
+        scored = label_ms[j0:j1] <= end_ms
+        stats["scored"] += int(scored.sum())
+        stats["hits"] += int((seg[scored] == y[j0:j1][scored]).sum())
+    return close_ms, pred, buy, sell, stats
+
+def simulate_symbol(symbol, frames, spec, cfg):
+    # frames: {tf: (open_ms (n,), ohlc (4, n))} -> (сделки, метрики). Чистая функция — работает и в процессе пула
+    cfg = dict(DEFAULTS, **{k: v for k, v in cfg.items() if v is not None})
+    threshold = Config.SIGNAL_THRESHOLD if cfg["threshold"] is None else cfg["threshold"]
+    tfs = [tf for tf in HIERARCHY if tf in frames]
+    base = min(frames, key=lambda tf: TF_TO_MS[tf])
+    b_open, b_ohlc = frames[base]
+    b_close_ms = b_open + TF_TO_MS[base]
+    start_ms = int(min(frames[tf][0][0] for tf in frames)) + cfg["train_days"] * DAY_MS
+    end_ms = int(b_close_ms[-1])
+    t0 = time.perf_counter()
+    per_tf = {tf: _tf_predictions(*frames[tf], tf, spec, cfg, start_ms, end_ms) for tf in frames}
+    t_models = time.perf_counter() - t0
+
+    # консенсус на закрытии каждой свечи мелкого ТФ
+    dec = np.nonzero(b_close_ms >= start_ms)[0]
+    t = b_close_ms[dec]
+    final = np.zeros(len(dec), dtype=int)
+    conf = np.zeros(len(dec))
+    if tfs and len(dec):
+        P = np.full((len(dec), len(tfs)), np.nan)
+        C = np.zeros((len(dec), len(tfs)))
+        for j, tf in enumerate(tfs):
+            close_ms, pred, buy, sell = per_tf[tf][:4]
+            idx = np.searchsorted(close_ms, t, side="right") - 1
+            ok = idx >= 0
+            P[ok, j] = pred[idx[ok]]
+            C[ok, j] = np.maximum(buy[idx[ok]], sell[idx[ok]])
+        agree = ~np.isnan(P).any(axis=1) & (P == P[:, :1]).all(axis=1)
+        final = np.where(agree, np.nan_to_num(P[:, 0]), 0).astype(int)
+        conf = np.where(agree, C.mean(axis=1), 0.0)
+
+    # сделки: вход на закрытии, выход через hold_bars свечей, объём 10 USDT как у бота; пока позиция открыта,
+    # новых сигналов нет
+    hold = cfg["hold_bars"]
+    closes = b_ohlc[3]
+    fee = cfg["fee_bps"] / 10_000 * 100 * 2
+    signal = np.nonzero((final != 0) & (conf >= threshold) & (dec + hold < len(closes)))[0]
+    trades = []
+    next_free = -1
+    for s in signal.tolist():
+        i = int(dec[s])
+        if i < next_free:
+            continue
+        entry, exit_ = float(closes[i]), float(closes[i + hold])
+        side = "BUY" if final[s] == 1 else "SELL"
+        pnl = ((exit_ - entry) if side == "BUY" else (entry - exit_)) / entry * 100.0 - fee
+        trades.append((side, int(b_close_ms[i]), int(b_close_ms[i + hold]), entry, exit_, 10.0 / entry, pnl, float(conf[s])))
+        next_free = i + hold
+
+    scored = sum(v[4]["scored"] for v in per_tf.values())
+    metrics = summarize([tr[6] for tr in trades], start_ms, end_ms)
+    metrics.update({
+        "bars": int(len(dec)),
+        "accuracy": sum(v[4]["hits"] for v in per_tf.values()) / scored if scored else None,
+        "retrains": int(sum(v[4]["retrains"] for v in per_tf.values())),
+        "model_sec": round(t_models, 3),
+        "sim_sec": round(time.perf_counter() - t0 - t_models, 3),
+    })
+    return trades, metrics
+
+def summarize(pnl, start_ms, end_ms):
+    # PnL сделок (%, в порядке выхода) -> метрики; просадка — по кривой суммы PnL, Sharpe — годовой по сделкам
+    pnl = np.asarray(pnl, dtype="float64")
+    equity = np.concatenate([[0.0], np.cumsum(pnl)])
+    years = max((end_ms - start_ms) / (365 * DAY_MS), 1e-9)
+    sd = pnl.std() if len(pnl) > 1 else 0.0
+    return {
+        "trades": int(len(pnl)),
+        "wins": int((pnl > 0).sum()),
+        "win_rate": float((pnl > 0).mean()) if len(pnl) else None,
+        "pnl_percent": float(pnl.sum()),
+        "avg_pnl_percent": float(pnl.mean()) if len(pnl) else None,
+        "max_drawdown": float((np.maximum.accumulate(equity) - equity).max()),
+        "sharpe": float(pnl.mean() / sd * np.sqrt(len(pnl) / years)) if sd > 0 else None,
+        "start_ms": int(start_ms),
+        "end_ms": int(end_ms),
+    }
+
+def simulate_shared(desc, symbol, timeframes, spec, cfg):
+    # точка входа процесса пула: свечи читаются из shared memory родителя
+    shm, arrs = _attach(desc)
+    try:
+        frames = {tf: (arrs[f"{tf}_t"], arrs[f"{tf}_ohlc"]) for tf in timeframes}
+        return simulate_symbol(symbol, frames, spec, cfg)
+    finally:
+        frames = arrs = None
+        shm.close()
+
+class Backtester:
+    # Прогон по символам: свечи грузит родитель, симуляция символа — в пуле процессов (models.train_pool)
+    # или в текущем потоке, результаты пишет только родитель (backtest_trades / backtest_metrics)
+    def __init__(self, db, models):
+        self.db = db
+        self.models = models
+
+    def _frames(self, symbol, timeframes, years):
+        since = pd.Timestamp.utcnow().tz_localize(None) - pd.DateOffset(years=years) if years else None
+        frames = {}
+        for tf in timeframes:
+            df = self.db.load_ohlcv(symbol, tf, since=since)
+            if df is None or df.empty:
+                continue
+            ohlc = np.vstack([df[k].to_numpy(dtype="float64") for k in ("open", "high", "low", "close")])
+            frames[tf] = (index_to_ms(df.index).astype(np.int64), ohlc)
+        return frames
+
+    def run(self, symbols, timeframes, years=None, run_id=None, inline=False, **cfg):
+        # -> run_id; cfg — параметры DEFAULTS, years=0 — вся история, inline=True — без пула процессов
+        years = Config.HISTORY_YEARS if years is None else years
+        params = dict(DEFAULTS, **{k: v for k, v in cfg.items() if v is not None}, years=years)
+        if run_id is None:
+            run_id = self.db.create_backtest_run(symbols, timeframes, params)
+        self.db.update_backtest_run(run_id, status="running")
+        pool = self.models.train_pool
+        use_pool = not inline and pool.processes > 1 and len(symbols) > 1
+        t0 = time.perf_counter()
+        totals = {"pnl": [], "start_ms": [], "end_ms": [], "bars": 0, "retrains": 0, "symbols": 0, "errors": []}
+
+        def record(symbol, trades, metrics):
+            self.db.save_backtest_results(run_id, symbol, trades, metrics)
+            totals["pnl"] += [(tr[2], tr[6]) for tr in trades]
+            totals["start_ms"].append(metrics["start_ms"])
+            totals["end_ms"].append(metrics["end_ms"])
+            totals["bars"] += metrics["bars"]
+            totals["retrains"] += metrics["retrains"]
+            totals["symbols"] += 1
+            logger.info("backtest %s %s: %d trades, pnl %.2f%%", run_id, symbol, metrics["trades"], metrics["pnl_percent"])
+
+        inflight = {}
+        try:
+            ex = pool.executor() if use_pool else None
+            for symbol in symbols:
+                frames = self._frames(symbol, timeframes, years)
+                if not frames:
+                    totals["errors"].append(f"{symbol}: no data")
+                    continue
+                spec = self.models.plan(symbol).spec
+                if ex is None:
+                    try:
+                        record(symbol, *simulate_symbol(symbol, frames, spec, params))
+                    except Exception as e:
+                        logger.exception("backtest %s %s failed", run_id, symbol)
+                        totals["errors"].append(f"{symbol}: {e}")
+                    continue
+                arrays = {}
+                for tf, (t, ohlc) in frames.items():
+                    arrays[f"{tf}_t"], arrays[f"{tf}_ohlc"] = t, ohlc
+                shm, desc = share_arrays(**arrays)
+                try:
+                    inflight[ex.submit(simulate_shared, desc, symbol, list(frames), spec, params)] = (symbol, shm)
+                except Exception:
+                    shm.close()
+                    shm.unlink()
+                    raise
+                # не больше 2 x processes символов в памяти: свечи следующих грузятся, пока считаются эти
+                while len(inflight) >= 2 * pool.processes:
+                    self._collect(inflight, wait(inflight, return_when=FIRST_COMPLETED).done, record, totals)
+            while inflight:
+                self._collect(inflight, wait(inflight, return_when=FIRST_COMPLETED).done, record, totals)
+        except Exception as e:
+            logger.exception("backtest %s failed", run_id)
+            self.db.update_backtest_run(run_id, status="error", message=str(e), duration_sec=round(time.perf_counter() - t0, 3))
+            raise
+        finally:
+            # при ошибке: ждущие символы снимаем, уже считающиеся дожидаемся — процесс держит сегмент открытым;
+            # сегменты освобождаем все. Пул общий с обучением (models.train_pool) — его не останавливаем
+            for fut in inflight:
+                fut.cancel()
+            wait(inflight)
+            for symbol, shm in inflight.values():
+                shm.close()
+                shm.unlink()
+        if totals["symbols"]:
+            # итог по всем символам: сделки в порядке выхода, как одна кривая PnL
+            pnl = [p for _, p in sorted(totals["pnl"])]
+            total = summarize(pnl, min(totals["start_ms"]), max(totals["end_ms"]))
+            total.update(bars=totals["bars"], retrains=totals["retrains"], symbols=totals["symbols"])
+            self.db.save_backtest_results(run_id, "*", [], total)
+            message = f"{totals['symbols']} symbols, {total['trades']} trades, pnl {total['pnl_percent']:.2f}%"
+        else:
+            message = "no symbols simulated"
+        if totals["errors"]:
+            message += "; failed: " + "; ".join(totals["errors"])
+        self.db.update_backtest_run(run_id, status="finished" if totals["symbols"] else "error",
+                                    message=message, duration_sec=round(time.perf_counter() - t0, 3))
+        return run_id
+
+    def _collect(self, inflight, done, record, totals):
+        for fut in done:
+            symbol, shm = inflight.pop(fut)
+            try:
+                record(symbol, *fut.result())
+            except Exception as e:
+                logger.exception("backtest %s failed", symbol)
+                totals["errors"].append(f"{symbol}: {e}")
+            finally:
+                shm.close()
+                shm.unlink()
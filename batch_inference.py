@@ -0,0 +1,65 @@
+import threading
+import numpy as np
+from scipy.special import expit
+
+# Пакетный инференс для моделей StandardScaler + SGDClassifier(log_loss): из каждой модели берутся
+# mean_/scale_/coef_/intercept_, строки признаков всех (symbol, timeframe) складываются в одну матрицу,
+# вероятности считаются несколькими операциями NumPy — как Pipeline.predict_proba (OvR: expit,
+# затем нормировка строки), но без прохода sklearn на каждую строку.
+
+class LinearParams:
+    def __init__(self, mean, scale, coef, intercept, classes):
+        self.mean = mean
+        self.scale = scale
+        self.coef = coef              # (K, F); K=1 у бинарной модели
+        self.intercept = intercept    # (K,)
+        self.classes = classes
+
+def linear_params(model):
+    # -> LinearParams или None, если модель не scaler + линейный классификатор с вероятностями
+    steps = getattr(model, "named_steps", None)
+    if not steps or set(steps) != {"scaler", "clf"}:
+        return None
+    scaler, clf = steps["scaler"], steps["clf"]
+    if getattr(clf, "loss", None) != "log_loss" or not hasattr(clf, "coef_"):
+        return None
+    F = clf.coef_.shape[1]
+    mean = scaler.mean_ if getattr(scaler, "with_mean", True) and scaler.mean_ is not None else np.zeros(F)
+    scale = scaler.scale_ if getattr(scaler, "with_std", True) and scaler.scale_ is not None else np.ones(F)
+    return LinearParams(np.asarray(mean, dtype="float64"), np.asarray(scale, dtype="float64"),
+                        np.asarray(clf.coef_, dtype="float64"), np.asarray(clf.intercept_, dtype="float64"),
+                        np.asarray(clf.classes_))
+
+def predict_proba_batch(X, params):
+    # X: (n, F) — по строке на модель, params: n LinearParams с одинаковыми F и K -> (n, число классов)
+    mean = np.stack([p.mean for p in params])
+    scale = np.stack([p.scale for p in params])
+    coef = np.stack([p.coef for p in params])
+    intercept = np.stack([p.intercept for p in params])
+    Z = (X - mean) / scale
+    prob = expit(np.einsum("nf,nkf->nk", Z, coef) + intercept)
+    if prob.shape[1] == 1:
+        return np.hstack([1 - prob, prob])
+    prob_sum = prob.sum(axis=1)
+    all_zero = prob_sum == 0
+    if all_zero.any():
+        prob[all_zero, :] = 1
+        prob_sum[all_zero] = prob.shape[1]
+    return prob / prob_sum[:, None]
+
+class LinearParamsCache:
+    # (symbol, timeframe) -> (версия модели, LinearParams); перечитывается при смене models.version
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}
+
+    def get(self, symbol, timeframe, meta):
+        key = (symbol, timeframe)
+        with self._lock:
+            cached = self._entries.get(key)
+        if cached and cached[0] == meta["version"]:
+            return cached[1]
+        params = linear_params(meta["model"])
+        with self._lock:
+            self._entries[key] = (meta["version"], params)
+        return params
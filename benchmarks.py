@@ -0,0 +1,812 @@
+import argparse
+import os
+import sqlite3
+import shutil
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from config import Config
+from database import DatabaseManager
+from backfill import BackfillScheduler
+from data_manager import CCXTDataManager, TF_TO_MS
+from fake_exchange import FakeExchange, AsyncFakeExchange, FakeKlineServer
+from websocket_manager import WebsocketManager
+from ohlcv_store import ColumnarOHLCVStore, migrate_from_sqlite
+from features import build_features, make_labels
+from features_np import build_features_np, build_features_panel
+from indicators import INDICATORS, compile_plan, plan_for
+from features_stream import FeatureStream, stream_features
+from feature_store import FeatureStore
+from model_manager import ModelManager
+from training_pool import TrainingPool, fit_model
+from training_scheduler import TrainingScheduler
+from batch_inference import predict_proba_batch
+from ohlcv_resample import resample_ohlcv
+from backtest import Backtester, simulate_symbol, HIERARCHY
+
+# Локальные бенчмарки слоёв хранения/обработки. Запуск: python benchmarks.py <name> [опции]
+
+def synthetic_ohlcv(rows, freq="15min", start="2021-01-01", seed=42):
+    rng = np.random.default_rng(seed)
+    idx = pd.date_range(start, periods=rows, freq=freq, name="open_time")
+    close = 30000.0 * np.exp(np.cumsum(rng.normal(0, 0.002, rows)))
+    open_ = np.concatenate([[close[0]], close[:-1]])
+    spread = np.abs(rng.normal(0, 0.001, rows)) * close
+    high = np.maximum(open_, close) + spread
+    low = np.minimum(open_, close) - spread
+    volume = rng.uniform(1, 100, rows)
+    return pd.DataFrame({"open": open_, "high": high, "low": low, "close": close, "volume": volume}, index=idx)
+
+def bench_upsert(rows, symbols):
+    tmp = tempfile.mkdtemp(prefix="bench_upsert_")
+    try:
+        frames = {f"SYM{i}/USDT": synthetic_ohlcv(rows, seed=i) for i in range(symbols)}
+        total = rows * symbols
+        for mode in ("rowwise", "bulk"):
+            db = DatabaseManager(os.path.join(tmp, f"{mode}.db"))
+            fn = db.upsert_ohlcv if mode == "rowwise" else db.upsert_ohlcv_bulk
+            # 1) холодная загрузка, 2) повтор тех же данных (все строки unchanged)
+            for phase in ("insert", "repeat"):
+                t0 = time.perf_counter()
+                last = None
+                for sym, df in frames.items():
+                    last = fn(sym, "15m", df)
+                dt = time.perf_counter() - t0
+                print(f"{mode:8s} {phase:7s} {total:>9d} rows  {dt:8.2f}s  {total/dt:>12,.0f} rows/sec  last={last}")
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+def bench_read(rows, repeats):
+    tmp = tempfile.mkdtemp(prefix="bench_read_")
+    try:
+        db = DatabaseManager(os.path.join(tmp, "read.db"))
+        df = synthetic_ohlcv(rows)
+        db.upsert_ohlcv_bulk("BTC/USDT", "15m", df)
+        store = ColumnarOHLCVStore(os.path.join(tmp, "columnar"))
+        _, dt = _timed(migrate_from_sqlite, db, store)
+        print(f"migrate {rows} rows: {dt:.2f}s")
+        since = df.index[len(df) - 17_280].to_pydatetime()  # ~полгода 15m
+        cases = [("full", {}), ("since 6m", {"since": since}), ("since+limit 1000", {"since": since, "limit": 1000})]
+        for name, kw in cases:
+            ref = db.load_ohlcv_sqlite("BTC/USDT", "15m", **kw)
+            got = store.read("BTC/USDT", "15m", **kw)
+            pd.testing.assert_frame_equal(ref, got)
+            t_sql = min(_timed(db.load_ohlcv_sqlite, "BTC/USDT", "15m", **kw)[1] for _ in range(repeats))
+            t_col = min(_timed(store.read, "BTC/USDT", "15m", **kw)[1] for _ in range(repeats))
+            print(f"{name:18s} rows={len(ref):>7d}  sqlite {t_sql*1000:9.2f} ms  columnar {t_col*1000:8.3f} ms  x{t_sql/max(t_col, 1e-9):,.0f}")
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+LEGACY_SCHEMA = """
+CREATE TABLE historical_data (
+    id INTEGER PRIMARY KEY AUTOINCREMENT, symbol TEXT NOT NULL, timeframe TEXT NOT NULL, open_time DATETIME NOT NULL,
+    open REAL NOT NULL, high REAL NOT NULL, low REAL NOT NULL, close REAL NOT NULL, volume REAL NOT NULL,
+    source TEXT DEFAULT 'binance', UNIQUE(symbol, timeframe, open_time)
+);
+CREATE INDEX idx_hist_sym_tf_time ON historical_data(symbol,timeframe,open_time);
+"""
+
+def bench_schema(rows, symbols, repeats):
+    # historical_data (текстовые даты + rowid + 2 индекса) против candles WITHOUT ROWID
+    tmp = tempfile.mkdtemp(prefix="bench_schema_")
+    try:
+        path = os.path.join(tmp, "schema.db")
+        conn = sqlite3.connect(path)
+        conn.executescript(LEGACY_SCHEMA)
+        for i in range(symbols):
+            df = synthetic_ohlcv(rows, seed=i)
+            times = df.index.strftime("%Y-%m-%d %H:%M:%S").tolist()
+            conn.executemany(
+                "INSERT INTO historical_data(symbol,timeframe,open_time,open,high,low,close,volume) VALUES(?,?,?,?,?,?,?,?)",
+                [(f"SYM{i}/USDT", "15m", t, *v) for t, v in zip(times, df.to_numpy().tolist())])
+        conn.commit()
+        conn.execute("VACUUM")
+        conn.close()
+        since = (pd.Timestamp("2021-01-01") + pd.Timedelta(minutes=15 * (rows - 17_280))).to_pydatetime()
+
+        def measure(label):
+            db = DatabaseManager(path)
+            size = os.path.getsize(path) / 2**20
+            t_scan = min(_timed(db.load_ohlcv_sqlite, "SYM0/USDT", "15m", since=since)[1] for _ in range(repeats))
+            t_full = min(_timed(db.load_ohlcv_sqlite, "SYM0/USDT", "15m")[1] for _ in range(repeats))
+            t_last = min(_timed(db.get_last_ohlcv_time, "SYM0/USDT", "15m")[1] for _ in range(repeats * 20))
+            print(f"{label:14s} size {size:8.1f} MiB  scan 6m {t_scan*1000:7.1f} ms  full {t_full*1000:7.1f} ms  last_time {t_last*1e6:7.1f} us")
+            return db
+
+        db = measure("historical_data")
+        _, dt = _timed(db.run_candles_migration, pause_sec=0, vacuum=True)
+        print(f"online migration of {rows * symbols} rows: {dt:.2f}s")
+        db.close()
+        measure("candles")
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+def bench_writes(ops, threads):
+    # поток мелких мутаций (сделка + закрытие + статус бота) из нескольких потоков: транзакция на вызов против write-behind
+    tmp = tempfile.mkdtemp(prefix="bench_writes_")
+    saved = Config.DB_WRITE_BEHIND
+    try:
+        for mode in ("direct", "write-behind"):
+            Config.DB_WRITE_BEHIND = mode == "write-behind"
+            db = DatabaseManager(os.path.join(tmp, f"{mode}.db"))
+            for i in range(threads):
+                db.add_bot(f"SYM{i}/USDT", "active", stats={})
+
+            def worker(i):
+                sym = f"SYM{i}/USDT"
+                for k in range(ops // threads):
+                    tid = db.add_trade(sym, "BUY", 100.0, 0.1, datetime.utcnow())
+                    db.close_trade(tid, 101.0 + k % 3 - 1, 1.0 - k % 3, datetime.utcnow())
+                    db.update_bot(sym, stats={"trades": k + 1})
+
+            t0 = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=threads) as ex:
+                list(ex.map(worker, range(threads)))
+            t_submit = time.perf_counter() - t0
+            db.flush_writes()
+            dt = time.perf_counter() - t0
+            total = (ops // threads) * threads * 3
+            summary = db.account_summary("testnet")
+            print(f"{mode:12s} {total:>8d} writes  {dt:7.2f}s  {total/dt:>10,.0f} writes/sec  callers blocked {t_submit:6.2f}s  "
+                  f"closed={summary['closed_trades']} batches={(db.writer_stats() or {}).get('batches', '-')}")
+            db.close()
+    finally:
+        Config.DB_WRITE_BEHIND = saved
+        shutil.rmtree(tmp, ignore_errors=True)
+
+NEWS_WORDS = ("market price traders analysts report week exchange token network update launch fund investors "
+              "regulator court data volume rally drop record outflows inflows upgrade protocol wallet").split()
+
+def synthetic_news(n, seed=7, start="2020-01-01"):
+    # частоты: "ETF" ~5% статей, "SOL" ~0.5%, "Cardano" ~0.05%; остальное — общий словарь
+    rng = np.random.default_rng(seed)
+    words = np.array(NEWS_WORDS)
+    title_w = rng.integers(0, len(words), (n, 8))
+    summary_w = rng.integers(0, len(words), (n, 30))
+    tag = rng.random(n)
+    published = pd.date_range(start, periods=n, freq="3min").to_pydatetime()
+    rows = []
+    for i in range(n):
+        title = " ".join(words[title_w[i]])
+        if tag[i] < 0.05:
+            title = "ETF " + title
+        elif tag[i] < 0.055:
+            title = "SOL " + title
+        elif tag[i] < 0.0555:
+            title = "Cardano " + title
+        rows.append(("bench", title, f"https://news.local/{i}", published[i], " ".join(words[summary_w[i]]), 0.0, ""))
+    return rows
+
+def bench_news(articles, repeats):
+    tmp = tempfile.mkdtemp(prefix="bench_news_")
+    try:
+        path = os.path.join(tmp, "news.db")
+        db = DatabaseManager(path)
+        rows = synthetic_news(articles)
+        single = rows[:2000]
+        _, t_single = _timed(lambda: [db.add_news(*r) for r in single])
+        print(f"add_news one-by-one  {len(single):>8d} articles  {len(single)/t_single:>9,.0f} rows/sec")
+        t0 = time.perf_counter()
+        for i in range(len(single), len(rows), 5000):
+            db.add_news_batch(rows[i:i + 5000])
+        dt = time.perf_counter() - t0
+        n = len(rows) - len(single)
+        print(f"add_news_batch       {n:>8d} articles  {n/dt:>9,.0f} rows/sec (FTS triggers included)")
+
+        conn = sqlite3.connect(path)
+        def like_scan(terms, limit=200):
+            sql = "SELECT title FROM news WHERE 1" + " AND (title LIKE ? OR summary LIKE ?)" * len(terms)
+            params = [p for t in terms for p in (f"%{t}%", f"%{t}%")]
+            return conn.execute(sql + " ORDER BY published_at DESC LIMIT ?", params + [limit]).fetchall()
+        cases = [("ETF", None), (None, "SOL/USDT"), ("Cardano", None), ("ETF record", None), ("halving", None)]
+        for q, sym in cases:
+            terms = (q or "").split() + ([sym.split("/")[0]] if sym else [])
+            got = len(db.search_news(q, symbol=sym))
+            t_fts = min(_timed(db.search_news, q, symbol=sym)[1] for _ in range(repeats))
+            t_like = min(_timed(like_scan, terms)[1] for _ in range(repeats))
+            print(f"{' '.join(terms):12s} rows={got:>4d}  fts {t_fts*1000:8.2f} ms  LIKE scan {t_like*1000:9.2f} ms")
+        since = rows[-480][3]
+        t_since = min(_timed(db.news_since, since)[1] for _ in range(repeats))
+        print(f"news_since last 24h: {t_since*1000:.2f} ms")
+        conn.close()
+        db.close()
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+def _fake(latency, weight_per_min=6000, **kwargs):
+    # синтетика без случайных ошибок — прогоны воспроизводимы независимо от FAKE_EXCHANGE_* в окружении
+    return FakeExchange(latency, weight_per_min=weight_per_min, error_rate=0, source="synthetic", **kwargs)
+
+def _async_fake(latency, weight_per_min=6000, **kwargs):
+    return AsyncFakeExchange(latency, weight_per_min=weight_per_min, error_rate=0, source="synthetic", **kwargs)
+
+def bench_backfill(symbols, years, latency, budgets):
+    tfs = ["15m", "1h", "4h", "1d", "1w"]
+    tmp = tempfile.mkdtemp(prefix="bench_backfill_")
+    try:
+        pairs = [(f"SYM{i}/USDT", tf) for i in range(symbols) for tf in tfs]
+        db = DatabaseManager(os.path.join(tmp, "serial.db"))
+        data = CCXTDataManager(db)
+        data.exchange = _fake(latency)
+        t0 = time.perf_counter()
+        for sym, tf in pairs:
+            data.fetch_ohlcv_incremental(sym, tf, years)
+        dt = time.perf_counter() - t0
+        print(f"serial fetch_ohlcv_incremental  jobs={len(pairs):3d} pages={data.exchange.calls:4d}  {dt:7.2f}s")
+        db.close()
+        for budget in budgets:
+            for n in (max(1, symbols // 3), symbols):
+                db = DatabaseManager(os.path.join(tmp, f"sched_{budget}_{n}.db"))
+                data = CCXTDataManager(db)
+                fake = _fake(latency, weight_per_min=budget)
+                sched = BackfillScheduler(data, exchange=fake, concurrency=16, weight_per_min=budget * 0.9, burst=20)
+                jobs = [p for p in pairs if int(p[0][3:].split("/")[0]) < n]
+                t0 = time.perf_counter()
+                res = sched.run(jobs, years)
+                dt = time.perf_counter() - t0
+                ideal = fake.calls * fake.klines_weight / (budget * 0.9 / 60)
+                print(f"scheduler budget={budget:5d}/min jobs={len(jobs):3d} pages={fake.calls:4d}  {dt:7.2f}s  "
+                      f"(budget bound {ideal:5.2f}s) 429s={fake.rejected} failed={sum(r['status'] != 'done' for r in res)}")
+                db.close()
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+def bench_derive(symbols, years, latency, budget):
+    # полная синхронизация 5 TF: всё по REST против базового 15m + локальное построение старших TF
+    tfs = ["15m", "1h", "4h", "1d", "1w"]
+    tmp = tempfile.mkdtemp(prefix="bench_derive_")
+    saved = Config.DERIVE_TIMEFRAMES
+    try:
+        syms = [f"SYM{i}/USDT" for i in range(symbols)]
+        for derive in (False, True):
+            Config.DERIVE_TIMEFRAMES = derive
+            db = DatabaseManager(os.path.join(tmp, f"derive_{derive}.db"))
+            data = CCXTDataManager(db)
+            fake = _fake(latency, weight_per_min=budget)
+            data._scheduler = BackfillScheduler(data, exchange=fake, concurrency=16, weight_per_min=budget * 0.9, burst=20)
+            t0 = time.perf_counter()
+            data.sync_history(syms, tfs, years)
+            dt = time.perf_counter() - t0
+            _, t_incr = _timed(data.derive_timeframes, syms[0], tfs[1:])
+            label = "15m + derived" if derive else "all TF via REST"
+            print(f"{label:16s} REST pages={fake.calls:4d}  wall {dt:6.2f}s  incremental derive of 4 TF {t_incr*1000:6.1f} ms")
+            db.close()
+    finally:
+        Config.DERIVE_TIMEFRAMES = saved
+        shutil.rmtree(tmp, ignore_errors=True)
+
+def bench_stream(years, latency):
+    # пиковая память и время: накопить всю историю и записать в конце (старый путь) против потоковой записи
+    tmp = tempfile.mkdtemp(prefix="bench_stream_")
+    try:
+        db = DatabaseManager(os.path.join(tmp, "accumulate.db"))
+        data = CCXTDataManager(db)
+        fake = _fake(latency, weight_per_min=10**9)
+        tracemalloc.start()
+        t0 = time.perf_counter()
+        since, frames = data.next_since_ms("BTC/USDT", "15m", years), []
+        while True:
+            chunk = fake.fetch_ohlcv("BTCUSDT", "15m", since, 1000)
+            if not chunk:
+                break
+            frames.append(data.page_to_frame(chunk))
+            since = chunk[-1][0] + TF_TO_MS["15m"]
+            if len(chunk) < 1000:
+                break
+        db.upsert_ohlcv_bulk("BTC/USDT", "15m", pd.concat(frames))
+        dt = time.perf_counter() - t0
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        print(f"accumulate+write  pages={fake.calls:4d}  {dt:6.2f}s  peak {peak / 2**20:7.1f} MiB")
+        db.close()
+
+        db = DatabaseManager(os.path.join(tmp, "stream.db"))
+        data = CCXTDataManager(db)
+        data.async_exchange = _async_fake(latency, weight_per_min=10**9)
+        tracemalloc.start()
+        t0 = time.perf_counter()
+        n = data.fetch_ohlcv_incremental("BTC/USDT", "15m", years)
+        dt = time.perf_counter() - t0
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        print(f"streaming         pages={data.async_exchange.calls:4d}  {dt:6.2f}s  peak {peak / 2**20:7.1f} MiB  candles={n}")
+        db.close()
+
+        # обрыв на середине и повторный запуск: докачивается только остаток
+        db = DatabaseManager(os.path.join(tmp, "resume.db"))
+        data = CCXTDataManager(db)
+        data.async_exchange = _async_fake(latency, weight_per_min=10**9, fail_after=40)
+        first = data.fetch_ohlcv_incremental("BTC/USDT", "15m", years)
+        data.async_exchange = _async_fake(latency, weight_per_min=10**9)
+        second = data.fetch_ohlcv_incremental("BTC/USDT", "15m", years)
+        print(f"resume: before crash {first} candles, after restart {second} candles in {data.async_exchange.calls} pages")
+        db.close()
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+def bench_ws(symbols, timeframes, speed, seconds, port):
+    # WebsocketManager против локального kline-сервера: сколько закрытых свечей в секунду разбирается и доезжает до кэша
+    server = FakeKlineServer(port=port, speed=speed, tick_sec=0.1).start_in_thread()
+    names = [f"S{i:04d}/USDT" for i in range(symbols)]
+    ws = WebsocketManager(cache_max=10**6, url=server.url)
+    try:
+        ws.start()
+        ws.subscribe(names, timeframes)
+        t0 = time.perf_counter()
+        while not server.connections and time.perf_counter() - t0 < 10:
+            time.sleep(0.05)
+        sent0, t0 = server.sent, time.perf_counter()
+        time.sleep(seconds)
+        dt = time.perf_counter() - t0
+        sent = server.sent - sent0
+        cached = sum(len(d) for d in list(ws._cache.values()))
+        filled = sum(1 for s in names for tf in timeframes if ws._cache.get((s, tf)))
+        _, t_read = _timed(lambda: [ws.get_live_candles(s, timeframes[0], 200) for s in names[:100]])
+        print(f"streams={symbols * len(timeframes)} speed x{speed:g}: sent {sent / dt:8.0f} msg/s, "
+              f"cached {cached} candles, streams filled {filled}/{symbols * len(timeframes)}, "
+              f"get_live_candles x100 {t_read * 1000:.1f} ms")
+    finally:
+        ws.stop()
+        server.stop()
+
+def bench_features(rows, window, ticks):
+    # тик бота: окно последних window свечей, пришла одна новая; build_features по окну против FeatureStream
+    df = synthetic_ohlcv(rows)
+    full_ref, t_full = _timed(build_features, df)
+    full_stream, t_stream_full = _timed(stream_features, df)
+    err = float(((full_ref - full_stream).abs() / (full_ref.abs() + 1.0)).to_numpy().max())
+    print(f"full history {rows} rows: build_features {t_full * 1000:7.1f} ms, stream {t_stream_full * 1000:7.1f} ms, "
+          f"max rel diff {err:.1e}")
+    ends = range(rows - ticks, rows)
+    windows = [df.iloc[e - window:e] for e in ends]
+    ref, t_ref = _timed(lambda: [build_features(w).values[-1:] for w in windows])
+    fs = FeatureStream()
+    fs.latest("X", "15m", df.iloc[ends[0] - window - 1:ends[0] - 1])  # состояние прогрето первым окном
+    got, t_inc = _timed(lambda: [fs.latest("X", "15m", w) for w in windows])
+    err = max(float(np.max(np.abs(a - b) / (np.abs(b) + 1.0))) for a, b in zip(got, ref))
+    print(f"per tick (window={window}): build_features {t_ref / ticks * 1e6:8.1f} us, "
+          f"FeatureStream {t_inc / ticks * 1e6:7.1f} us  x{t_ref / t_inc:5.1f}  max rel diff {err:.1e}  {fs.stats()}")
+
+def bench_featstore(rows, new_rows, repeats):
+    # признаки для обучения после прихода new_rows свечей: build_features по всей истории против FeatureStore
+    df = synthetic_ohlcv(rows + new_rows * repeats)
+    tmp = tempfile.mkdtemp(prefix="featstore_")
+    try:
+        store = FeatureStore(None, base_dir=tmp)
+        _, t_first = _timed(store.features, "X", "15m", df.iloc[:rows])
+        t_full = t_store = 0.0
+        err = 0.0
+        for i in range(1, repeats + 1):
+            part = df.iloc[:rows + new_rows * i]
+            ref, dt = _timed(build_features, part)
+            t_full += dt
+            got, dt = _timed(store.features, "X", "15m", part)
+            t_store += dt
+            err = max(err, float(((got - ref).abs() / (ref.abs() + 1.0)).to_numpy().max()))
+        print(f"{rows} rows, +{new_rows} per run: first materialization {t_first * 1000:6.1f} ms; "
+              f"build_features {t_full / repeats * 1000:6.1f} ms vs store {t_store / repeats * 1000:6.1f} ms "
+              f"x{t_full / t_store:4.1f}  max rel diff {err:.1e}  {store.stats()}")
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+def bench_kernel(rows, symbols):
+    # build_features (pandas) против NumPy-ядра: один ряд и панель symbols x rows одним проходом
+    frames = {f"S{i:03d}/USDT": synthetic_ohlcv(rows, seed=i) for i in range(symbols)}
+    one = next(iter(frames.values()))
+    for n in (1000, rows):
+        part = one.iloc[-n:]
+        ref, t_pd = _timed(build_features, part)
+        got, t_np = _timed(build_features_np, part)
+        err = float(((got - ref).abs() / (ref.abs() + 1.0)).to_numpy().max())
+        print(f"single {n:7d} rows: pandas {t_pd * 1000:7.1f} ms  numpy {t_np * 1000:6.1f} ms  x{t_pd / t_np:4.1f}  max rel diff {err:.1e}")
+    ref, t_pd = _timed(lambda: {k: build_features(v) for k, v in frames.items()})
+    got, t_np = _timed(build_features_panel, frames)
+    err = max(float(((got[k] - ref[k]).abs() / (ref[k].abs() + 1.0)).to_numpy().max()) for k in frames)
+    print(f"panel {symbols} x {rows}: pandas loop {t_pd:6.2f} s  numpy panel {t_np:6.2f} s  x{t_pd / t_np:4.1f}  max rel diff {err:.1e}")
+
+def bench_indicators(rows, repeats):
+    # план индикаторов: общие узлы DAG считаются один раз; отключённые индикаторы не стоят ничего
+    df = synthetic_ohlcv(rows, seed=5)
+    ref = build_features(df)
+    full = plan_for()
+    alone = sum(len(compile_plan([s]).nodes) for s in full.spec)
+    print(f"default plan: {len(full.columns)} columns, {len(full.nodes)} DAG nodes (per-indicator evaluation: {alone})")
+    _, t_pd = _timed(lambda: [build_features(df) for _ in range(repeats)])
+    got, t_plan = _timed(lambda: [full(df) for _ in range(repeats)])
+    err = float(((got[0] - ref).abs() / (ref.abs() + 1.0)).to_numpy().max())
+    print(f"{rows} rows: build_features {t_pd / repeats * 1000:6.1f} ms, plan {t_plan / repeats * 1000:6.1f} ms, max rel diff {err:.1e}")
+    subsets = {"rsi+macd": {n: {"enabled": n in ("rsi", "macd")} for n in INDICATORS},
+               "no patterns/bollinger": {"patterns": {"enabled": False}, "bollinger": {"enabled": False}},
+               "sma_50+bb_50": {"sma": {"params": {"n": 50}}, "bollinger": {"params": {"n": 50}}}}
+    for name, settings in subsets.items():
+        plan = plan_for(settings)
+        _, dt = _timed(lambda: [plan(df) for _ in range(repeats)])
+        print(f"  {name:22s} {len(plan.columns):2d} columns, {len(plan.nodes):2d} nodes: {dt / repeats * 1000:6.1f} ms")
+
+def bench_universe(symbols, rows, processes):
+    # обучение всей вселенной одной задачей очереди: потоки против пула процессов с shared memory
+    tmp = tempfile.mkdtemp(prefix="bench_universe_")
+    Config.FEATURE_STORE_DIR = os.path.join(tmp, "features")
+    timeframes = {"15m": "15min", "1h": "1h", "4h": "4h"}
+    names = [f"S{i:03d}/USDT" for i in range(symbols)]
+    try:
+        db = DatabaseManager(os.path.join(tmp, "universe.db"))
+        for i, name in enumerate(names):
+            for tf, freq in timeframes.items():
+                db.upsert_ohlcv_bulk(name, tf, synthetic_ohlcv(rows, freq=freq, seed=i))
+        mm = ModelManager(db)
+        for name in names:
+            for tf in timeframes:
+                mm.feature_store.features(name, tf)
+
+        def run(mode):
+            conn = db._conn()
+            conn.execute("DELETE FROM models")
+            conn.commit()
+            conn.close()
+            Config.TRAIN_MODE = mode
+            sch = TrainingScheduler(db, mm)
+            t0 = time.perf_counter()
+            job_id = sch.submit(names, list(timeframes), label="*")
+            while db.get_training_job(job_id)["status"] in ("queued", "running"):
+                time.sleep(0.01)
+            dt = time.perf_counter() - t0
+            sch.stop()
+            return dt, db.get_training_job(job_id)["message"]
+
+        t_thread, msg = run("thread")
+        print(f"{symbols} symbols x {len(timeframes)} TF x {rows} rows, {os.cpu_count()} CPU:")
+        print(f"  threads (MAX_WORKERS={Config.MAX_WORKERS}): {t_thread:6.2f} s  [{msg}]")
+        for n in processes:
+            pool = mm.train_pool = TrainingPool(n)
+            # старт процессов и импорт sklearn — вне замера
+            list(pool.executor().map(time.sleep, [0.3] * n))
+            dt, msg = run("process")
+            pool.shutdown()
+            print(f"  processes={n:2d}: {dt:6.2f} s  x{t_thread / dt:4.2f} vs threads  [{msg}]")
+        Config.TRAIN_MODE = "thread"
+        db.close()
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+def bench_scheduler(symbols, rows, clicks):
+    # очередь обучения: ожидание дообучения за полными переобучениями (FIFO против приоритетов), повторные клики
+    tmp = tempfile.mkdtemp(prefix="bench_sched_")
+    Config.FEATURE_STORE_DIR = os.path.join(tmp, "features")
+    Config.TRAIN_MODE = "thread"
+    names = [f"S{i:03d}/USDT" for i in range(symbols)]
+    try:
+        db = DatabaseManager(os.path.join(tmp, "sched.db"))
+        for i, name in enumerate(names):
+            db.upsert_ohlcv_bulk(name, "15m", synthetic_ohlcv(rows, seed=i))
+        db.upsert_ohlcv_bulk("INC/USDT", "1h", synthetic_ohlcv(5000, freq="1h", seed=99).iloc[:-200])
+        mm = ModelManager(db)
+        mm.train_pair("INC/USDT", "1h")
+        db.upsert_ohlcv_bulk("INC/USDT", "1h", synthetic_ohlcv(5000, freq="1h", seed=99))
+        for name in names:
+            mm.feature_store.features(name, "15m")
+
+        def reset():
+            conn = db._conn()
+            conn.execute("DELETE FROM models WHERE symbol != 'INC/USDT'")
+            conn.commit()
+            conn.close()
+
+        def wait_jobs(ids):
+            while any(db.get_training_job(j)["status"] in ("queued", "running") for j in ids):
+                time.sleep(0.01)
+
+        # FIFO: executor.submit в порядке запросов, как было в /api/train
+        reset()
+        ex = ThreadPoolExecutor(max_workers=1)
+        t0 = time.perf_counter()
+        futs = [ex.submit(mm.train_pair, n, "15m") for n in names]
+        inc = ex.submit(mm.train_pair, "INC/USDT", "1h")
+        inc.result()
+        t_fifo = time.perf_counter() - t0
+        for f in futs:
+            f.result()
+        ex.shutdown()
+        print(f"{symbols} full retrains x {rows} rows queued before one incremental, 1 worker:")
+        print(f"  FIFO executor: incremental done after {t_fifo:6.2f} s")
+
+        reset()
+        sch = TrainingScheduler(db, mm, workers=1)
+        t0 = time.perf_counter()
+        full = [sch.submit([n], ["15m"]) for n in names]
+        inc = sch.submit(["INC/USDT"], ["1h"])
+        wait_jobs([inc])
+        t_sched = time.perf_counter() - t0
+        wait_jobs(full)
+        job = db.get_training_job(inc)
+        print(f"  scheduler:     incremental done after {t_sched:6.2f} s (wait {job['wait_sec']} s, queue depth at submit {job['queue_depth']})")
+
+        reset()
+        t0 = time.perf_counter()
+        ids = [sch.submit([names[0]], ["15m"]) for _ in range(clicks)]
+        wait_jobs(ids)
+        trained = sum(db.get_training_job(j)["message"].startswith("trained 1/") for j in ids)
+        print(f"  {clicks} clicks on one pair: {time.perf_counter() - t0:6.2f} s, pair trained {trained} time(s) "
+              f"(FIFO would train it {clicks} times)")
+        sch.stop()
+        db.close()
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+def bench_batch(symbols, repeats):
+    # консенсус по всей вселенной: predict_hierarchical по символам против predict_universe (одна пачка)
+    tmp = tempfile.mkdtemp(prefix="bench_batch_")
+    Config.FEATURE_STORE_DIR = os.path.join(tmp, "features")
+    Config.TRAIN_MODE = "thread"
+    timeframes = {"4h": "4h", "1h": "1h", "15m": "15min"}
+    names = [f"S{i:03d}/USDT" for i in range(symbols)]
+    try:
+        db = DatabaseManager(os.path.join(tmp, "batch.db"))
+        mm = ModelManager(db)
+        windows = {}
+        for i, name in enumerate(names):
+            windows[name] = {}
+            for tf, freq in timeframes.items():
+                df = synthetic_ohlcv(2500, freq=freq, seed=i)
+                db.upsert_ohlcv_bulk(name, tf, df)
+                mm.train_pair(name, tf)
+                windows[name][tf] = df.tail(1000)
+        tfs = list(timeframes)
+        ref = {n: mm.predict_hierarchical(n, tfs, windows[n]) for n in names}
+        got = mm.predict_universe(tfs, windows)
+        same = all(got[n]["preds"] == ref[n]["preds"] and got[n]["consensus"] == ref[n]["consensus"] for n in names)
+        err = max(abs(got[n]["probs"][tf][k] - ref[n]["probs"][tf][k]) for n in names for tf in tfs for k in ("buy", "hold", "sell"))
+        _, t_loop = _timed(lambda: [[mm.predict_hierarchical(n, tfs, windows[n]) for n in names] for _ in range(repeats)])
+        _, t_batch = _timed(lambda: [mm.predict_universe(tfs, windows) for _ in range(repeats)])
+        print(f"{symbols} symbols x {len(tfs)} TF: per-symbol loop {t_loop / repeats * 1000:7.1f} ms, "
+              f"predict_universe {t_batch / repeats * 1000:7.1f} ms  x{t_loop / t_batch:4.1f}; "
+              f"preds/consensus identical: {same}, max prob diff {err:.1e}")
+        # только модель: sklearn predict_proba по строке против одной пачки NumPy
+        rows = []
+        for n in names:
+            for tf in tfs:
+                meta = db.load_model_cached(n, tf)
+                rows.append((mm._latest_features(n, tf, windows[n][tf], meta), meta))
+        _, t_sk = _timed(lambda: [[m["model"].predict_proba(X) for X, m in rows] for _ in range(repeats)])
+        X = np.vstack([r[0] for r in rows])
+        params = [mm.linear_params.get(n, tf, db.load_model_cached(n, tf)) for n in names for tf in tfs]
+        _, t_np = _timed(lambda: [predict_proba_batch(X, params) for _ in range(repeats)])
+        print(f"  model only, {len(rows)} rows: sklearn per row {t_sk / repeats * 1000:7.2f} ms, "
+              f"batch {t_np / repeats * 1000:6.2f} ms  x{t_sk / t_np:5.1f}")
+        db.close()
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+def bench_predcache(symbols, hours, interval):
+    # тики бота каждые interval секунд: без кэша каждый ТФ пересчитывается на каждом тике; с кэшем старшие ТФ
+    # переиспользуются до закрытия свечи, а иерархия обрывается на первом отсутствующем/несогласном ТФ
+    tmp = tempfile.mkdtemp(prefix="bench_predcache_")
+    Config.FEATURE_STORE_DIR = os.path.join(tmp, "features")
+    Config.TRAIN_MODE = "thread"
+    timeframes = {"1w": "7D", "1d": "1D", "4h": "4h", "1h": "1h", "15m": "15min"}
+    rows = {"1w": 300, "1d": 1500, "4h": 3000, "1h": 6000, "15m": 12000}
+    end = pd.Timestamp("2024-06-01")
+    names = [f"S{i:03d}/USDT" for i in range(symbols)]
+    try:
+        db = DatabaseManager(os.path.join(tmp, "predcache.db"))
+        mm = ModelManager(db)
+        series = {}
+        for i, name in enumerate(names):
+            for tf, freq in timeframes.items():
+                df = synthetic_ohlcv(rows[tf], freq=freq, seed=i)
+                df.index = df.index - df.index[-1] + end
+                if tf == "1w":
+                    df.index = df.index - pd.Timedelta(days=df.index[-1].dayofweek)
+                series[(name, tf)] = df
+                db.upsert_ohlcv_bulk(name, tf, df.iloc[:-3])
+                mm.train_pair(name, tf)
+        tfs = list(timeframes)
+        ticks = pd.date_range(end - pd.Timedelta(hours=hours), end, freq=f"{interval}s")
+
+        def windows_at(t):
+            return {n: {tf: series[(n, tf)].loc[:t].tail(1000) for tf in tfs} for n in names}
+
+        snapshots = [(int(t.value // 10**6), windows_at(t)) for t in ticks]
+        results = {}
+        for cached in (False, True):
+            Config.PREDICT_CACHE = cached
+            mm._pred_cache.clear()
+            mm.features.reset()
+            before = mm.prediction_stats()
+            t0 = time.perf_counter()
+            res = [[mm.predict_hierarchical(n, tfs, w[n], now_ms=ms) for n in names] for ms, w in snapshots]
+            dt = time.perf_counter() - t0
+            after = mm.prediction_stats()
+            results[cached] = res
+            n_calls = len(snapshots) * len(names)
+            computed = after["computed"] - before["computed"]
+            print(f"cache={'on ' if cached else 'off'}: {len(snapshots)} ticks x {symbols} symbols x {len(tfs)} TF: "
+                  f"{dt / n_calls * 1000:6.2f} ms per symbol-tick, model runs {computed} "
+                  f"({computed / n_calls:.2f} per symbol-tick), cache hits {after['cache_hits'] - before['cache_hits']}, "
+                  f"skipped {after['skipped'] - before['skipped']}")
+        changed = sum(a["consensus"] != b["consensus"] for ra, rb in zip(results[False], results[True]) for a, b in zip(ra, rb))
+        print(f"  consensus differs on {changed}/{len(snapshots) * len(names)} symbol-ticks "
+              f"(higher TF now ignore the forming candle)")
+        db.close()
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+def _timed(fn, *args, **kwargs):
+    t0 = time.perf_counter()
+    res = fn(*args, **kwargs)
+    return res, time.perf_counter() - t0
+
+def bench_backtest(symbols, years, processes, naive_bars):
+    # walk-forward бэктест: 15m за years лет + старшие ТФ (ресемплинг 15m), векторно по символу и пулом по символам;
+    # для сравнения — побарный прогон (predict_proba на каждую закрытую 15m-свечу по каждому ТФ), экстраполяция
+    tmp = tempfile.mkdtemp(prefix="bench_backtest_")
+    Config.FEATURE_STORE_DIR = os.path.join(tmp, "features")
+    rows = int(years * 365 * 96)
+    timeframes = ["15m", "1h", "4h", "1d", "1w"]
+    names = [f"S{i:03d}/USDT" for i in range(symbols)]
+    try:
+        db = DatabaseManager(os.path.join(tmp, "backtest.db"))
+        for i, name in enumerate(names):
+            base = synthetic_ohlcv(rows, seed=i)
+            db.upsert_ohlcv_bulk(name, "15m", base)
+            for tf in timeframes[1:]:
+                db.upsert_ohlcv_bulk(name, tf, resample_ohlcv(base, "15m", tf)[0])
+        mm = ModelManager(db)
+        bt = Backtester(db, mm)
+
+        frames = bt._frames(names[0], timeframes, 0)
+        spec = mm.plan(names[0]).spec
+        (trades, m), dt = _timed(simulate_symbol, names[0], frames, spec, {})
+        print(f"1 symbol, {years} y: {rows} x 15m + {', '.join(timeframes[1:])}: {dt:6.2f} s "
+              f"(models {m['model_sec']:.2f} s, simulation {m['sim_sec']:.3f} s), {m['bars']} decision bars, "
+              f"{m['retrains']} walk-forward fits, {m['trades']} trades, pnl {m['pnl_percent']:.2f}%, "
+              f"accuracy {m['accuracy']:.3f}")
+
+        # побарно: только инференс финальными моделями, без дообучения — нижняя граница наивного прогона
+        plan = compile_plan(spec)
+        models, Xs = {}, {}
+        for tf, (t, ohlc) in frames.items():
+            Xs[tf] = plan.evaluate(*ohlc).T
+            y = make_labels(pd.DataFrame({"close": ohlc[3]})).to_numpy()
+            models[tf] = (t + TF_TO_MS[tf], fit_model(Xs[tf], y)[0])
+        t15 = frames["15m"][0] + TF_TO_MS["15m"]
+        t0 = time.perf_counter()
+        for t in t15[-naive_bars:]:
+            for tf in (tf for tf in HIERARCHY if tf in models):
+                close_ms, model = models[tf]
+                i = int(np.searchsorted(close_ms, t, side="right")) - 1
+                model.predict_proba(Xs[tf][i:i + 1])
+        per_bar = (time.perf_counter() - t0) / naive_bars
+        print(f"  bar-by-bar inference: {per_bar * 1e3:.2f} ms/bar -> ~{per_bar * m['bars']:.0f} s for "
+              f"{m['bars']} bars (x{per_bar * m['bars'] / dt:.0f} vs walk-forward incl. retraining)")
+
+        run_id, t_inline = _timed(bt.run, names, timeframes, 0, inline=True)
+        total = db.get_backtest_run(run_id)["metrics"]["*"]
+        print(f"{symbols} symbols inline: {t_inline:6.2f} s  ({total['trades']} trades, pnl {total['pnl_percent']:.2f}%, "
+              f"max drawdown {total['max_drawdown']:.2f}%)")
+        for n in processes:
+            pool = mm.train_pool = TrainingPool(n)
+            list(pool.executor().map(time.sleep, [0.3] * n))
+            _, dt = _timed(bt.run, names, timeframes, 0)
+            pool.shutdown()
+            print(f"  processes={n:2d}: {dt:6.2f} s  x{t_inline / dt:4.2f} vs inline ({os.cpu_count()} CPU)")
+        db.close()
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+def main():
+    p = argparse.ArgumentParser(description="ai_trader benchmarks")
+    sub = p.add_subparsers(dest="cmd", required=True)
+    b = sub.add_parser("upsert", help="построчный upsert_ohlcv против upsert_ohlcv_bulk")
+    b.add_argument("--rows", type=int, default=105_000, help="свечей на символ (~3 года 15m)")
+    b.add_argument("--symbols", type=int, default=2)
+    b = sub.add_parser("read", help="load_ohlcv: SQLite против колоночного memmap-хранилища")
+    b.add_argument("--rows", type=int, default=105_000)
+    b.add_argument("--repeats", type=int, default=5)
+    b = sub.add_parser("schema", help="размер БД и скорость чтения: historical_data против candles")
+    b.add_argument("--rows", type=int, default=105_000)
+    b.add_argument("--symbols", type=int, default=6)
+    b.add_argument("--repeats", type=int, default=5)
+    b = sub.add_parser("writes", help="мелкие мутации: транзакция на вызов против write-behind очереди")
+    b.add_argument("--ops", type=int, default=20_000, help="сделок всего")
+    b.add_argument("--threads", type=int, default=8)
+    b = sub.add_parser("news", help="пакетная запись новостей и FTS5-поиск против LIKE")
+    b.add_argument("--articles", type=int, default=1_000_000)
+    b.add_argument("--repeats", type=int, default=5)
+    b = sub.add_parser("backfill", help="последовательная догрузка против BackfillScheduler на фейковой бирже")
+    b.add_argument("--symbols", type=int, default=6)
+    b.add_argument("--years", type=int, default=1)
+    b.add_argument("--latency", type=float, default=0.05, help="задержка ответа биржи, сек")
+    b.add_argument("--budgets", type=int, nargs="+", default=[3000, 6000], help="лимит веса в минуту")
+    b = sub.add_parser("derive", help="REST-страницы и время синхронизации: все TF против 15m + локальный ресемплинг")
+    b.add_argument("--symbols", type=int, default=6)
+    b.add_argument("--years", type=int, default=3)
+    b.add_argument("--latency", type=float, default=0.05)
+    b.add_argument("--budget", type=int, default=6000)
+    b = sub.add_parser("stream", help="пиковая память догрузки: накопление против потоковой записи по страницам")
+    b.add_argument("--years", type=int, default=3)
+    b.add_argument("--latency", type=float, default=0.02)
+    b = sub.add_parser("ws", help="пропускная способность WebsocketManager на локальном kline-сервере")
+    b.add_argument("--symbols", type=int, default=500)
+    b.add_argument("--timeframes", nargs="+", default=["1m", "15m"])
+    b.add_argument("--speed", type=float, default=900, help="ускорение симулированного времени")
+    b.add_argument("--seconds", type=float, default=10)
+    b.add_argument("--port", type=int, default=Config.FAKE_WS_PORT)
+    b = sub.add_parser("features", help="признаки на тик: build_features по окну против FeatureStream")
+    b.add_argument("--rows", type=int, default=105_000)
+    b.add_argument("--window", type=int, default=1000)
+    b.add_argument("--ticks", type=int, default=2000)
+    b = sub.add_parser("featstore", help="признаки для дообучения: build_features по истории против FeatureStore")
+    b.add_argument("--rows", type=int, default=105_000)
+    b.add_argument("--new-rows", type=int, default=96, help="новых свечей между запусками (сутки 15m)")
+    b.add_argument("--repeats", type=int, default=10)
+    b = sub.add_parser("kernel", help="build_features: pandas против NumPy-ядра, один ряд и панель символов")
+    b.add_argument("--rows", type=int, default=105_000)
+    b.add_argument("--symbols", type=int, default=50)
+    b = sub.add_parser("indicators", help="план индикаторов (DAG) против build_features, наборы индикаторов")
+    b.add_argument("--rows", type=int, default=105_000)
+    b.add_argument("--repeats", type=int, default=5)
+    b = sub.add_parser("universe", help="обучение всех символов x ТФ: потоки против пула процессов")
+    b.add_argument("--symbols", type=int, default=8)
+    b.add_argument("--rows", type=int, default=20_000)
+    b.add_argument("--processes", type=int, nargs="+", default=sorted({1, 2, os.cpu_count() or 1}))
+    b = sub.add_parser("scheduler", help="очередь обучения: приоритет дообучения, склейка повторных запросов")
+    b.add_argument("--symbols", type=int, default=4)
+    b.add_argument("--rows", type=int, default=200_000)
+    b.add_argument("--clicks", type=int, default=5)
+    b = sub.add_parser("batch", help="консенсус по всем символам: predict_hierarchical в цикле против predict_universe")
+    b.add_argument("--symbols", type=int, default=50)
+    b.add_argument("--repeats", type=int, default=5)
+    b = sub.add_parser("predcache", help="тики бота: кэш предиктов старших ТФ по закрытию свечи, ленивая иерархия")
+    b.add_argument("--symbols", type=int, default=5)
+    b.add_argument("--hours", type=int, default=24)
+    b.add_argument("--interval", type=int, default=60)
+    b = sub.add_parser("backtest", help="walk-forward бэктест: векторно по символу, пул по символам, против побарного")
+    b.add_argument("--symbols", type=int, default=4)
+    b.add_argument("--years", type=float, default=3)
+    b.add_argument("--processes", type=int, nargs="+", default=[2, 4])
+    b.add_argument("--naive-bars", type=int, default=2000)
+    args = p.parse_args()
+    if args.cmd == "upsert":
+        bench_upsert(args.rows, args.symbols)
+    elif args.cmd == "read":
+        bench_read(args.rows, args.repeats)
+    elif args.cmd == "schema":
+        bench_schema(args.rows, args.symbols, args.repeats)
+    elif args.cmd == "writes":
+        bench_writes(args.ops, args.threads)
+    elif args.cmd == "news":
+        bench_news(args.articles, args.repeats)
+    elif args.cmd == "backfill":
+        bench_backfill(args.symbols, args.years, args.latency, args.budgets)
+    elif args.cmd == "derive":
+        bench_derive(args.symbols, args.years, args.latency, args.budget)
+    elif args.cmd == "stream":
+        bench_stream(args.years, args.latency)
+    elif args.cmd == "features":
+        bench_features(args.rows, args.window, args.ticks)
+    elif args.cmd == "featstore":
+        bench_featstore(args.rows, args.new_rows, args.repeats)
+    elif args.cmd == "backtest":
+        bench_backtest(args.symbols, args.years, args.processes, args.naive_bars)
+    elif args.cmd == "predcache":
+        bench_predcache(args.symbols, args.hours, args.interval)
+    elif args.cmd == "batch":
+        bench_batch(args.symbols, args.repeats)
+    elif args.cmd == "scheduler":
+        bench_scheduler(args.symbols, args.rows, args.clicks)
+    elif args.cmd == "universe":
+        bench_universe(args.symbols, args.rows, args.processes)
+    elif args.cmd == "indicators":
+        bench_indicators(args.rows, args.repeats)
+    elif args.cmd == "kernel":
+        bench_kernel(args.rows, args.symbols)
+    elif args.cmd == "ws":
+        bench_ws(args.symbols, args.timeframes, args.speed, args.seconds, args.port)
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,8 @@
 import threading
 import time
-from datetime import datetime
+from datetime import datetime, timedelta
 import logging
+import pandas as pd
 from config import Config
 from database import DatabaseManager
 from data_manager import CCXTDataManager
@@ -37,35 +38,41 @@ class BotManager:
         logger.info("bot stop requested for %s", symbol)
         return True, "stopped"
 
+    def latest_windows(self, symbol, timeframes):
+        # окна свечей для предикта: история за полгода + live-кэш WS, последние 1000 баров на ТФ
+        latest = {}
+        half_year_ago = datetime.utcnow() - timedelta(days=180)
+        for tf in timeframes:
+            # пробуем live cache
+            live = self.ws.get_live_candles(symbol, tf, limit=500) if self.ws else []
+            live_df = None
+            if live:
+                live_df = pd.DataFrame(live)
+                live_df["open_time"] = pd.to_datetime(live_df["open_time"])
+                live_df.set_index("open_time", inplace=True)
+                live_df = live_df[["open","high","low","close","volume"]].astype(float)
+            hist = self.db.load_ohlcv(symbol, tf, since=half_year_ago)
+            if hist is not None and not hist.empty:
+                if live_df is not None and not live_df.empty:
+                    merged = pd.concat([hist, live_df]).sort_index().groupby(level=0).last()
+                else:
+                    merged = hist
+                latest[tf] = merged.tail(1000)
+        return latest
+
     def _run_loop(self, symbol, timeframes, interval_sec, ctrl):
         # подписка WS для TF
         if self.ws: self.ws.subscribe([symbol], timeframes)
         try:
             while self._bots.get(symbol,{}).get("running"):
                 # 1) обновить инкрементальные данные из mainnet в БД (для safety)
-                for tf in timeframes:
+                fetch_tfs, derived_tfs = self.data.plan_timeframes(timeframes)
+                for tf in fetch_tfs:
                     self.data.fetch_ohlcv_incremental(symbol, tf, years=Config.HISTORY_YEARS)
+                self.data.derive_timeframes(symbol, derived_tfs)
                 # 2) собрать “live окна” за последние полгода
-                latest = {}
-                half_year_ago = datetime.utcnow() - timedelta(days=180)
-                for tf in timeframes:
-                    # пробуем live cache
-                    live = self.ws.get_live_candles(symbol, tf, limit=500) if self.ws else []
-                    live_df = None
-                    if live:
-                        live_df = pd.DataFrame(live)
-                        live_df["open_time"] = pd.to_datetime(live_df["open_time"])
-                        live_df.set_index("open_time", inplace=True)
-                        live_df = live_df[["open","high","low","close","volume"]].astype(float)
-                    hist = self.db.load_ohlcv(symbol, tf, since=half_year_ago)
-                    if hist is not None and not hist.empty:
-                        if live_df is not None and not live_df.empty:
-                            merged = pd.concat([hist, live_df]).sort_index().groupby(level=0).last()
-                        else:
-                            merged = hist
-                        latest[tf] = merged.tail(1000)
+                latest = self.latest_windows(symbol, timeframes)
                 # 3) иерархический предикт
-                from datetime import timedelta
                 result = self.models.predict_hierarchical(symbol, timeframes, latest)
                 if result["consensus"] != 0 and result["confidence"] >= Config.SIGNAL_THRESHOLD:
                     side = "BUY" if result["consensus"]==1 else "SELL"
@@ -23,6 +23,14 @@ class Config:
     NEWS_AGG_MINUTES = int(os.environ.get("NEWS_AGG_MINUTES", "60"))
     # Многопоточность обучения
     MAX_WORKERS = int(os.environ.get("MAX_WORKERS", "4"))
+    # Обучение: "thread" — пары в потоках очереди обучения; "process" — пул процессов (training_pool.py)
+    TRAIN_MODE = os.environ.get("TRAIN_MODE", "thread")
+    # Потоки очереди обучения (training_scheduler.py); 0 — MAX_WORKERS, в режиме process — 2 x процессов пула
+    TRAIN_CONCURRENCY = int(os.environ.get("TRAIN_CONCURRENCY", "0"))
+    # 0 — по числу ядер
+    TRAIN_PROCESSES = int(os.environ.get("TRAIN_PROCESSES", "0"))
+    # forkserver | spawn (fork небезопасен: родитель держит потоки и соединения SQLite)
+    TRAIN_START_METHOD = os.environ.get("TRAIN_START_METHOD", "forkserver")
     # CCXT exchange id
     EXCHANGE_ID = os.environ.get("EXCHANGE_ID", "binance")
     # Торговля только тестнет
@@ -31,6 +39,67 @@ class Config:
     ENABLE_WS = True
     # Путь для сохранения моделей
     MODELS_DIR = os.environ.get("MODELS_DIR", "models")
+    # SQLite: пул долгоживущих соединений и их PRAGMA
+    DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", "16"))
+    DB_POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", "30"))
+    DB_BUSY_TIMEOUT_MS = int(os.environ.get("DB_BUSY_TIMEOUT_MS", "5000"))
+    DB_MMAP_SIZE = int(os.environ.get("DB_MMAP_SIZE", str(256 * 1024 * 1024)))
+    DB_CACHE_SIZE_KB = int(os.environ.get("DB_CACHE_SIZE_KB", "16384"))
+    # Сколько раз повторять запрос при "database is locked" после busy_timeout
+    DB_LOCK_RETRIES = int(os.environ.get("DB_LOCK_RETRIES", "5"))
+    # Онлайн-миграция historical_data -> candles: строк за транзакцию и пауза между чанками (сек)
+    CANDLES_MIGRATION_CHUNK = int(os.environ.get("CANDLES_MIGRATION_CHUNK", "50000"))
+    CANDLES_MIGRATION_PAUSE = float(os.environ.get("CANDLES_MIGRATION_PAUSE", "0.05"))
+    # Бэкенд чтения свечей: sqlite | columnar (memmap-файлы на пару, SQLite остаётся источником истины)
+    OHLCV_BACKEND = os.environ.get("OHLCV_BACKEND", "sqlite")
+    # Каталог колоночных файлов; пусто — рядом с БД (<DB_PATH без расширения>_ohlcv), своя копия у каждой БД
+    COLUMNAR_DIR = os.environ.get("COLUMNAR_DIR", "")
+    # Общий LRU-кэш свечей перед load_ohlcv: лимит суммарного числа строк (0 — выключен)
+    OHLCV_CACHE_MAX_ROWS = int(os.environ.get("OHLCV_CACHE_MAX_ROWS", "2000000"))
+    # Write-behind: мутации пишет один поток пачками (интервал сброса, мс; максимум операций в транзакции)
+    DB_WRITE_BEHIND = os.environ.get("DB_WRITE_BEHIND", "0") == "1"
+    DB_WRITE_FLUSH_MS = int(os.environ.get("DB_WRITE_FLUSH_MS", "50"))
+    DB_WRITE_BATCH = int(os.environ.get("DB_WRITE_BATCH", "500"))
+    # Догрузка истории: параллельные задачи под общим бюджетом веса запросов (Binance REQUEST_WEIGHT, лимит 6000/мин)
+    BACKFILL_CONCURRENCY = int(os.environ.get("BACKFILL_CONCURRENCY", "8"))
+    BACKFILL_WEIGHT_PER_MIN = int(os.environ.get("BACKFILL_WEIGHT_PER_MIN", "3000"))
+    BACKFILL_BURST = int(os.environ.get("BACKFILL_BURST", "100"))
+    BACKFILL_KLINES_WEIGHT = int(os.environ.get("BACKFILL_KLINES_WEIGHT", "2"))
+    BACKFILL_MARKETS_WEIGHT = int(os.environ.get("BACKFILL_MARKETS_WEIGHT", "20"))
+    BACKFILL_PAGE_LIMIT = int(os.environ.get("BACKFILL_PAGE_LIMIT", "1000"))
+    BACKFILL_MAX_RETRIES = int(os.environ.get("BACKFILL_MAX_RETRIES", "5"))
+    BACKFILL_BACKOFF_SEC = float(os.environ.get("BACKFILL_BACKOFF_SEC", "0.5"))
+    # Признаки для предикта считаются потоково (features_stream.py), а не build_features по всему окну
+    STREAM_FEATURES = os.environ.get("STREAM_FEATURES", "1") == "1"
+    # Предикт старших ТФ только по закрытым свечам и кэш до следующей свечи; иерархия считается сверху
+    # вниз и останавливается на первом отсутствующем/несогласном ТФ
+    PREDICT_CACHE = os.environ.get("PREDICT_CACHE", "1") == "1"
+    PREDICT_CACHE_TFS = [s.strip() for s in os.environ.get("PREDICT_CACHE_TFS", "1w,1d,4h").split(",") if s.strip()]
+    # Ядро признаков для обучения: "numpy" (план индикаторов indicators.py) или "pandas" (features.build_features)
+    FEATURE_KERNEL = os.environ.get("FEATURE_KERNEL", "numpy")
+    # Материализованные признаки для обучения (feature_store.py): досчитывается только хвост + warmup баров
+    FEATURE_STORE = os.environ.get("FEATURE_STORE", "1") == "1"
+    FEATURE_STORE_DIR = os.environ.get("FEATURE_STORE_DIR", "feature_store")
+    FEATURE_WARMUP_BARS = int(os.environ.get("FEATURE_WARMUP_BARS", "500"))
+    # Фоновые задачи синхронизации истории: сколько задач одновременно (каждая сама параллелит пары
+    # через BackfillScheduler) и как часто писать прогресс в sync_jobs
+    SYNC_WORKERS = int(os.environ.get("SYNC_WORKERS", "2"))
+    SYNC_PROGRESS_SEC = float(os.environ.get("SYNC_PROGRESS_SEC", "1.0"))
+    # Потоковая догрузка: сколько страниц держать в очереди между загрузкой и записью
+    FETCH_PREFETCH_PAGES = int(os.environ.get("FETCH_PREFETCH_PAGES", "4"))
+    # Старшие TF строятся локально из базового (свечи с source='derived'); по REST качается только базовый
+    DERIVE_TIMEFRAMES = os.environ.get("DERIVE_TIMEFRAMES", "1") == "1"
+    BASE_TIMEFRAME = os.environ.get("BASE_TIMEFRAME", "15m")
+    # "live" — Binance; "fake" — локальная биржа (fake_exchange.py) для прогонов без сети
+    EXCHANGE_MODE = os.environ.get("EXCHANGE_MODE", "live")
+    WS_URL = os.environ.get("WS_URL", "wss://stream.binance.com:9443/stream?streams=")
+    # "synthetic" или каталог колоночного хранилища с записанными свечами
+    FAKE_EXCHANGE_SOURCE = os.environ.get("FAKE_EXCHANGE_SOURCE", "synthetic")
+    FAKE_EXCHANGE_LATENCY_MS = float(os.environ.get("FAKE_EXCHANGE_LATENCY_MS", "30"))
+    FAKE_EXCHANGE_WEIGHT_PER_MIN = int(os.environ.get("FAKE_EXCHANGE_WEIGHT_PER_MIN", "6000"))
+    FAKE_EXCHANGE_ERROR_RATE = float(os.environ.get("FAKE_EXCHANGE_ERROR_RATE", "0"))
+    FAKE_WS_PORT = int(os.environ.get("FAKE_WS_PORT", "8765"))
+    FAKE_WS_SPEED = float(os.environ.get("FAKE_WS_SPEED", "60"))
 
 def configure_logging(level=logging.INFO):
     logging.basicConfig(
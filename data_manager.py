@@ -1,73 +1,259 @@
+import asyncio
 import ccxt
+import ccxt.async_support as ccxt_async
 import pandas as pd
 from datetime import datetime, timedelta
 from config import Config
 from database import DatabaseManager
+from ohlcv_resample import TF_TO_MS, can_derive, bucket_start_ms, resample_ohlcv
+from ohlcv_store import index_to_ms, to_epoch_ms
 import logging
+import threading
 import time
 
 logger = logging.getLogger("data")
 
-TF_TO_MS = {
-    "1m": 60_000, "3m": 180_000, "5m": 300_000, "15m": 900_000, "30m": 1_800_000,
-    "1h": 3_600_000, "2h": 7_200_000, "4h": 14_400_000, "1d": 86_400_000, "1w": 604_800_000
-}
 
 class CCXTDataManager:
     def __init__(self, db: DatabaseManager):
         self.db = db
-        self.exchange = getattr(ccxt, Config.EXCHANGE_ID)({
-            "enableRateLimit": True,
+        self.exchange = self.make_exchange()
+        self.async_exchange = None
+        self._aloop = None
+        self._scheduler = None
+        self._scheduler_lock = threading.Lock()
+
+    def make_exchange(self, rate_limited=True):
+        if Config.EXCHANGE_MODE == "fake":
+            from fake_exchange import FakeExchange
+            return FakeExchange()
+        return getattr(ccxt, Config.EXCHANGE_ID)({
+            "enableRateLimit": rate_limited,
             "options": {"defaultType": "spot"}
         })
 
     def _to_binance_symbol(self, s: str):
         return s.replace("/", "")
 
-    def fetch_ohlcv_incremental(self, symbol: str, timeframe: str, years: int):
-        # Determine since timestamp
+    def exchange_symbol(self, s: str):
+        return self._to_binance_symbol(s)
+
+    @staticmethod
+    def tf_ms(timeframe: str):
+        return TF_TO_MS[timeframe]
+
+    def next_since_ms(self, symbol: str, timeframe: str, years: int):
+        # с какой свечи продолжать: следующая за последней сохранённой или N лет назад
         last_time = self.db.get_last_ohlcv_time(symbol, timeframe)
-        ms_per_tf = TF_TO_MS[timeframe]
         if last_time:
-            # fetch from next candle
-            since_ms = int(pd.Timestamp(last_time).timestamp() * 1000 + ms_per_tf)
-        else:
-            # from years back
-            since_dt = datetime.utcnow() - timedelta(days=365*max(1, years))
-            since_ms = int(since_dt.timestamp() * 1000)
+            return int(pd.Timestamp(last_time).timestamp() * 1000 + TF_TO_MS[timeframe])
+        since_dt = datetime.utcnow() - timedelta(days=365*max(1, years))
+        return int(since_dt.timestamp() * 1000)
+
+    @staticmethod
+    def page_to_frame(chunk):
+        df = pd.DataFrame(chunk, columns=["ts","open","high","low","close","volume"])
+        df["open_time"] = pd.to_datetime(df["ts"], unit="ms", utc=True).dt.tz_convert(None)
+        df.set_index("open_time", inplace=True)
+        df.drop(columns=["ts"], inplace=True)
+        return df[["open","high","low","close","volume"]]
+
+    @property
+    def scheduler(self):
+        from backfill import BackfillScheduler
+        with self._scheduler_lock:
+            if self._scheduler is None:
+                self._scheduler = BackfillScheduler(self)
+            return self._scheduler
+
+    def backfill(self, pairs, years: int, on_progress=None):
+        # много (symbol, timeframe) параллельно под общим бюджетом веса запросов
+        return self.scheduler.run(list(pairs), years, on_progress)
+
+    def backfill_status(self):
+        return self._scheduler.status() if self._scheduler is not None else {"jobs": [], "bucket": None}
+
+    def plan_timeframes(self, timeframes):
+        # какие TF качать по REST, а какие строить локально из базового (Config.BASE_TIMEFRAME)
+        base = Config.BASE_TIMEFRAME
+        if not Config.DERIVE_TIMEFRAMES:
+            return list(timeframes), []
+        derived = [tf for tf in timeframes if can_derive(base, tf)]
+        fetch = [tf for tf in timeframes if tf not in derived]
+        if derived and base not in fetch:
+            fetch.insert(0, base)
+        return fetch, derived
+
+    def sync_history(self, symbols, timeframes, years: int, on_progress=None):
+        fetch, derived = self.plan_timeframes(timeframes)
+        jobs = self.backfill([(sym, tf) for sym in symbols for tf in fetch], years, on_progress)
+        for sym in symbols:
+            self.derive_timeframes(sym, derived)
+            self.db.scan_candle_gaps(sym)
+        return jobs
+
+    def derive_timeframes(self, symbol: str, targets, base_tf=None, now_ms=None):
+        # Инкрементально: пересчитывается только свеча, в которую попадает последняя производная
+        # (она могла быть неполной), и всё, что после неё.
+        # Закрытая свеча, в которой не хватает базовых свечей (дыра в истории), не сохраняется: её OHLC
+        # неверен. У производного TF остаётся дыра — её найдёт scan_candle_gaps и догрузит repair_gaps.
+        base_tf = base_tf or Config.BASE_TIMEFRAME
+        now_ms = int(time.time() * 1000) if now_ms is None else now_ms
+        out = {}
+        for tf in targets:
+            if not can_derive(base_tf, tf):
+                continue
+            last = self.db.get_last_ohlcv_time(symbol, tf)
+            since = None
+            if last is not None:
+                since = pd.Timestamp(int(bucket_start_ms(to_epoch_ms(last), tf)), unit="ms").to_pydatetime()
+            base = self.db.load_ohlcv(symbol, base_tf, since=since)
+            df, counts = resample_ohlcv(base, base_tf, tf, drop_partial_head=since is None)
+            if not df.empty:
+                # текущая, ещё формирующаяся свеча пишется как есть: следующий запуск пересчитает её
+                forming = index_to_ms(df.index) + TF_TO_MS[tf] > now_ms
+                complete = counts == TF_TO_MS[tf] // TF_TO_MS[base_tf]
+                if not (complete | forming).all():
+                    logger.warning("%s %s: %d incomplete candles not derived (missing %s candles)",
+                                   symbol, tf, int((~(complete | forming)).sum()), base_tf)
+                    df = df[complete | forming]
+            if df.empty:
+                out[tf] = 0
+                continue
+            res = self.db.upsert_ohlcv_bulk(symbol, tf, df, source="derived")
+            out[tf] = res["inserted"] + res["updated"]
+        if out:
+            logger.info("derived %s from %s: %s", symbol, base_tf, out)
+        return out
+
+    def repair_gaps(self, symbol=None, timeframe=None, max_gaps=200):
+        # догружаем только интервалы из candle_gaps; что биржа не отдала — помечаем unfillable, чтобы не повторять
+        self.db.scan_candle_gaps(symbol, timeframe)
+        gaps = self.db.list_candle_gaps(symbol, timeframe, status="open", limit=max_gaps)
+        if not gaps:
+            return {"gaps": 0, "repaired": 0, "partial": 0, "unfillable": 0, "failed": 0, "candles": 0}
+        jobs = self.scheduler.run_ranges([(g["symbol"], g["timeframe"], g["start_ms"], g["end_ms"]) for g in gaps])
+        left = {}
+        for pair in {(g["symbol"], g["timeframe"]) for g in gaps}:
+            self.db.scan_candle_gaps(*pair)
+            left[pair] = self.db.list_candle_gaps(*pair, status="open", limit=10**9)
+        # после частичной догрузки остаток дыры получает новый start_ms — сопоставляем по пересечению интервалов
+        counts = {"repaired": 0, "partial": 0, "unfillable": 0, "failed": 0}
+        for g, job in zip(gaps, jobs):
+            rest = [r for r in left[(g["symbol"], g["timeframe"])] if r["start_ms"] < g["end_ms"] and r["end_ms"] > g["start_ms"]]
+            if not rest:
+                counts["repaired"] += 1
+            elif job["status"] != "done":
+                # загрузка оборвалась — остаток остаётся open, следующий repair попробует снова
+                counts["failed"] += 1
+            else:
+                # диапазон запрошен целиком — оставшихся свечей у биржи нет
+                counts["partial" if sum(r["missing"] for r in rest) < g["missing"] else "unfillable"] += 1
+                for r in rest:
+                    self.db.mark_candle_gap(r["symbol"], r["timeframe"], r["start_ms"], status="unfillable")
+        return {"gaps": len(gaps), **counts, "candles": sum(j["candles"] for j in jobs)}
+
+    def verify_derived(self, symbol: str, timeframe: str, limit=500):
+        # сверка локально построенных свечей с биржевыми за последние limit свечей (текущая, открытая, не сравнивается)
+        chunk = self.exchange.fetch_ohlcv(self._to_binance_symbol(symbol), timeframe=timeframe, limit=limit)
+        ref = self.page_to_frame(chunk).iloc[:-1] if chunk else None
+        if ref is None or ref.empty:
+            return {"symbol": symbol, "timeframe": timeframe, "compared": 0}
+        ref.index = pd.DatetimeIndex(ref.index).as_unit("ms")
+        local = self.db.load_ohlcv(symbol, timeframe, since=ref.index[0].to_pydatetime())
+        local.index = pd.DatetimeIndex(local.index).as_unit("ms")
+        common = ref.index.intersection(local.index)
+        a, b = ref.loc[common], local.loc[common]
+        rel = ((a - b).abs() / a.abs().where(a.abs() > 0, 1.0)).max()
+        return {
+            "symbol": symbol, "timeframe": timeframe, "compared": len(common),
+            "missing_local": int(len(ref.index.difference(local.index))),
+            "max_rel_diff": {c: float(rel[c]) for c in rel.index},
+        }
 
+    def make_async_exchange(self):
+        if Config.EXCHANGE_MODE == "fake":
+            from fake_exchange import AsyncFakeExchange
+            return AsyncFakeExchange()
+        return getattr(ccxt_async, Config.EXCHANGE_ID)({
+            "enableRateLimit": True,
+            "options": {"defaultType": "spot"}
+        })
+
+    def _async_runner(self):
+        # отдельный поток с event loop и одним async-клиентом биржи (aiohttp-сессия привязана к loop)
+        with self._scheduler_lock:
+            if self._aloop is None:
+                self._aloop = asyncio.new_event_loop()
+                threading.Thread(target=self._aloop.run_forever, name="ccxt-async", daemon=True).start()
+            return self._aloop
+
+    def close(self):
+        if self.async_exchange is not None and self._aloop is not None:
+            asyncio.run_coroutine_threadsafe(self.async_exchange.close(), self._aloop).result(timeout=10)
+            self.async_exchange = None
+
+    def fetch_ohlcv_incremental(self, symbol: str, timeframe: str, years: int):
+        loop = self._async_runner()
+        return asyncio.run_coroutine_threadsafe(self.fetch_ohlcv_stream(symbol, timeframe, years), loop).result()
+
+    async def fetch_ohlcv_stream(self, symbol: str, timeframe: str, years: int):
+        # Продюсер качает страницы наперёд в ограниченную очередь (backpressure), потребитель
+        # коммитит каждую страницу сразу: память не зависит от глубины истории, а прерванная
+        # догрузка продолжается с последней сохранённой свечи (next_since_ms)
+        if self.async_exchange is None:
+            self.async_exchange = self.make_async_exchange()
+        ex = self.async_exchange
+        since_ms = self.next_since_ms(symbol, timeframe, years)
+        ms_per_tf = TF_TO_MS[timeframe]
         market = self._to_binance_symbol(symbol)
-        all_rows = []
-        limit = 1000
+        limit = Config.BACKFILL_PAGE_LIMIT
+        pages = asyncio.Queue(maxsize=Config.FETCH_PREFETCH_PAGES)
         logger.info("Fetching %s %s since %s", symbol, timeframe, datetime.utcfromtimestamp(since_ms/1000))
-        while True:
+
+        async def produce(since_ms):
+            retries = 0
             try:
-                chunk = self.exchange.fetch_ohlcv(market, timeframe=timeframe, since=since_ms, limit=limit)
-                if not chunk:
-                    break
-                df = pd.DataFrame(chunk, columns=["ts","open","high","low","close","volume"])
-                df["open_time"] = pd.to_datetime(df["ts"], unit="ms", utc=True).dt.tz_convert(None)
-                df.set_index("open_time", inplace=True)
-                df.drop(columns=["ts"], inplace=True)
-                all_rows.append(df[["open","high","low","close","volume"]])
-                # next since
-                since_ms = int(df.index[-1].timestamp() * 1000 + ms_per_tf)
-                if len(chunk) < limit:
-                    break
-                # rate limit friendly
-                time.sleep(self.exchange.rateLimit/1000)
-            except ccxt.NetworkError as e:
-                logger.warning("Network error: %s; retrying", e)
-                time.sleep(1)
+                while True:
+                    try:
+                        chunk = await ex.fetch_ohlcv(market, timeframe=timeframe, since=since_ms, limit=limit)
+                    except ccxt.NetworkError as e:
+                        retries += 1
+                        if retries > Config.BACKFILL_MAX_RETRIES:
+                            raise
+                        logger.warning("Network error: %s; retrying", e)
+                        await asyncio.sleep(Config.BACKFILL_BACKOFF_SEC * 2 ** (retries - 1))
+                        continue
+                    retries = 0
+                    if not chunk:
+                        break
+                    await pages.put(chunk)
+                    since_ms = int(chunk[-1][0]) + ms_per_tf
+                    if len(chunk) < limit:
+                        break
+            except asyncio.CancelledError:
+                raise
             except Exception as e:
                 logger.exception("fetch_ohlcv error: %s", e)
-                break
+            await pages.put(None)
 
-        if not all_rows:
+        producer = asyncio.create_task(produce(since_ms))
+        saved = inserted = updated = 0
+        try:
+            while True:
+                chunk = await pages.get()
+                if chunk is None:
+                    break
+                df = self.page_to_frame(chunk)
+                res = await asyncio.to_thread(self.db.upsert_ohlcv_bulk, symbol, timeframe, df, "binance")
+                saved += len(df)
+                inserted += res["inserted"]
+                updated += res["updated"]
+        finally:
+            producer.cancel()
+
+        if not saved:
             logger.info("No new candles for %s %s", symbol, timeframe)
             return 0
-
-        full_df = pd.concat(all_rows).sort_index()
-        saved = self.db.upsert_ohlcv(symbol, timeframe, full_df, source="binance")
-        logger.info("Saved %s candles for %s %s", saved, symbol, timeframe)
-        return saved
\ No newline at end of file
+        logger.info("Saved %s candles for %s %s (inserted=%d updated=%d)", saved, symbol, timeframe, inserted, updated)
+        return saved
@@ -2,22 +2,245 @@ import sqlite3
 import os
 import json
 from datetime import datetime, timedelta
+import numpy as np
 import pandas as pd
 from config import Config
+from ohlcv_store import ColumnarOHLCVStore, columnar_dir, to_epoch_ms, index_to_ms, ms_to_index, empty_ohlcv_frame
+from ohlcv_cache import OHLCVCache
+from ohlcv_resample import TF_TO_MS
+from model_registry import ModelRegistry
+from write_queue import WriteBehindQueue
 import logging
 import joblib
 import io
+import atexit
+import queue
+import threading
+import time
+from concurrent.futures import Future
 
 logger = logging.getLogger("db")
 
+# PRAGMA user_version, начиная с которой свечи живут в candles (без historical_data)
+CANDLES_SCHEMA_VERSION = 2
+_OHLCV_DIFFERS = ("{a}.open IS NOT {b}.open OR {a}.high IS NOT {b}.high OR {a}.low IS NOT {b}.low"
+                  " OR {a}.close IS NOT {b}.close OR {a}.volume IS NOT {b}.volume")
+# текстовый формат historical_data (как у адаптера sqlite3 для datetime) <-> epoch-ms
+_MS_TO_TEXT = "strftime('%Y-%m-%d %H:%M:%S', {col} / 1000, 'unixepoch')"
+_TEXT_TO_MS = "CAST(strftime('%s', {col}) AS INTEGER) * 1000"
+
+def _ms_to_dt(ms):
+    # epoch-ms -> naive UTC datetime, как entry_time/exit_time у живых сделок
+    return datetime(1970, 1, 1) + timedelta(milliseconds=int(ms))
+
+def _is_lock_error(e):
+    msg = str(e).lower()
+    return "locked" in msg or "busy" in msg
+
+def _legacy_dropped(e):
+    # чтение выбрало historical_data до конца миграции, а выполнилось после DROP: всё уже в candles
+    return "no such table: historical_data" in str(e)
+
+class PooledCursor(sqlite3.Cursor):
+    # execute/executemany с повтором при "database is locked" (после исчерпания busy_timeout)
+    def execute(self, sql, parameters=()):
+        return self.connection._pool._retry_locked(super().execute, sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        if not isinstance(seq_of_parameters, (list, tuple)):
+            seq_of_parameters = list(seq_of_parameters)
+        return self.connection._pool._retry_locked(super().executemany, sql, seq_of_parameters)
+
+class PooledConnection(sqlite3.Connection):
+    # close() не закрывает соединение, а возвращает его в пул
+    _pool = None
+
+    def cursor(self, factory=None):
+        return super().cursor(factory or PooledCursor)
+
+    def commit(self):
+        return self._pool._retry_locked(super().commit)
+
+    def close(self):
+        self._pool.release(self)
+
+    def close_physical(self):
+        sqlite3.Connection.close(self)
+
+class ConnectionPool:
+    def __init__(self, db_path, max_size=None, timeout=None):
+        self.db_path = db_path
+        self.max_size = max(1, max_size or Config.DB_POOL_SIZE)
+        self.timeout = timeout or Config.DB_POOL_TIMEOUT
+        self._idle = queue.LifoQueue()
+        self._all = []
+        self._lock = threading.Lock()
+        # поток -> [conn, depth]: вложенные checkout в одном потоке получают то же соединение
+        self._local = threading.local()
+        self._stats = {"created": 0, "checkouts": 0, "reentrant": 0, "waits": 0, "wait_time_sec": 0.0, "lock_retries": 0}
+
+    def _connect(self):
+        conn = sqlite3.connect(
+            self.db_path,
+            detect_types=sqlite3.PARSE_DECLTYPES | sqlite3.PARSE_COLNAMES,
+            timeout=Config.DB_BUSY_TIMEOUT_MS / 1000.0,
+            check_same_thread=False,
+            factory=PooledConnection,
+        )
+        conn._pool = self
+        # настраиваем один раз на всё время жизни соединения
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(f"PRAGMA mmap_size={int(Config.DB_MMAP_SIZE)}")
+        conn.execute(f"PRAGMA cache_size=-{int(Config.DB_CACHE_SIZE_KB)}")
+        conn.execute(f"PRAGMA busy_timeout={int(Config.DB_BUSY_TIMEOUT_MS)}")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        return conn
+
+    def acquire(self):
+        held = getattr(self._local, "held", None)
+        if held:
+            held[1] += 1
+            with self._lock:
+                self._stats["checkouts"] += 1
+                self._stats["reentrant"] += 1
+            return held[0]
+        conn = None
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                create = len(self._all) < self.max_size
+                if create:
+                    self._stats["created"] += 1
+                    self._all.append(None)  # резервируем слот до окончания connect
+            if create:
+                try:
+                    conn = self._connect()
+                except Exception:
+                    with self._lock:
+                        self._all.remove(None)
+                    raise
+                with self._lock:
+                    self._all[self._all.index(None)] = conn
+            else:
+                t0 = time.perf_counter()
+                try:
+                    conn = self._idle.get(timeout=self.timeout)
+                except queue.Empty:
+                    raise sqlite3.OperationalError(f"connection pool exhausted ({self.max_size}) after {self.timeout}s")
+                finally:
+                    with self._lock:
+                        self._stats["waits"] += 1
+                        self._stats["wait_time_sec"] += time.perf_counter() - t0
+        with self._lock:
+            self._stats["checkouts"] += 1
+        self._local.held = [conn, 1]
+        return conn
+
+    def release(self, conn):
+        held = getattr(self._local, "held", None)
+        if not held or held[0] is not conn:
+            return
+        held[1] -= 1
+        if held[1] > 0:
+            return
+        self._local.held = None
+        if conn.in_transaction:
+            # метод упал до commit — не отдаём чужую транзакцию следующему потоку
+            conn.rollback()
+        self._idle.put(conn)
+
+    def _retry_locked(self, fn, *args):
+        delay = 0.05
+        attempt = 0
+        while True:
+            try:
+                return fn(*args)
+            except sqlite3.OperationalError as e:
+                if not _is_lock_error(e) or attempt >= Config.DB_LOCK_RETRIES:
+                    raise
+                attempt += 1
+                with self._lock:
+                    self._stats["lock_retries"] += 1
+                logger.debug("sqlite locked, retry %d: %s", attempt, e)
+                time.sleep(delay)
+                delay = min(delay * 2, 1.0)
+
+    def stats(self):
+        with self._lock:
+            out = dict(self._stats)
+            out.update(max_size=self.max_size, open=len([c for c in self._all if c is not None]), idle=self._idle.qsize())
+        out["in_use"] = out["open"] - out["idle"]
+        return out
+
+    def close_all(self):
+        with self._lock:
+            conns, self._all = [c for c in self._all if c is not None], []
+        while True:
+            try:
+                self._idle.get_nowait()
+            except queue.Empty:
+                break
+        for c in conns:
+            try:
+                c.close_physical()
+            except Exception:
+                pass
+
 class DatabaseManager:
     def __init__(self, db_path=None):
         self.db_path = db_path or Config.DB_PATH
         os.makedirs(os.path.dirname(self.db_path), exist_ok=True) if os.path.dirname(self.db_path) else None
+        self.pool = ConnectionPool(self.db_path)
+        self.columnar = ColumnarOHLCVStore(columnar_dir(self.db_path)) if Config.OHLCV_BACKEND == "columnar" else None
+        self.ohlcv_cache = OHLCVCache() if Config.OHLCV_CACHE_MAX_ROWS > 0 else None
+        self.model_registry = ModelRegistry(self)
+        self._ohlcv_id_cache = {}
+        # кэш get_pairs_status: ключ — кортеж символов, значение — (поколение моделей, результат)
+        self._pairs_status_lock = threading.Lock()
+        self._pairs_status_cache = {}
+        self._models_gen = 0
+        self._candles_ready = False
         self._init_db()
+        # write-behind: мутации (сделки, боты, статусы задач, новости) коммитит один поток пачками
+        self.writer = None
+        if Config.DB_WRITE_BEHIND:
+            self.writer = WriteBehindQueue(self.pool)
+            atexit.register(self.close)
 
     def _conn(self):
-        return sqlite3.connect(self.db_path, detect_types=sqlite3.PARSE_DECLTYPES | sqlite3.PARSE_COLNAMES)
+        return self.pool.acquire()
+
+    def _write(self, fn, *args):
+        # fn(cursor, *args) выполняется в транзакции; в режиме write-behind возвращается Future
+        if self.writer is not None:
+            return self.writer.submit(fn, *args)
+        conn = self._conn()
+        try:
+            c = conn.cursor()
+            c.execute("BEGIN IMMEDIATE")
+            res = fn(c, *args)
+            conn.commit()
+            return res
+        finally:
+            conn.close()
+
+    def flush_writes(self, timeout=None):
+        if self.writer is not None:
+            self.writer.flush(timeout)
+
+    def pool_stats(self):
+        return self.pool.stats()
+
+    def writer_stats(self):
+        return self.writer.stats() if self.writer is not None else None
+
+    def close(self):
+        if self.writer is not None:
+            # дописываем очередь до закрытия соединений
+            self.writer.close()
+        self.pool.close_all()
 
     def _init_db(self):
         conn = self._conn()
@@ -34,21 +257,58 @@ class DatabaseManager:
             created_at DATETIME DEFAULT CURRENT_TIMESTAMP
         );
 
-        CREATE TABLE IF NOT EXISTS historical_data (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            symbol TEXT NOT NULL,
-            timeframe TEXT NOT NULL,
-            open_time DATETIME NOT NULL,
+        CREATE TABLE IF NOT EXISTS ohlcv_symbols (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL UNIQUE
+        );
+
+        CREATE TABLE IF NOT EXISTS ohlcv_timeframes (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL UNIQUE
+        );
+
+        -- одна B-tree на свечу: кластеризация по (пара, ТФ, время), время — int64 epoch-ms
+        CREATE TABLE IF NOT EXISTS candles (
+            symbol_id INTEGER NOT NULL,
+            tf_id INTEGER NOT NULL,
+            open_time_ms INTEGER NOT NULL,
             open REAL NOT NULL,
             high REAL NOT NULL,
             low REAL NOT NULL,
             close REAL NOT NULL,
             volume REAL NOT NULL,
             source TEXT DEFAULT 'binance',
-            UNIQUE(symbol, timeframe, open_time)
-        );
+            PRIMARY KEY(symbol_id, tf_id, open_time_ms)
+        ) WITHOUT ROWID;
 
-        CREATE INDEX IF NOT EXISTS idx_hist_sym_tf_time ON historical_data(symbol,timeframe,open_time);
+        -- индекс дыр в истории свечей: [gap_start_ms, gap_end_ms) — отсутствующие свечи между соседними
+        -- сохранёнными; status: open | unfillable (биржа не отдала данных за этот интервал)
+        CREATE TABLE IF NOT EXISTS candle_gaps (
+            symbol_id INTEGER NOT NULL,
+            tf_id INTEGER NOT NULL,
+            gap_start_ms INTEGER NOT NULL,
+            gap_end_ms INTEGER NOT NULL,
+            missing INTEGER NOT NULL,
+            status TEXT NOT NULL DEFAULT 'open',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            detected_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY(symbol_id, tf_id, gap_start_ms)
+        ) WITHOUT ROWID;
+
+        CREATE TABLE IF NOT EXISTS candle_coverage (
+            symbol_id INTEGER NOT NULL,
+            tf_id INTEGER NOT NULL,
+            first_ms INTEGER NOT NULL,
+            last_ms INTEGER NOT NULL,
+            candles INTEGER NOT NULL,
+            scanned_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY(symbol_id, tf_id)
+        ) WITHOUT ROWID;
+
+        CREATE TABLE IF NOT EXISTS schema_meta (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        );
 
         CREATE TABLE IF NOT EXISTS models (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -62,9 +322,21 @@ class DatabaseManager:
             classes_blob BLOB,
             features JSON,
             created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            version INTEGER NOT NULL DEFAULT 0,
+            updated_at DATETIME,
             UNIQUE(symbol, timeframe)
         );
 
+        -- индикаторы признаков: symbol='*' — общие настройки, конкретный символ переопределяет их
+        CREATE TABLE IF NOT EXISTS indicator_settings (
+            symbol TEXT NOT NULL,
+            indicator TEXT NOT NULL,
+            enabled INTEGER NOT NULL DEFAULT 1,
+            params JSON,
+            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY(symbol, indicator)
+        ) WITHOUT ROWID;
+
         CREATE TABLE IF NOT EXISTS training_jobs (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             symbol TEXT NOT NULL,
@@ -76,6 +348,23 @@ class DatabaseManager:
             updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
         );
 
+        CREATE TABLE IF NOT EXISTS sync_jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            symbols TEXT NOT NULL,
+            timeframes TEXT NOT NULL,
+            years INTEGER NOT NULL,
+            status TEXT NOT NULL,
+            progress REAL DEFAULT 0,
+            candles INTEGER DEFAULT 0,
+            candles_per_sec REAL DEFAULT 0,
+            message TEXT,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            started_at DATETIME,
+            finished_at DATETIME,
+            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        );
+        CREATE INDEX IF NOT EXISTS idx_sync_jobs_status ON sync_jobs(status);
+
         CREATE TABLE IF NOT EXISTS trades (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             symbol TEXT NOT NULL,
@@ -86,9 +375,66 @@ class DatabaseManager:
             pnl_percent REAL,
             entry_time DATETIME,
             exit_time DATETIME,
-            status TEXT NOT NULL DEFAULT 'closed'
+            status TEXT NOT NULL DEFAULT 'closed',
+            network TEXT NOT NULL DEFAULT 'testnet'
         );
 
+        CREATE TABLE IF NOT EXISTS trade_summary (
+            network TEXT NOT NULL,
+            symbol TEXT NOT NULL,
+            open_positions INTEGER NOT NULL DEFAULT 0,
+            closed_count INTEGER NOT NULL DEFAULT 0,
+            win_count INTEGER NOT NULL DEFAULT 0,
+            pnl_sum REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY(network, symbol)
+        ) WITHOUT ROWID;
+
+        -- walk-forward бэктесты (см. backtest.py): прогон, сделки, метрики по символу (symbol='*' — по всем)
+        CREATE TABLE IF NOT EXISTS backtest_runs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            symbols TEXT NOT NULL,
+            timeframes TEXT NOT NULL,
+            params JSON,
+            status TEXT NOT NULL,
+            message TEXT,
+            duration_sec REAL,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            finished_at DATETIME,
+            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        );
+
+        CREATE TABLE IF NOT EXISTS backtest_trades (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            run_id INTEGER NOT NULL,
+            symbol TEXT NOT NULL,
+            side TEXT NOT NULL,
+            entry_time DATETIME,
+            exit_time DATETIME,
+            entry_price REAL,
+            exit_price REAL,
+            quantity REAL,
+            pnl_percent REAL,
+            confidence REAL
+        );
+        CREATE INDEX IF NOT EXISTS idx_backtest_trades_run ON backtest_trades(run_id, symbol, entry_time);
+
+        CREATE TABLE IF NOT EXISTS backtest_metrics (
+            run_id INTEGER NOT NULL,
+            symbol TEXT NOT NULL,
+            bars INTEGER,
+            trades INTEGER,
+            wins INTEGER,
+            win_rate REAL,
+            pnl_percent REAL,
+            avg_pnl_percent REAL,
+            max_drawdown REAL,
+            sharpe REAL,
+            accuracy REAL,
+            retrains INTEGER,
+            extra JSON,
+            PRIMARY KEY(run_id, symbol)
+        ) WITHOUT ROWID;
+
         CREATE TABLE IF NOT EXISTS bots (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             symbol TEXT NOT NULL,
@@ -108,10 +454,78 @@ class DatabaseManager:
             symbols TEXT, -- CSV
             UNIQUE(url)
         );
+        CREATE INDEX IF NOT EXISTS idx_news_published ON news(published_at);
         """)
+        # Колонки, добавленные после первой версии схемы
+        self._ensure_column(c, "models", "version", "INTEGER NOT NULL DEFAULT 0")
+        self._ensure_column(c, "models", "updated_at", "DATETIME")
+        self._ensure_column(c, "models", "indicators", "JSON")
+        self._ensure_column(c, "trades", "network", "TEXT NOT NULL DEFAULT 'testnet'")
+        for col, decl in (("priority", "TEXT"), ("queue_depth", "INTEGER"), ("wait_sec", "REAL"),
+                          ("tasks_total", "INTEGER"), ("tasks_done", "INTEGER"), ("finished_at", "DATETIME")):
+            self._ensure_column(c, "training_jobs", col, decl)
+        # sync_jobs.kind: sync — догрузка истории, repair — дыры из candle_gaps, scan — пересканирование дыр
+        self._ensure_column(c, "sync_jobs", "kind", "TEXT NOT NULL DEFAULT 'sync'")
+        self._ensure_column(c, "sync_jobs", "result", "JSON")
+        c.execute("SELECT 1 FROM schema_meta WHERE key='trade_summary_built'")
+        if c.fetchone() is None:
+            # сводка появилась позже таблицы trades — один раз пересобираем её по истории
+            self._rebuild_trade_summary(c)
+            c.execute("INSERT INTO schema_meta(key,value) VALUES('trade_summary_built','1')")
+        self._news_fts = self._ensure_news_fts(c)
+        self._candles_ready = self._detect_candles_schema(c)
         conn.commit()
         conn.close()
         logger.info("Database initialized at %s", self.db_path)
+        if not self._candles_ready:
+            logger.info("historical_data -> candles migration pending: %s", self.candles_migration_status())
+
+    def _detect_candles_schema(self, c):
+        # historical_data есть только в БД, созданных до схемы v2; пустую просто удаляем
+        c.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='historical_data'")
+        if c.fetchone() is not None:
+            c.execute("SELECT 1 FROM historical_data LIMIT 1")
+            if c.fetchone() is not None:
+                return False
+            c.execute("DROP TABLE historical_data")
+        c.execute(f"PRAGMA user_version={CANDLES_SCHEMA_VERSION}")
+        return True
+
+    def _ensure_news_fts(self, c):
+        # Полнотекстовый индекс по title/summary поверх news (external content, синхронизация триггерами)
+        c.execute("SELECT 1 FROM sqlite_master WHERE name='news_fts'")
+        existed = c.fetchone() is not None
+        try:
+            c.executescript("""
+            CREATE VIRTUAL TABLE IF NOT EXISTS news_fts USING fts5(
+                title, summary, content='news', content_rowid='id', tokenize='unicode61'
+            );
+            CREATE TRIGGER IF NOT EXISTS news_fts_ai AFTER INSERT ON news BEGIN
+                INSERT INTO news_fts(rowid, title, summary) VALUES (new.id, new.title, new.summary);
+            END;
+            CREATE TRIGGER IF NOT EXISTS news_fts_ad AFTER DELETE ON news BEGIN
+                INSERT INTO news_fts(news_fts, rowid, title, summary) VALUES ('delete', old.id, old.title, old.summary);
+            END;
+            CREATE TRIGGER IF NOT EXISTS news_fts_au AFTER UPDATE OF title, summary ON news BEGIN
+                INSERT INTO news_fts(news_fts, rowid, title, summary) VALUES ('delete', old.id, old.title, old.summary);
+                INSERT INTO news_fts(rowid, title, summary) VALUES (new.id, new.title, new.summary);
+            END;
+            """)
+        except sqlite3.OperationalError as e:
+            # сборка SQLite без FTS5 — поиск деградирует до LIKE
+            logger.warning("FTS5 unavailable, news search falls back to LIKE: %s", e)
+            return False
+        if not existed:
+            # индекс появился позже таблицы news — один раз индексируем уже сохранённые статьи
+            c.execute("INSERT INTO news_fts(news_fts) VALUES('rebuild')")
+            c.connection.commit()
+        return True
+
+    def _ensure_column(self, c, table, column, decl):
+        c.execute(f"PRAGMA table_info({table})")
+        if column not in [r[1] for r in c.fetchall()]:
+            c.execute(f"ALTER TABLE {table} ADD COLUMN {column} {decl}")
+            logger.info("schema: added %s.%s", table, column)
 
     # API keys
     def save_api_keys(self, network, api_key, api_secret):
@@ -134,170 +548,879 @@ class DatabaseManager:
         return None
 
     # Historical data
+    # Свечи хранятся в WITHOUT ROWID таблице candles, кластеризованной по (symbol_id, tf_id, open_time_ms).
+    # Старые БД со схемой historical_data переводятся онлайн-миграцией (см. run_candles_migration):
+    # пока она идёт, запись идёт в обе таблицы, а чтение — из historical_data.
+    def _ohlcv_ids(self, c, symbol, timeframe, create=False):
+        key = (symbol, timeframe)
+        ids = self._ohlcv_id_cache.get(key)
+        if ids:
+            return ids
+        out = []
+        for table, name in (("ohlcv_symbols", symbol), ("ohlcv_timeframes", timeframe)):
+            c.execute(f"SELECT id FROM {table} WHERE name=?", (name,))
+            row = c.fetchone()
+            if not row and create:
+                # словари коммитятся отдельно, до основной транзакции записи: откат upsert не должен оставить в кэше чужой id
+                c.execute(f"INSERT OR IGNORE INTO {table}(name) VALUES(?)", (name,))
+                c.connection.commit()
+                c.execute(f"SELECT id FROM {table} WHERE name=?", (name,))
+                row = c.fetchone()
+            if not row:
+                return None
+            out.append(row[0])
+        self._ohlcv_id_cache[key] = tuple(out)
+        return tuple(out)
+
     def upsert_ohlcv(self, symbol, timeframe, df: pd.DataFrame, source="binance"):
         conn = self._conn()
         c = conn.cursor()
+        sid, tid = self._ohlcv_ids(c, symbol, timeframe, create=True)
+        c.execute("BEGIN IMMEDIATE")
+        legacy = not self._candles_ready
         saved = 0
         for ts, r in df.iterrows():
+            ts = pd.Timestamp(ts)
+            vals = (float(r.open), float(r.high), float(r.low), float(r.close), float(r.volume), source)
             c.execute("""
-                INSERT INTO historical_data(symbol,timeframe,open_time,open,high,low,close,volume,source)
+                INSERT INTO candles(symbol_id,tf_id,open_time_ms,open,high,low,close,volume,source)
                 VALUES(?,?,?,?,?,?,?,?,?)
-                ON CONFLICT(symbol,timeframe,open_time) DO UPDATE SET open=excluded.open,high=excluded.high,low=excluded.low,close=excluded.close,volume=excluded.volume,source=excluded.source
-            """, (symbol, timeframe, ts.to_pydatetime() if hasattr(ts, "to_pydatetime") else ts, float(r.open), float(r.high), float(r.low), float(r.close), float(r.volume), source))
+                ON CONFLICT(symbol_id,tf_id,open_time_ms) DO UPDATE SET open=excluded.open,high=excluded.high,low=excluded.low,close=excluded.close,volume=excluded.volume,source=excluded.source
+            """, (sid, tid, to_epoch_ms(ts)) + vals)
+            if legacy:
+                c.execute("""
+                    INSERT INTO historical_data(symbol,timeframe,open_time,open,high,low,close,volume,source)
+                    VALUES(?,?,?,?,?,?,?,?,?)
+                    ON CONFLICT(symbol,timeframe,open_time) DO UPDATE SET open=excluded.open,high=excluded.high,low=excluded.low,close=excluded.close,volume=excluded.volume,source=excluded.source
+                """, (symbol, timeframe, ts.to_pydatetime()) + vals)
             saved += 1
         conn.commit()
         conn.close()
+        if self.columnar is not None:
+            self._columnar_ensure(symbol, timeframe)
+            self.columnar.write(symbol, timeframe, df)
+        if self.ohlcv_cache is not None:
+            self.ohlcv_cache.apply_upsert(symbol, timeframe, df)
         return saved
 
+    def upsert_ohlcv_bulk(self, symbol, timeframe, df: pd.DataFrame, source="binance"):
+        # Векторная загрузка: фрейм -> массивы колонок -> staging-таблица -> один MERGE в одной транзакции.
+        # Строки, совпадающие с уже сохранёнными, не переписываются.
+        counts = {"inserted": 0, "updated": 0, "unchanged": 0}
+        if df is None or df.empty:
+            return counts
+        times = index_to_ms(df.index).tolist()
+        values = df[["open", "high", "low", "close", "volume"]].to_numpy(dtype="float64").T.tolist()
+        rows = list(zip(times, *values))
+
+        conn = self._conn()
+        c = conn.cursor()
+        try:
+            sid, tid = self._ohlcv_ids(c, symbol, timeframe, create=True)
+            # сразу берём блокировку записи: иначе апгрейд read->write после SELECT в WAL падает с "locked"
+            c.execute("BEGIN IMMEDIATE")
+            # флаг читаем под блокировкой: завершение миграции меняет его, удерживая ту же блокировку
+            legacy = not self._candles_ready
+            c.execute("""
+                CREATE TEMP TABLE IF NOT EXISTS ohlcv_stage(
+                    open_time_ms INTEGER PRIMARY KEY, open REAL, high REAL, low REAL, close REAL, volume REAL
+                )
+            """)
+            c.execute("DELETE FROM temp.ohlcv_stage")
+            # при дублях во фрейме побеждает последняя строка, как и при построчном upsert
+            c.executemany("INSERT OR REPLACE INTO temp.ohlcv_stage VALUES(?,?,?,?,?,?)", rows)
+            if legacy:
+                c.execute(f"""
+                    SELECT COUNT(*), COALESCE(SUM(h.open_time IS NULL), 0), COALESCE(SUM(h.open_time IS NOT NULL AND ({_OHLCV_DIFFERS.format(a="h", b="s")} OR h.source IS NOT ?)), 0)
+                    FROM temp.ohlcv_stage s
+                    LEFT JOIN historical_data h ON h.symbol=? AND h.timeframe=? AND h.open_time={_MS_TO_TEXT.format(col="s.open_time_ms")}
+                """, (source, symbol, timeframe))
+            else:
+                c.execute(f"""
+                    SELECT COUNT(*), COALESCE(SUM(h.open_time_ms IS NULL), 0), COALESCE(SUM(h.open_time_ms IS NOT NULL AND ({_OHLCV_DIFFERS.format(a="h", b="s")} OR h.source IS NOT ?)), 0)
+                    FROM temp.ohlcv_stage s
+                    LEFT JOIN candles h ON h.symbol_id=? AND h.tf_id=? AND h.open_time_ms=s.open_time_ms
+                """, (source, sid, tid))
+            total, inserted, updated = c.fetchone()
+            c.execute(f"""
+                INSERT INTO candles(symbol_id,tf_id,open_time_ms,open,high,low,close,volume,source)
+                SELECT ?, ?, s.open_time_ms, s.open, s.high, s.low, s.close, s.volume, ? FROM temp.ohlcv_stage s WHERE true
+                ON CONFLICT(symbol_id,tf_id,open_time_ms) DO UPDATE SET open=excluded.open,high=excluded.high,low=excluded.low,close=excluded.close,volume=excluded.volume,source=excluded.source
+                WHERE {_OHLCV_DIFFERS.format(a="candles", b="excluded")} OR candles.source IS NOT excluded.source
+            """, (sid, tid, source))
+            if legacy:
+                c.execute(f"""
+                    INSERT INTO historical_data(symbol,timeframe,open_time,open,high,low,close,volume,source)
+                    SELECT ?, ?, {_MS_TO_TEXT.format(col="s.open_time_ms")}, s.open, s.high, s.low, s.close, s.volume, ? FROM temp.ohlcv_stage s WHERE true
+                    ON CONFLICT(symbol,timeframe,open_time) DO UPDATE SET open=excluded.open,high=excluded.high,low=excluded.low,close=excluded.close,volume=excluded.volume,source=excluded.source
+                    WHERE {_OHLCV_DIFFERS.format(a="historical_data", b="excluded")} OR historical_data.source IS NOT excluded.source
+                """, (symbol, timeframe, source))
+            c.execute("DELETE FROM temp.ohlcv_stage")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+        if self.columnar is not None:
+            self._columnar_ensure(symbol, timeframe)
+            self.columnar.write(symbol, timeframe, df)
+        if self.ohlcv_cache is not None:
+            self.ohlcv_cache.apply_upsert(symbol, timeframe, df)
+        counts.update(inserted=inserted, updated=updated, unchanged=total - inserted - updated)
+        return counts
+
     def get_last_ohlcv_time(self, symbol, timeframe):
+        conn = self._conn()
+        c = conn.cursor()
+        try:
+            if not self._candles_ready:
+                try:
+                    c.execute("SELECT MAX(open_time) FROM historical_data WHERE symbol=? AND timeframe=?", (symbol, timeframe))
+                    row = c.fetchone()
+                    return pd.Timestamp(row[0]).to_pydatetime() if row and row[0] else None
+                except sqlite3.OperationalError as e:
+                    if not _legacy_dropped(e):
+                        raise
+                    self._candles_ready = True
+            ids = self._ohlcv_ids(c, symbol, timeframe)
+            if not ids:
+                return None
+            # MAX по последней колонке первичного ключа — один seek по кластерному индексу
+            c.execute("SELECT MAX(open_time_ms) FROM candles WHERE symbol_id=? AND tf_id=?", ids)
+            row = c.fetchone()
+        finally:
+            conn.close()
+        return pd.Timestamp(row[0], unit="ms").to_pydatetime() if row and row[0] is not None else None
+
+    def ohlcv_pairs(self):
+        conn = self._conn()
+        c = conn.cursor()
+        try:
+            if not self._candles_ready:
+                try:
+                    c.execute("SELECT DISTINCT symbol, timeframe FROM historical_data ORDER BY symbol, timeframe")
+                    return [(r[0], r[1]) for r in c.fetchall()]
+                except sqlite3.OperationalError as e:
+                    if not _legacy_dropped(e):
+                        raise
+                    self._candles_ready = True
+            c.execute("""
+                SELECT s.name, t.name FROM ohlcv_symbols s, ohlcv_timeframes t
+                WHERE EXISTS(SELECT 1 FROM candles WHERE symbol_id=s.id AND tf_id=t.id)
+                ORDER BY s.name, t.name
+            """)
+            rows = c.fetchall()
+        finally:
+            conn.close()
+        return [(r[0], r[1]) for r in rows]
+
+    # Gaps
+    def _tf_steps_cte(self):
+        return "tf_steps(name, step) AS (VALUES " + ",".join(f"('{tf}', {ms})" for tf, ms in TF_TO_MS.items()) + ")"
+
+    def scan_candle_gaps(self, symbol=None, timeframe=None):
+        # Один проход оконной функцией LEAD по кластерному индексу: разница соседних open_time_ms больше шага TF — дыра.
+        # Ряд в pandas не грузится; найденные дыры и покрытие пары сохраняются в candle_gaps/candle_coverage.
+        if not self._candles_ready:
+            return {"skipped": "candles migration pending"}
+        conn = self._conn()
+        c = conn.cursor()
+        pairs_n = gaps = missing = 0
+        try:
+            c.execute("""
+                SELECT s.id, t.id, t.name FROM ohlcv_symbols s, ohlcv_timeframes t
+                WHERE (? IS NULL OR s.name = ?) AND (? IS NULL OR t.name = ?)
+            """, (symbol, symbol, timeframe, timeframe))
+            # по паре за раз: диапазон первичного ключа уже упорядочен, окну не нужна сортировка
+            pairs = [(sid, tid, TF_TO_MS[tf]) for sid, tid, tf in c.fetchall() if tf in TF_TO_MS]
+            c.execute("CREATE TEMP TABLE IF NOT EXISTS gap_scan(open_time_ms INTEGER, nxt INTEGER)")
+            for sid, tid, step in pairs:
+                # транзакция на пару: между парами блокировку записи получают загрузка свечей и write-behind
+                c.execute("BEGIN IMMEDIATE")
+                try:
+                    c.execute("DELETE FROM temp.gap_scan")
+                    # свечи, за которыми идёт дыра
+                    c.execute("""
+                        INSERT INTO temp.gap_scan
+                        SELECT open_time_ms, nxt FROM (
+                            SELECT open_time_ms, LEAD(open_time_ms) OVER (ORDER BY open_time_ms) AS nxt
+                            FROM candles WHERE symbol_id=? AND tf_id=?
+                        ) WHERE nxt - open_time_ms > ?
+                    """, (sid, tid, step))
+                    c.execute("DELETE FROM candle_coverage WHERE symbol_id=? AND tf_id=?", (sid, tid))
+                    c.execute("""
+                        INSERT INTO candle_coverage(symbol_id, tf_id, first_ms, last_ms, candles)
+                        SELECT symbol_id, tf_id, MIN(open_time_ms), MAX(open_time_ms), COUNT(*)
+                        FROM candles WHERE symbol_id=? AND tf_id=? GROUP BY symbol_id, tf_id
+                    """, (sid, tid))
+                    pairs_n += c.rowcount
+                    # закрытые дыры удаляем; статус/попытки уже известных сохраняются
+                    c.execute("""
+                        DELETE FROM candle_gaps WHERE symbol_id=? AND tf_id=? AND NOT EXISTS (
+                            SELECT 1 FROM temp.gap_scan g WHERE g.open_time_ms + ? = candle_gaps.gap_start_ms
+                        )
+                    """, (sid, tid, step))
+                    c.execute("""
+                        INSERT INTO candle_gaps(symbol_id, tf_id, gap_start_ms, gap_end_ms, missing)
+                        SELECT ?, ?, open_time_ms + ?, nxt, (nxt - open_time_ms) / ? - 1
+                        FROM temp.gap_scan WHERE true
+                        ON CONFLICT(symbol_id, tf_id, gap_start_ms) DO UPDATE SET
+                            gap_end_ms = excluded.gap_end_ms, missing = excluded.missing
+                    """, (sid, tid, step, step))
+                    c.execute("SELECT COUNT(*), COALESCE(SUM((nxt - open_time_ms) / ? - 1), 0) FROM temp.gap_scan", (step,))
+                    n, m = c.fetchone()
+                    conn.commit()
+                except Exception:
+                    conn.rollback()
+                    raise
+                gaps += n
+                missing += m
+            c.execute("DROP TABLE IF EXISTS temp.gap_scan")
+        finally:
+            conn.close()
+        return {"pairs": pairs_n, "gaps": gaps, "missing": missing}
+
+    def list_candle_gaps(self, symbol=None, timeframe=None, status="open", limit=1000):
         conn = self._conn()
         c = conn.cursor()
         c.execute("""
-            SELECT MAX(open_time) FROM historical_data WHERE symbol=? AND timeframe=?
-        """, (symbol, timeframe))
-        row = c.fetchone()
+            SELECT s.name, t.name, g.gap_start_ms, g.gap_end_ms, g.missing, g.status, g.attempts
+            FROM candle_gaps g JOIN ohlcv_symbols s ON s.id = g.symbol_id JOIN ohlcv_timeframes t ON t.id = g.tf_id
+            WHERE (? IS NULL OR s.name = ?) AND (? IS NULL OR t.name = ?) AND (? IS NULL OR g.status = ?)
+            ORDER BY s.name, t.name, g.gap_start_ms LIMIT ?
+        """, (symbol, symbol, timeframe, timeframe, status, status, int(limit)))
+        rows = c.fetchall()
         conn.close()
-        return row[0] if row and row[0] else None
+        return [{"symbol": r[0], "timeframe": r[1], "start_ms": r[2], "end_ms": r[3],
+                 "missing": r[4], "status": r[5], "attempts": r[6]} for r in rows]
 
-    def load_ohlcv(self, symbol, timeframe, since=None, limit=None):
+    def mark_candle_gap(self, symbol, timeframe, start_ms, status):
         conn = self._conn()
-        q = "SELECT open_time, open, high, low, close, volume FROM historical_data WHERE symbol=? AND timeframe=?"
-        params = [symbol, timeframe]
-        if since:
-            q += " AND open_time >= ?"
-            params.append(since)
-        q += " ORDER BY open_time ASC"
-        if limit:
-            q += " LIMIT ?"
-            params.append(limit)
-        df = pd.read_sql_query(q, conn, params=params, parse_dates=["open_time"], index_col="open_time")
+        c = conn.cursor()
+        ids = self._ohlcv_ids(c, symbol, timeframe)
+        if ids:
+            c.execute("UPDATE candle_gaps SET status=?, attempts=attempts+1 WHERE symbol_id=? AND tf_id=? AND gap_start_ms=?",
+                      (status, ids[0], ids[1], int(start_ms)))
+            conn.commit()
         conn.close()
-        return df
+
+    def candle_completeness(self):
+        # по итогам последнего scan_candle_gaps: сколько свечей есть из ожидаемых между первой и последней
+        conn = self._conn()
+        c = conn.cursor()
+        c.execute(f"""
+            WITH {self._tf_steps_cte()}
+            SELECT s.name, t.name, v.first_ms, v.last_ms, v.candles, (v.last_ms - v.first_ms) / ts.step + 1, v.scanned_at,
+                   COALESCE(SUM(g.status = 'open'), 0), COALESCE(SUM(CASE WHEN g.status = 'open' THEN g.missing END), 0),
+                   COALESCE(SUM(CASE WHEN g.status = 'unfillable' THEN g.missing END), 0)
+            FROM candle_coverage v
+            JOIN ohlcv_symbols s ON s.id = v.symbol_id JOIN ohlcv_timeframes t ON t.id = v.tf_id
+            JOIN tf_steps ts ON ts.name = t.name
+            LEFT JOIN candle_gaps g ON g.symbol_id = v.symbol_id AND g.tf_id = v.tf_id
+            GROUP BY v.symbol_id, v.tf_id ORDER BY s.name, t.name
+        """)
+        rows = c.fetchall()
+        conn.close()
+        return [{
+            "symbol": r[0], "timeframe": r[1],
+            "first": pd.Timestamp(r[2], unit="ms").isoformat(), "last": pd.Timestamp(r[3], unit="ms").isoformat(),
+            "candles": r[4], "expected": r[5], "completeness": round(r[4] / r[5], 6) if r[5] else None,
+            "open_gaps": r[7], "missing_open": r[8], "missing_unfillable": r[9], "scanned_at": r[6],
+        } for r in rows]
+
+    def _columnar_ensure(self, symbol, timeframe):
+        # Пара ещё не выгружена в колоночный файл — засеваем его из SQLite
+        if not self.columnar.exists(symbol, timeframe):
+            df = self.load_ohlcv_sqlite(symbol, timeframe)
+            if not df.empty:
+                self.columnar.write(symbol, timeframe, df)
+
+    def load_ohlcv(self, symbol, timeframe, since=None, limit=None):
+        if self.ohlcv_cache is not None:
+            return self.ohlcv_cache.load(symbol, timeframe, since, limit, self._load_ohlcv_backend)
+        return self._load_ohlcv_backend(symbol, timeframe, since=since, limit=limit)
+
+    def _load_ohlcv_backend(self, symbol, timeframe, since=None, limit=None):
+        if self.columnar is not None:
+            self._columnar_ensure(symbol, timeframe)
+            return self.columnar.read(symbol, timeframe, since=since, limit=limit)
+        return self.load_ohlcv_sqlite(symbol, timeframe, since=since, limit=limit)
+
+    def load_ohlcv_sqlite(self, symbol, timeframe, since=None, limit=None):
+        conn = self._conn()
+        c = conn.cursor()
+        try:
+            if not self._candles_ready:
+                q = "SELECT open_time, open, high, low, close, volume FROM historical_data WHERE symbol=? AND timeframe=?"
+                params = [symbol, timeframe]
+                if since:
+                    q += " AND open_time >= ?"
+                    params.append(pd.Timestamp(since).to_pydatetime())
+                q += " ORDER BY open_time ASC"
+                if limit:
+                    q += " LIMIT ?"
+                    params.append(limit)
+                try:
+                    return pd.read_sql_query(q, conn, params=params, parse_dates=["open_time"], index_col="open_time")
+                except (sqlite3.OperationalError, pd.errors.DatabaseError) as e:
+                    # pandas оборачивает ошибку sqlite в DatabaseError
+                    if not _legacy_dropped(e):
+                        raise
+                    self._candles_ready = True
+            ids = self._ohlcv_ids(c, symbol, timeframe)
+            if not ids:
+                return empty_ohlcv_frame()
+            q = "SELECT open_time_ms, open, high, low, close, volume FROM candles WHERE symbol_id=? AND tf_id=?"
+            params = list(ids)
+            if since:
+                q += " AND open_time_ms >= ?"
+                params.append(to_epoch_ms(since))
+            q += " ORDER BY open_time_ms ASC"
+            if limit:
+                q += " LIMIT ?"
+                params.append(int(limit))
+            c.execute(q, params)
+            rows = c.fetchall()
+        finally:
+            conn.close()
+        if not rows:
+            return empty_ohlcv_frame()
+        arr = np.array(rows, dtype="float64")
+        # epoch-ms < 2^53, поэтому проход через float64 точен
+        return pd.DataFrame(arr[:, 1:], index=ms_to_index(arr[:, 0].astype("int64")), columns=["open", "high", "low", "close", "volume"])
+
+    # Миграция historical_data -> candles
+    def candles_migration_pending(self):
+        return not self._candles_ready
+
+    def candles_migration_status(self):
+        conn = self._conn()
+        c = conn.cursor()
+        try:
+            if self._candles_ready:
+                return {"schema_version": CANDLES_SCHEMA_VERSION, "pending": False}
+            c.execute("SELECT value FROM schema_meta WHERE key='candles_migration_last_id'")
+            row = c.fetchone()
+            last_id = int(row[0]) if row else 0
+            try:
+                c.execute("SELECT MAX(id) FROM historical_data")
+            except sqlite3.OperationalError as e:
+                if not _legacy_dropped(e):
+                    raise
+                self._candles_ready = True
+                return {"schema_version": CANDLES_SCHEMA_VERSION, "pending": False}
+            max_id = c.fetchone()[0] or 0
+        finally:
+            conn.close()
+        return {"schema_version": CANDLES_SCHEMA_VERSION - 1, "pending": True, "copied_until_id": last_id, "max_id": max_id,
+                "progress": (last_id / max_id) if max_id else 1.0}
+
+    def migrate_candles_step(self, chunk_rows=None):
+        # Копирует очередной диапазон id из historical_data в candles одной короткой транзакцией.
+        # Возвращает число обработанных строк; 0 — миграция завершена (старая таблица удалена).
+        chunk_rows = chunk_rows or Config.CANDLES_MIGRATION_CHUNK
+        conn = self._conn()
+        c = conn.cursor()
+        try:
+            c.execute("BEGIN IMMEDIATE")
+            if self._candles_ready:
+                conn.rollback()
+                return 0
+            c.execute("SELECT value FROM schema_meta WHERE key='candles_migration_last_id'")
+            row = c.fetchone()
+            last_id = int(row[0]) if row else 0
+            c.execute("SELECT COUNT(*), MAX(id) FROM (SELECT id FROM historical_data WHERE id > ? ORDER BY id LIMIT ?)", (last_id, chunk_rows))
+            n, upto = c.fetchone()
+            if not n:
+                c.execute("DROP INDEX IF EXISTS idx_hist_sym_tf_time")
+                c.execute("DROP TABLE historical_data")
+                c.execute("DELETE FROM schema_meta WHERE key='candles_migration_last_id'")
+                c.execute(f"PRAGMA user_version={CANDLES_SCHEMA_VERSION}")
+                # флаг — до commit: писатель, ждущий блокировку, сразу после неё не должен выбрать historical_data.
+                # Если commit не пройдёт, candles уже содержит всю историю — читать и писать туда корректно
+                self._candles_ready = True
+                conn.commit()
+                if self.ohlcv_cache is not None:
+                    self.ohlcv_cache.invalidate()
+                logger.info("candles migration finished, historical_data dropped")
+                return 0
+            c.execute("INSERT OR IGNORE INTO ohlcv_symbols(name) SELECT DISTINCT symbol FROM historical_data WHERE id > ? AND id <= ?", (last_id, upto))
+            c.execute("INSERT OR IGNORE INTO ohlcv_timeframes(name) SELECT DISTINCT timeframe FROM historical_data WHERE id > ? AND id <= ?", (last_id, upto))
+            # DO NOTHING: строки, уже записанные в candles двойной записью, новее копируемых
+            c.execute(f"""
+                INSERT INTO candles(symbol_id,tf_id,open_time_ms,open,high,low,close,volume,source)
+                SELECT s.id, t.id, {_TEXT_TO_MS.format(col="h.open_time")}, h.open, h.high, h.low, h.close, h.volume, h.source
+                FROM historical_data h
+                JOIN ohlcv_symbols s ON s.name=h.symbol
+                JOIN ohlcv_timeframes t ON t.name=h.timeframe
+                WHERE h.id > ? AND h.id <= ?
+                ON CONFLICT(symbol_id,tf_id,open_time_ms) DO NOTHING
+            """, (last_id, upto))
+            c.execute("INSERT OR REPLACE INTO schema_meta(key,value) VALUES('candles_migration_last_id', ?)", (str(upto),))
+            conn.commit()
+            return n
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    def run_candles_migration(self, chunk_rows=None, pause_sec=None, vacuum=False):
+        pause_sec = Config.CANDLES_MIGRATION_PAUSE if pause_sec is None else pause_sec
+        total = 0
+        t0 = time.perf_counter()
+        while True:
+            n = self.migrate_candles_step(chunk_rows)
+            if not n:
+                break
+            total += n
+            logger.info("candles migration: %d rows copied (%.0f rows/sec)", total, total / max(time.perf_counter() - t0, 1e-9))
+            # пауза между чанками отдаёт блокировку записи ботам/загрузке
+            time.sleep(pause_sec)
+        if vacuum:
+            conn = self._conn()
+            conn.execute("VACUUM")
+            conn.close()
+        return total
 
     # Models
-    def save_model(self, symbol, timeframe, algo, model, classes, features, last_full_end=None, last_incr_end=None, metrics=None):
+    def save_model(self, symbol, timeframe, algo, model, classes, features, last_full_end=None, last_incr_end=None, metrics=None, indicators=None):
         conn = self._conn()
         c = conn.cursor()
         # serialize
         mbuf = io.BytesIO(); joblib.dump(model, mbuf)
         cbuf = io.BytesIO(); joblib.dump(classes, cbuf)
         c.execute("""
-            INSERT INTO models(symbol,timeframe,algo,metrics,last_full_train_end,last_incremental_train_end,model_blob,classes_blob,features)
-            VALUES(?,?,?,?,?,?,?,?,?)
+            INSERT INTO models(symbol,timeframe,algo,metrics,last_full_train_end,last_incremental_train_end,model_blob,classes_blob,features,indicators,version,updated_at)
+            VALUES(?,?,?,?,?,?,?,?,?,?,1,CURRENT_TIMESTAMP)
             ON CONFLICT(symbol,timeframe) DO UPDATE SET 
                 algo=excluded.algo, metrics=excluded.metrics, last_full_train_end=excluded.last_full_train_end,
                 last_incremental_train_end=excluded.last_incremental_train_end, model_blob=excluded.model_blob,
-                classes_blob=excluded.classes_blob, features=excluded.features
-        """, (symbol, timeframe, algo, json.dumps(metrics or {}), last_full_end, last_incr_end, mbuf.getvalue(), cbuf.getvalue(), json.dumps(features)))
+                classes_blob=excluded.classes_blob, features=excluded.features, indicators=excluded.indicators,
+                version=models.version+1, updated_at=CURRENT_TIMESTAMP
+        """, (symbol, timeframe, algo, json.dumps(metrics or {}), last_full_end, last_incr_end, mbuf.getvalue(), cbuf.getvalue(), json.dumps(features),
+              json.dumps(indicators) if indicators is not None else None))
         conn.commit()
         conn.close()
+        self.model_registry.invalidate(symbol, timeframe)
+        with self._pairs_status_lock:
+            self._models_gen += 1
 
     def load_model(self, symbol, timeframe):
         conn = self._conn()
         c = conn.cursor()
-        c.execute("SELECT algo, metrics, last_full_train_end, last_incremental_train_end, model_blob, classes_blob, features FROM models WHERE symbol=? AND timeframe=?", (symbol, timeframe))
+        c.execute("SELECT algo, metrics, last_full_train_end, last_incremental_train_end, model_blob, classes_blob, features, indicators, version FROM models WHERE symbol=? AND timeframe=?", (symbol, timeframe))
         row = c.fetchone()
         conn.close()
         if not row:
             return None
-        algo, metrics, full_end, incr_end, mb, cb, feats = row
+        algo, metrics, full_end, incr_end, mb, cb, feats, inds, version = row
         model = joblib.load(io.BytesIO(mb)) if mb else None
         classes = joblib.load(io.BytesIO(cb)) if cb else None
         features = json.loads(feats) if feats else []
         return {
             "algo": algo, "metrics": json.loads(metrics or "{}"), "last_full_train_end": full_end,
-            "last_incremental_train_end": incr_end, "model": model, "classes": classes, "features": features
+            "last_incremental_train_end": incr_end, "model": model, "classes": classes, "features": features,
+            "indicators": json.loads(inds) if inds else None, "version": version
         }
 
-    def get_pairs_status(self, symbols, timeframes):
-        # Return training status for dashboard
+    def get_model_version(self, symbol, timeframe):
         conn = self._conn()
         c = conn.cursor()
+        c.execute("SELECT version FROM models WHERE symbol=? AND timeframe=?", (symbol, timeframe))
+        row = c.fetchone()
+        conn.close()
+        return row[0] if row else None
+
+    def load_model_cached(self, symbol, timeframe):
+        # Десериализованная модель из реестра; перечитывается только при смене версии.
+        # Объект общий для всех потоков — для дообучения используйте load_model.
+        return self.model_registry.get(symbol, timeframe)
+
+    def get_pairs_status(self, symbols, timeframes):
+        # Return training status for dashboard: один сгруппированный запрос + кэш до следующего save_model
+        key = tuple(symbols)
+        with self._pairs_status_lock:
+            gen = self._models_gen
+            cached = self._pairs_status_cache.get(key)
+            if cached is not None and cached[0] == gen:
+                return [dict(r) for r in cached[1]]
+        by_symbol = {}
+        if symbols:
+            conn = self._conn()
+            c = conn.cursor()
+            c.execute(f"""
+                SELECT symbol, MAX(last_full_train_end), MAX(last_incremental_train_end),
+                       AVG(CASE WHEN json_valid(metrics) THEN CAST(json_extract(metrics, '$.accuracy') AS REAL) END)
+                FROM models WHERE symbol IN ({",".join("?" * len(symbols))})
+                GROUP BY symbol
+            """, list(symbols))
+            by_symbol = {r[0]: r for r in c.fetchall()}
+            conn.close()
         res = []
         for sym in symbols:
-            # is_trained if any tf has model
-            c.execute("SELECT timeframe,last_full_train_end,last_incremental_train_end,metrics FROM models WHERE symbol=?",(sym,))
-            rows = c.fetchall()
-            if not rows:
+            r = by_symbol.get(sym)
+            if r is None:
                 res.append({"symbol": sym, "is_trained": False, "last_full_train_end": None, "last_incremental_train_end": None, "accuracy": None})
             else:
-                # aggregate by latest
-                full_dates = [r[1] for r in rows if r[1]]
-                incr_dates = [r[2] for r in rows if r[2]]
-                accs = []
-                for r in rows:
-                    try:
-                        m = json.loads(r[3]) if r[3] else {}
-                        if "accuracy" in m:
-                            accs.append(float(m["accuracy"]))
-                    except:
-                        pass
                 res.append({
                     "symbol": sym,
                     "is_trained": True,
-                    "last_full_train_end": max(full_dates).isoformat() if full_dates else None,
-                    "last_incremental_train_end": max(incr_dates).isoformat() if incr_dates else None,
-                    "accuracy": sum(accs)/len(accs) if accs else None
+                    "last_full_train_end": pd.Timestamp(r[1]).isoformat() if r[1] else None,
+                    "last_incremental_train_end": pd.Timestamp(r[2]).isoformat() if r[2] else None,
+                    "accuracy": r[3]
                 })
-        conn.close()
-        return res
+        with self._pairs_status_lock:
+            if self._models_gen == gen:
+                if len(self._pairs_status_cache) >= 64:
+                    self._pairs_status_cache.clear()
+                self._pairs_status_cache[key] = (gen, res)
+        return [dict(r) for r in res]
 
-    # Training jobs
-    def create_training_job(self, symbol, timeframes):
+    # Training jobs — очередь обучения (см. training_scheduler.py)
+    def create_training_job(self, symbol, timeframes, priority=None, queue_depth=None):
         conn = self._conn()
         c = conn.cursor()
-        c.execute("INSERT INTO training_jobs(symbol,timeframes,status,progress) VALUES(?,?,?,?)", (symbol, ",".join(timeframes), "queued", 0))
+        c.execute("INSERT INTO training_jobs(symbol,timeframes,status,progress,priority,queue_depth) VALUES(?,?,?,?,?,?)",
+                  (symbol, ",".join(timeframes), "queued", 0, priority, queue_depth))
         jid = c.lastrowid
         conn.commit()
         conn.close()
         return jid
 
-    def update_training_job(self, job_id, status=None, progress=None, message=None):
+    def update_training_job(self, job_id, status=None, progress=None, message=None, wait_sec=None, tasks_total=None, tasks_done=None):
+        return self._write(self._update_training_job_tx, job_id, status, progress, message, wait_sec, tasks_total, tasks_done)
+
+    def _update_training_job_tx(self, c, job_id, status, progress, message, wait_sec=None, tasks_total=None, tasks_done=None):
+        sets = []
+        params = []
+        for col, val in (("status", status), ("progress", progress), ("message", message), ("wait_sec", wait_sec),
+                         ("tasks_total", tasks_total), ("tasks_done", tasks_done)):
+            if val is not None:
+                sets.append(f"{col}=?"); params.append(val)
+        if status in ("finished", "error", "cancelled"):
+            sets.append("finished_at=CURRENT_TIMESTAMP")
+        sets.append("updated_at=CURRENT_TIMESTAMP")
+        q = f"UPDATE training_jobs SET {', '.join(sets)} WHERE id=?"
+        params.append(job_id)
+        c.execute(q, params)
+
+    def fail_unfinished_training_jobs(self, message="interrupted by restart"):
+        return self._write(self._fail_unfinished_training_jobs_tx, message)
+
+    def _fail_unfinished_training_jobs_tx(self, c, message):
+        c.execute("UPDATE training_jobs SET status='error', message=?, finished_at=CURRENT_TIMESTAMP, updated_at=CURRENT_TIMESTAMP "
+                  "WHERE status IN ('queued','running')", (message,))
+        return c.rowcount
+
+    _TRAINING_JOB_COLS = "id,symbol,timeframes,status,progress,message,priority,queue_depth,wait_sec,tasks_total,tasks_done,started_at,updated_at,finished_at"
+
+    @staticmethod
+    def _training_job_row(row):
+        d = dict(zip(DatabaseManager._TRAINING_JOB_COLS.split(","), row))
+        d["timeframes"] = d["timeframes"].split(",")
+        return d
+
+    def get_training_job(self, job_id):
         conn = self._conn()
         c = conn.cursor()
+        c.execute(f"SELECT {self._TRAINING_JOB_COLS} FROM training_jobs WHERE id=?", (job_id,))
+        row = c.fetchone()
+        conn.close()
+        return self._training_job_row(row) if row else None
+
+    def list_training_jobs(self, status=None, limit=50):
+        conn = self._conn()
+        c = conn.cursor()
+        q = f"SELECT {self._TRAINING_JOB_COLS} FROM training_jobs"
+        params = []
+        if status:
+            q += " WHERE status=?"; params.append(status)
+        q += " ORDER BY id DESC LIMIT ?"; params.append(int(limit))
+        c.execute(q, params)
+        rows = c.fetchall()
+        conn.close()
+        return [self._training_job_row(r) for r in rows]
+
+    # Sync jobs — догрузка истории в фоне (см. sync_jobs.py)
+    def create_sync_job(self, symbols, timeframes, years, kind="sync"):
+        conn = self._conn()
+        c = conn.cursor()
+        c.execute("INSERT INTO sync_jobs(symbols,timeframes,years,status,progress,kind) VALUES(?,?,?,?,?,?)",
+                  (",".join(symbols), ",".join(timeframes), int(years), "queued", 0, kind))
+        jid = c.lastrowid
+        conn.commit()
+        conn.close()
+        return jid
+
+    def update_sync_job(self, job_id, status=None, progress=None, candles=None, candles_per_sec=None, message=None, result=None):
+        return self._write(self._update_sync_job_tx, job_id, status, progress, candles, candles_per_sec, message, result)
+
+    def _update_sync_job_tx(self, c, job_id, status, progress, candles, candles_per_sec, message, result=None):
         sets = []
         params = []
-        if status is not None:
-            sets.append("status=?"); params.append(status)
-        if progress is not None:
-            sets.append("progress=?"); params.append(progress)
-        if message is not None:
-            sets.append("message=?"); params.append(message)
+        for col, val in (("status", status), ("progress", progress), ("candles", candles),
+                         ("candles_per_sec", candles_per_sec), ("message", message),
+                         ("result", json.dumps(result) if result is not None else None)):
+            if val is not None:
+                sets.append(f"{col}=?"); params.append(val)
+        if status == "running":
+            sets.append("started_at=COALESCE(started_at, CURRENT_TIMESTAMP)")
+        elif status in ("finished", "error"):
+            sets.append("finished_at=CURRENT_TIMESTAMP")
         sets.append("updated_at=CURRENT_TIMESTAMP")
-        q = f"UPDATE training_jobs SET {', '.join(sets)} WHERE id=?"
         params.append(job_id)
+        c.execute(f"UPDATE sync_jobs SET {', '.join(sets)} WHERE id=?", params)
+
+    def fail_unfinished_sync_jobs(self, message="interrupted by restart"):
+        # задачи из прошлого запуска процесса уже никто не выполняет
+        return self._write(self._fail_unfinished_sync_jobs_tx, message)
+
+    def _fail_unfinished_sync_jobs_tx(self, c, message):
+        c.execute("UPDATE sync_jobs SET status='error', message=?, finished_at=CURRENT_TIMESTAMP, updated_at=CURRENT_TIMESTAMP "
+                  "WHERE status IN ('queued','running')", (message,))
+        return c.rowcount
+
+    _SYNC_JOB_COLS = "id,symbols,timeframes,years,status,progress,candles,candles_per_sec,message,created_at,started_at,finished_at,updated_at,kind,result"
+
+    @staticmethod
+    def _sync_job_row(row):
+        d = dict(zip(DatabaseManager._SYNC_JOB_COLS.split(","), row))
+        d["symbols"] = d["symbols"].split(",")
+        d["timeframes"] = d["timeframes"].split(",")
+        d["result"] = json.loads(d["result"]) if d["result"] else None
+        return d
+
+    def get_sync_job(self, job_id):
+        conn = self._conn()
+        c = conn.cursor()
+        c.execute(f"SELECT {self._SYNC_JOB_COLS} FROM sync_jobs WHERE id=?", (job_id,))
+        row = c.fetchone()
+        conn.close()
+        return self._sync_job_row(row) if row else None
+
+    def list_sync_jobs(self, status=None, limit=50):
+        conn = self._conn()
+        c = conn.cursor()
+        q = f"SELECT {self._SYNC_JOB_COLS} FROM sync_jobs"
+        params = []
+        if status:
+            q += " WHERE status=?"; params.append(status)
+        q += " ORDER BY id DESC LIMIT ?"; params.append(int(limit))
         c.execute(q, params)
+        rows = c.fetchall()
+        conn.close()
+        return [self._sync_job_row(r) for r in rows]
+
+    # Backtests — walk-forward прогоны (см. backtest.py)
+    def create_backtest_run(self, symbols, timeframes, params):
+        conn = self._conn()
+        c = conn.cursor()
+        c.execute("INSERT INTO backtest_runs(symbols,timeframes,params,status) VALUES(?,?,?,?)",
+                  (",".join(symbols), ",".join(timeframes), json.dumps(params), "queued"))
+        rid = c.lastrowid
         conn.commit()
         conn.close()
+        return rid
 
-    def get_training_job(self, job_id):
+    def update_backtest_run(self, run_id, status=None, message=None, duration_sec=None):
+        return self._write(self._update_backtest_run_tx, run_id, status, message, duration_sec)
+
+    def _update_backtest_run_tx(self, c, run_id, status, message, duration_sec):
+        sets = []
+        params = []
+        for col, val in (("status", status), ("message", message), ("duration_sec", duration_sec)):
+            if val is not None:
+                sets.append(f"{col}=?"); params.append(val)
+        if status in ("finished", "error"):
+            sets.append("finished_at=CURRENT_TIMESTAMP")
+        sets.append("updated_at=CURRENT_TIMESTAMP")
+        params.append(run_id)
+        c.execute(f"UPDATE backtest_runs SET {', '.join(sets)} WHERE id=?", params)
+
+    _BACKTEST_METRIC_COLS = ("bars", "trades", "wins", "win_rate", "pnl_percent", "avg_pnl_percent",
+                             "max_drawdown", "sharpe", "accuracy", "retrains")
+
+    def save_backtest_results(self, run_id, symbol, trades, metrics):
+        # trades: [(side, entry_ms, exit_ms, entry_price, exit_price, quantity, pnl_percent, confidence)];
+        # metrics: колонки backtest_metrics, остальное — в extra. Повторное сохранение символа перезаписывает его
+        return self._write(self._save_backtest_results_tx, run_id, symbol, trades, metrics)
+
+    def _save_backtest_results_tx(self, c, run_id, symbol, trades, metrics):
+        c.execute("DELETE FROM backtest_trades WHERE run_id=? AND symbol=?", (run_id, symbol))
+        c.executemany("""INSERT INTO backtest_trades(run_id,symbol,side,entry_time,exit_time,entry_price,exit_price,
+                         quantity,pnl_percent,confidence) VALUES(?,?,?,?,?,?,?,?,?,?)""",
+                      [(run_id, symbol, side, _ms_to_dt(t0), _ms_to_dt(t1), p0, p1, q, pnl, conf)
+                       for side, t0, t1, p0, p1, q, pnl, conf in trades])
+        cols = self._BACKTEST_METRIC_COLS
+        extra = {k: v for k, v in metrics.items() if k not in cols}
+        c.execute(f"INSERT OR REPLACE INTO backtest_metrics(run_id,symbol,{','.join(cols)},extra) "
+                  f"VALUES(?,?,{','.join('?' * len(cols))},?)",
+                  (run_id, symbol, *[metrics.get(k) for k in cols], json.dumps(extra)))
+
+    _BACKTEST_RUN_COLS = "id,symbols,timeframes,params,status,message,duration_sec,created_at,finished_at,updated_at"
+
+    @staticmethod
+    def _backtest_run_row(row):
+        d = dict(zip(DatabaseManager._BACKTEST_RUN_COLS.split(","), row))
+        d["symbols"] = d["symbols"].split(",")
+        d["timeframes"] = d["timeframes"].split(",")
+        d["params"] = json.loads(d["params"]) if d["params"] else {}
+        return d
+
+    def get_backtest_run(self, run_id):
+        # -> прогон с метриками по символам (metrics["*"] — итог) или None
         conn = self._conn()
         c = conn.cursor()
-        c.execute("SELECT id,symbol,timeframes,status,progress,message,started_at,updated_at FROM training_jobs WHERE id=?", (job_id,))
+        c.execute(f"SELECT {self._BACKTEST_RUN_COLS} FROM backtest_runs WHERE id=?", (run_id,))
         row = c.fetchone()
+        if row is None:
+            conn.close()
+            return None
+        run = self._backtest_run_row(row)
+        cols = self._BACKTEST_METRIC_COLS
+        c.execute(f"SELECT symbol,{','.join(cols)},extra FROM backtest_metrics WHERE run_id=?", (run_id,))
+        run["metrics"] = {}
+        for r in c.fetchall():
+            m = dict(zip(cols, r[1:-1]))
+            m.update(json.loads(r[-1]) if r[-1] else {})
+            run["metrics"][r[0]] = m
         conn.close()
-        if not row: return None
-        return {
-            "id": row[0], "symbol": row[1], "timeframes": row[2].split(","), "status": row[3],
-            "progress": row[4], "message": row[5], "started_at": row[6], "updated_at": row[7]
-        }
+        return run
 
-    # Trades
-    def add_trade(self, symbol, side, entry_price, quantity, entry_time):
+    def list_backtest_runs(self, limit=50):
         conn = self._conn()
         c = conn.cursor()
-        c.execute("""INSERT INTO trades(symbol,side,entry_price,quantity,entry_time,status) VALUES(?,?,?,?,?,?)""",
-                  (symbol, side, entry_price, quantity, entry_time, "open"))
+        c.execute(f"SELECT {self._BACKTEST_RUN_COLS} FROM backtest_runs ORDER BY id DESC LIMIT ?", (int(limit),))
+        rows = c.fetchall()
+        conn.close()
+        return [self._backtest_run_row(r) for r in rows]
+
+    def get_backtest_trades(self, run_id, symbol=None, limit=1000):
+        conn = self._conn()
+        c = conn.cursor()
+        q = """SELECT symbol, side, entry_time, exit_time, entry_price, exit_price, quantity, pnl_percent, confidence
+               FROM backtest_trades WHERE run_id=?"""
+        params = [run_id]
+        if symbol:
+            q += " AND symbol=?"; params.append(symbol)
+        q += " ORDER BY entry_time, symbol LIMIT ?"; params.append(int(limit))
+        c.execute(q, params)
+        cols = [d[0] for d in c.description]
+        rows = [dict(zip(cols, r)) for r in c.fetchall()]
+        conn.close()
+        return rows
+
+    # Indicator settings
+    def get_indicator_settings(self, symbol=None, inherit=True):
+        # действующие настройки символа: общие ('*'), поверх — заданные для symbol;
+        # inherit=False — только переопределения самого symbol
+        conn = self._conn()
+        c = conn.cursor()
+        scope = ("*", symbol or "*") if inherit else (symbol or "*",) * 2
+        c.execute("SELECT symbol, indicator, enabled, params FROM indicator_settings WHERE symbol IN (?, ?) "
+                  "ORDER BY symbol='*' DESC", scope)
+        rows = c.fetchall()
+        conn.close()
+        out = {}
+        for _, ind, enabled, params in rows:
+            cur = out.setdefault(ind, {"enabled": True, "params": {}})
+            cur["enabled"] = bool(enabled)
+            cur["params"].update(json.loads(params) if params else {})
+        return out
+
+    def save_indicator_settings(self, symbol, items):
+        # items: {indicator: {"enabled": bool, "params": {...}}}; заменяет настройки symbol целиком.
+        # У символа — только переопределения: индикаторы без строки и параметры без ключа берутся из общих
+        return self._write(self._save_indicator_settings_tx, symbol or "*", items)
+
+    def _save_indicator_settings_tx(self, c, symbol, items):
+        c.execute("DELETE FROM indicator_settings WHERE symbol=?", (symbol,))
+        c.executemany("INSERT INTO indicator_settings(symbol, indicator, enabled, params) VALUES(?,?,?,?)",
+                      [(symbol, ind, int(bool(s.get("enabled", True))), json.dumps(s.get("params") or {}))
+                       for ind, s in items.items()])
+
+    # Trades
+    # trade_summary — материализованная сводка по (network, symbol), обновляется в той же транзакции,
+    # что и сама сделка, поэтому /api/account читает O(число пар), а не историю сделок.
+    # В режиме write-behind add_trade возвращает Future с id; его можно сразу передать в close_trade.
+    def add_trade(self, symbol, side, entry_price, quantity, entry_time, network=None):
+        network = network or ("testnet" if Config.TRADE_TESTNET else "mainnet")
+        return self._write(self._add_trade_tx, symbol, side, entry_price, quantity, entry_time, network)
+
+    def _add_trade_tx(self, c, symbol, side, entry_price, quantity, entry_time, network):
+        c.execute("""INSERT INTO trades(symbol,side,entry_price,quantity,entry_time,status,network) VALUES(?,?,?,?,?,?,?)""",
+                  (symbol, side, entry_price, quantity, entry_time, "open", network))
         tid = c.lastrowid
-        conn.commit(); conn.close()
+        c.execute("""
+            INSERT INTO trade_summary(network,symbol,open_positions) VALUES(?,?,1)
+            ON CONFLICT(network,symbol) DO UPDATE SET open_positions=open_positions+1
+        """, (network, symbol))
         return tid
 
     def close_trade(self, trade_id, exit_price, pnl_percent, exit_time):
-        conn = self._conn()
-        c = conn.cursor()
+        return self._write(self._close_trade_tx, trade_id, exit_price, pnl_percent, exit_time)
+
+    def _close_trade_tx(self, c, trade_id, exit_price, pnl_percent, exit_time):
+        c.execute("SELECT symbol, network, status, pnl_percent FROM trades WHERE id=?", (trade_id,))
+        prev = c.fetchone()
         c.execute("""UPDATE trades SET exit_price=?, pnl_percent=?, exit_time=?, status='closed' WHERE id=?""",
                   (exit_price, pnl_percent, exit_time, trade_id))
-        conn.commit(); conn.close()
+        if prev:
+            symbol, network, status, old_pnl = prev
+            was_closed = status == "closed"
+            # повторное закрытие: вычитаем прежний вклад сделки и добавляем новый
+            c.execute("""
+                INSERT INTO trade_summary(network,symbol,open_positions,closed_count,win_count,pnl_sum) VALUES(?,?,0,0,0,0)
+                ON CONFLICT(network,symbol) DO NOTHING
+            """, (network, symbol))
+            c.execute("""
+                UPDATE trade_summary SET
+                    open_positions = open_positions - ?,
+                    closed_count = closed_count + ?,
+                    win_count = win_count + ? - ?,
+                    pnl_sum = pnl_sum + ? - ?
+                WHERE network=? AND symbol=?
+            """, (int(status == "open"), int(not was_closed),
+                  int((pnl_percent or 0) > 0), int(was_closed and (old_pnl or 0) > 0),
+                  pnl_percent or 0.0, (old_pnl or 0.0) if was_closed else 0.0,
+                  network, symbol))
+
+    def _rebuild_trade_summary(self, c):
+        c.execute("DELETE FROM trade_summary")
+        c.execute("""
+            INSERT INTO trade_summary(network,symbol,open_positions,closed_count,win_count,pnl_sum)
+            SELECT network, symbol,
+                   SUM(status='open'), SUM(status='closed'),
+                   SUM(status='closed' AND pnl_percent > 0),
+                   COALESCE(SUM(CASE WHEN status='closed' THEN pnl_percent END), 0)
+            FROM trades GROUP BY network, symbol
+        """)
+
+    def account_summary(self, network):
+        conn = self._conn()
+        c = conn.cursor()
+        c.execute("""
+            SELECT symbol, open_positions, closed_count, win_count, pnl_sum
+            FROM trade_summary WHERE network=? ORDER BY symbol
+        """, (network,))
+        rows = c.fetchall()
+        conn.close()
+        per_symbol = [{
+            "symbol": r[0], "open_positions": r[1], "closed_trades": r[2],
+            "win_rate": (r[3] / r[2]) if r[2] else None, "total_pnl_percent": r[4]
+        } for r in rows]
+        closed = sum(r[2] for r in rows)
+        wins = sum(r[3] for r in rows)
+        return {
+            "network": network,
+            "open_positions": sum(r[1] for r in rows),
+            "closed_trades": closed,
+            "win_rate": (wins / closed) if closed else None,
+            "total_pnl_percent": float(sum(r[4] for r in rows)),
+            "per_symbol": per_symbol,
+        }
 
     def get_trades(self, limit=200):
         conn = self._conn()
@@ -310,22 +1433,22 @@ class DatabaseManager:
 
     # Bots
     def add_bot(self, symbol, status, stats=None):
-        conn = self._conn()
-        c = conn.cursor()
-        c.execute("INSERT INTO bots(symbol,status,stats) VALUES(?,?,?)", (symbol, status, json.dumps(stats or {})))
-        conn.commit(); conn.close()
+        return self._write(self._add_bot_tx, symbol, status, json.dumps(stats or {}))
+
+    def _add_bot_tx(self, c, symbol, status, stats_json):
+        c.execute("INSERT INTO bots(symbol,status,stats) VALUES(?,?,?)", (symbol, status, stats_json))
 
     def update_bot(self, symbol, status=None, stats=None):
-        conn = self._conn()
-        c = conn.cursor()
         sets, params = [], []
         if status is not None: sets.append("status=?"); params.append(status)
         if stats is not None: sets.append("stats=?"); params.append(json.dumps(stats))
-        if not sets: 
-            conn.close(); return
+        if not sets:
+            return
         params.append(symbol)
-        c.execute(f"UPDATE bots SET {', '.join(sets)} WHERE symbol=?", params)
-        conn.commit(); conn.close()
+        return self._write(self._update_bot_tx, f"UPDATE bots SET {', '.join(sets)} WHERE symbol=?", params)
+
+    def _update_bot_tx(self, c, q, params):
+        c.execute(q, params)
 
     def bots_summary(self):
         conn = self._conn()
@@ -342,19 +1465,98 @@ class DatabaseManager:
         return out
 
     # News
-    def add_news(self, provider, title, url, published_at, summary, sentiment, symbols_csv=""):
-        conn = self._conn()
-        c = conn.cursor()
+    def _write_logged(self, what, fn, *args):
+        # запись, ошибку которой вызывающий только логирует. В режиме write-behind исключение приходит
+        # не сюда, а в Future из потока-писателя — логируем его колбэком; -> результат, Future или None
         try:
-            c.execute("""
-            INSERT OR IGNORE INTO news(provider,title,url,published_at,summary,sentiment,symbols)
-            VALUES(?,?,?,?,?,?,?)
-            """, (provider, title, url, published_at, summary, sentiment, symbols_csv))
-            conn.commit()
+            res = self._write(fn, *args)
         except Exception as e:
-            logger.warning("news insert error: %s", e)
-        finally:
-            conn.close()
+            logger.warning("%s error: %s", what, e)
+            return None
+        if isinstance(res, Future):
+            res.add_done_callback(lambda f: f.exception() and logger.warning("%s error: %s", what, f.exception()))
+        return res
+
+    def add_news(self, provider, title, url, published_at, summary, sentiment, symbols_csv=""):
+        # дубликаты url пропускает INSERT OR IGNORE; прочие ошибки (NOT NULL, схема) — в лог
+        return self._write_logged("news insert", self._add_news_tx, (provider, title, url, published_at, summary, sentiment, symbols_csv))
+
+    def _add_news_tx(self, c, row):
+        c.execute("""
+        INSERT OR IGNORE INTO news(provider,title,url,published_at,summary,sentiment,symbols)
+        VALUES(?,?,?,?,?,?,?)
+        """, row)
+
+    def add_news_batch(self, rows):
+        # rows: (provider, title, url, published_at, summary, sentiment, symbols_csv) — вся лента одной транзакцией
+        rows = [tuple(r) for r in rows]
+        if not rows:
+            return 0
+        return self._write_logged("news batch insert", self._add_news_batch_tx, rows)
+
+    def _add_news_batch_tx(self, c, rows):
+        c.executemany("""
+        INSERT OR IGNORE INTO news(provider,title,url,published_at,summary,sentiment,symbols)
+        VALUES(?,?,?,?,?,?,?)
+        """, rows)
+        return c.rowcount
+
+    @staticmethod
+    def _fts_query(query=None, symbol=None):
+        # каждое слово — отдельная фраза в кавычках (AND), чтобы пользовательский ввод не разбирался как синтаксис FTS5;
+        # "eth*" — поиск по префиксу
+        terms = (query or "").split()
+        if symbol:
+            terms.append(symbol.split("/")[0])
+        out = []
+        for t in terms:
+            prefix = t.endswith("*") and len(t) > 1
+            t = t.rstrip("*").replace('"', '""')
+            if t:
+                out.append(f'"{t}"*' if prefix else f'"{t}"')
+        return " ".join(out)
+
+    def search_news(self, query=None, symbol=None, since_dt=None, limit=200):
+        match = self._fts_query(query, symbol)
+        if not match:
+            return self.news_since(since_dt or datetime(1970, 1, 1), limit)
+        conn = self._conn()
+        params = []
+        if self._news_fts:
+            # id растёт вместе с моментом загрузки: обход индекса по rowid DESC останавливается на limit
+            # совпадениях, вместо сортировки всех (для частых слов — сотен тысяч) найденных статей
+            since_sql = ""
+            params.append(match)
+            if since_dt is not None:
+                since_sql = " AND m.published_at >= ?"
+                params.append(since_dt)
+            params.append(int(limit))
+            sql = f"""
+                SELECT n.provider,n.title,n.url,n.published_at,n.summary,n.sentiment,n.symbols
+                FROM news n WHERE n.id IN (
+                    SELECT news_fts.rowid FROM news_fts JOIN news m ON m.id = news_fts.rowid
+                    WHERE news_fts MATCH ?{since_sql}
+                    ORDER BY news_fts.rowid DESC LIMIT ?
+                )
+                ORDER BY n.published_at DESC
+            """
+        else:
+            sql = """
+                SELECT n.provider,n.title,n.url,n.published_at,n.summary,n.sentiment,n.symbols
+                FROM news n WHERE 1
+            """
+            for t in (query or "").split() + ([symbol.split("/")[0]] if symbol else []):
+                like = "%" + t.rstrip("*") + "%"
+                sql += " AND (n.title LIKE ? OR n.summary LIKE ?)"
+                params += [like, like]
+            if since_dt is not None:
+                sql += " AND n.published_at >= ?"
+                params.append(since_dt)
+            sql += " ORDER BY n.published_at DESC LIMIT ?"
+            params.append(int(limit))
+        df = pd.read_sql_query(sql, conn, params=params, parse_dates=["published_at"])
+        conn.close()
+        return df
 
     def news_since(self, since_dt, limit=200):
         conn = self._conn()
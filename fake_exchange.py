@@ -0,0 +1,253 @@
+import argparse
+import asyncio
+import json
+import random
+import threading
+import time
+import zlib
+import logging
+import numpy as np
+import pandas as pd
+import ccxt
+from aiohttp import web
+from config import Config
+from ohlcv_resample import TF_TO_MS, can_derive, bucket_start_ms, resample_ohlcv
+from ohlcv_store import ColumnarOHLCVStore, index_to_ms, ms_to_index
+
+logger = logging.getLogger("fake_exchange")
+
+# Локальная замена Binance для нагрузочных прогонов без сети: REST-клоны fetch_ohlcv (синтетика или
+# записанные свечи из колоночного хранилища) и WS-сервер, проигрывающий kline-потоки с ускорением.
+
+BASE_TF = "15m"
+MAX_LIMIT = 1000
+
+def _seed(symbol):
+    return zlib.crc32(symbol.replace("/", "").upper().encode()) % 100_000
+
+def _noise(i, seed):
+    # детерминированный шум [-1, 1] по номеру свечи: случайный доступ к любому участку истории
+    return np.modf(np.abs(np.sin(i * 12.9898 + seed * 78.233) * 43758.5453))[0] * 2 - 1
+
+def synthetic_klines(symbol, timeframe, start_ms, count):
+    # count свечей начиная с первой, открывшейся не раньше start_ms; старшие TF агрегируются из 15m, как у биржи
+    step = TF_TO_MS[timeframe]
+    first = int(bucket_start_ms(int(start_ms), timeframe))
+    if first < start_ms:
+        first += step
+    if count <= 0:
+        return np.empty((0, 6))
+    if can_derive(BASE_TF, timeframe):
+        base = synthetic_klines(symbol, BASE_TF, first, count * (step // TF_TO_MS[BASE_TF]))
+        out, _ = resample_ohlcv(_frame(base), BASE_TF, timeframe)
+        return np.column_stack([index_to_ms(out.index), out.to_numpy()])
+    seed = _seed(symbol)
+    t = first + np.arange(-1, count, dtype="int64") * step
+    x = t / TF_TO_MS[BASE_TF]
+    i = t // step
+    base_price = 5.0 + seed % 5000
+    logp = (0.25 * np.sin(2 * np.pi * x / (96 * 180) + seed) + 0.06 * np.sin(2 * np.pi * x / (96 * 7) + seed / 7)
+            + 0.01 * np.sin(2 * np.pi * x / 37 + seed / 3) + 0.002 * _noise(i, seed))
+    close = base_price * np.exp(logp)
+    open_, close = close[:-1], close[1:]
+    wick = 1 + 0.0015 * np.abs(_noise(i[1:], seed + 1))
+    high = np.maximum(open_, close) * wick
+    low = np.minimum(open_, close) / wick
+    volume = 100.0 + 80.0 * _noise(i[1:], seed + 2)
+    return np.column_stack([t[1:], open_, high, low, close, volume])
+
+def _frame(rows):
+    return pd.DataFrame(rows[:, 1:], index=ms_to_index(rows[:, 0].astype("int64")),
+                        columns=["open", "high", "low", "close", "volume"])
+
+class FakeExchange:
+    # ccxt-совместимый минимум для CCXTDataManager/BackfillScheduler: load_markets, fetch_ohlcv (пагинация как у
+    # Binance: since включительно, до limit<=1000, не дальше текущей свечи), лимит веса в минуту с 429 и задержка ответа
+    id = "fake"
+
+    def __init__(self, latency=None, weight_per_min=None, klines_weight=2, error_rate=None, source=None):
+        self.latency = Config.FAKE_EXCHANGE_LATENCY_MS / 1000.0 if latency is None else latency
+        self.weight_per_min = Config.FAKE_EXCHANGE_WEIGHT_PER_MIN if weight_per_min is None else weight_per_min
+        self.klines_weight = klines_weight
+        self.error_rate = Config.FAKE_EXCHANGE_ERROR_RATE if error_rate is None else error_rate
+        source = Config.FAKE_EXCHANGE_SOURCE if source is None else source
+        # "synthetic" или каталог колоночного хранилища с записанными свечами
+        self.store = ColumnarOHLCVStore(source) if source and source != "synthetic" else None
+        self.rateLimit = 50
+        self.markets = {}
+        self._lock = threading.Lock()
+        self._window = (0, 0)  # (минута, израсходованный вес)
+        self.calls = 0
+        self.rejected = 0
+
+    def load_markets(self, reload=False):
+        if not self.markets or reload:
+            symbols = self.store.pairs() if self.store else [(s, None) for s in Config.SYMBOLS]
+            self.markets = {s: {"symbol": s, "id": s.replace("/", ""), "active": True} for s, _ in symbols}
+        return self.markets
+
+    def _charge(self, weight):
+        with self._lock:
+            minute = int(time.time() // 60)
+            used = self._window[1] if self._window[0] == minute else 0
+            if used + weight > self.weight_per_min:
+                self.rejected += 1
+                raise ccxt.RateLimitExceeded("fake: 429 request weight exceeded")
+            self._window = (minute, used + weight)
+            self.calls += 1
+        if self.error_rate and random.random() < self.error_rate:
+            raise ccxt.RequestTimeout("fake: simulated timeout")
+
+    def _klines(self, symbol, timeframe, since, limit):
+        symbol = symbol if "/" in symbol else (symbol[:-4] + "/USDT" if symbol.endswith("USDT") else symbol)
+        step = TF_TO_MS[timeframe]
+        limit = min(int(limit or 500), MAX_LIMIT)
+        now = int(time.time() * 1000)
+        last_open = int(bucket_start_ms(now, timeframe))
+        if since is None:
+            since = last_open - (limit - 1) * step
+        if self.store is not None:
+            df = self.store.read(symbol, timeframe, since=pd.Timestamp(int(since), unit="ms"), limit=limit)
+            rows = np.column_stack([index_to_ms(df.index), df.to_numpy()]) if len(df) else np.empty((0, 6))
+        else:
+            first = int(bucket_start_ms(int(since), timeframe))
+            first += step if first < since else 0
+            count = max(0, min(limit, (last_open - first) // step + 1))
+            rows = synthetic_klines(symbol, timeframe, first, count)
+        return [[int(r[0]), float(r[1]), float(r[2]), float(r[3]), float(r[4]), float(r[5])] for r in rows.tolist()]
+
+    def fetch_ohlcv(self, symbol, timeframe="1m", since=None, limit=None, params=None):
+        self._charge(self.klines_weight)
+        if self.latency:
+            time.sleep(self.latency)
+        return self._klines(symbol, timeframe, since, limit)
+
+class AsyncFakeExchange(FakeExchange):
+    # то же для ccxt.async_support; fail_after — оборвать загрузку после N запросов (проверка докачки)
+    def __init__(self, *args, fail_after=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fail_after = fail_after
+
+    async def load_markets(self, reload=False):
+        return super().load_markets(reload)
+
+    async def fetch_ohlcv(self, symbol, timeframe="1m", since=None, limit=None, params=None):
+        if self.fail_after is not None and self.calls >= self.fail_after:
+            raise ccxt.ExchangeError("fake: simulated crash")
+        self._charge(self.klines_weight)
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return self._klines(symbol, timeframe, since, limit)
+
+    async def close(self):
+        pass
+
+class FakeKlineServer:
+    # Комбинированный поток Binance (/stream?streams=btcusdt@kline_15m/...) поверх синтетики.
+    # Симулированные часы идут в speed раз быстрее реальных; на каждом тике отправляются закрывшиеся свечи (x=true).
+    def __init__(self, host=None, port=None, speed=None, tick_sec=0.25, start_ms=None):
+        self.host = host or "127.0.0.1"
+        self.port = Config.FAKE_WS_PORT if port is None else port
+        self.speed = Config.FAKE_WS_SPEED if speed is None else speed
+        self.tick_sec = tick_sec
+        self.start_ms = start_ms
+        self.sent = 0
+        self.connections = 0
+        self._runner = None
+        self._thread = None
+        self._loop = None
+
+    @property
+    def url(self):
+        return f"ws://{self.host}:{self.port}/stream?streams="
+
+    def _app(self):
+        # длинная строка запроса: сотни потоков в одном ?streams=
+        app = web.Application(handler_args={"max_line_size": 1 << 16})
+        app.router.add_get("/stream", self._handle)
+        return app
+
+    async def _handle(self, request):
+        ws = web.WebSocketResponse(heartbeat=20)
+        await ws.prepare(request)
+        streams = [s for s in request.query.get("streams", "").split("/") if "@kline_" in s]
+        self.connections += 1
+        wall0 = time.time()
+        sim0 = self.start_ms or int(wall0 * 1000)
+        # последняя отправленная закрытая свеча по каждому потоку
+        last = {}
+        parsed = []
+        for s in streams:
+            market, tf = s.split("@kline_")
+            if tf in TF_TO_MS:
+                parsed.append((s, market.upper(), tf))
+                last[s] = int(bucket_start_ms(sim0, tf)) - TF_TO_MS[tf]
+        try:
+            while not ws.closed:
+                sim_now = sim0 + int((time.time() - wall0) * 1000 * self.speed)
+                for s, market, tf in parsed:
+                    step = TF_TO_MS[tf]
+                    closed_upto = int(bucket_start_ms(sim_now, tf)) - step  # open_time последней закрытой свечи
+                    if closed_upto <= last[s]:
+                        continue
+                    n = min((closed_upto - last[s]) // step, MAX_LIMIT)
+                    rows = synthetic_klines(market, tf, closed_upto - (n - 1) * step, n)
+                    for r in rows.tolist():
+                        await ws.send_str(json.dumps({"stream": s, "data": {
+                            "e": "kline", "E": sim_now, "s": market,
+                            "k": {"t": int(r[0]), "T": int(r[0]) + step - 1, "s": market, "i": tf,
+                                  "o": f"{r[1]:.8f}", "h": f"{r[2]:.8f}", "l": f"{r[3]:.8f}", "c": f"{r[4]:.8f}",
+                                  "v": f"{r[5]:.8f}", "x": True},
+                        }}))
+                        self.sent += 1
+                    last[s] = closed_upto
+                await asyncio.sleep(self.tick_sec)
+        except (ConnectionResetError, asyncio.CancelledError):
+            pass
+        finally:
+            self.connections -= 1
+        return ws
+
+    async def start_async(self):
+        self._runner = web.AppRunner(self._app())
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        logger.info("fake kline WS on %s (speed x%s)", self.url, self.speed)
+
+    def start_in_thread(self):
+        ready = threading.Event()
+
+        def run():
+            self._loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(self._loop)
+            self._loop.run_until_complete(self.start_async())
+            ready.set()
+            self._loop.run_forever()
+
+        self._thread = threading.Thread(target=run, name="fake-ws", daemon=True)
+        self._thread.start()
+        ready.wait(10)
+        return self
+
+    def stop(self):
+        if self._loop and self._runner:
+            asyncio.run_coroutine_threadsafe(self._runner.cleanup(), self._loop).result(timeout=10)
+            self._loop.call_soon_threadsafe(self._loop.stop)
+
+def main():
+    from config import configure_logging
+    configure_logging()
+    p = argparse.ArgumentParser(description="offline exchange stand-ins")
+    sub = p.add_subparsers(dest="cmd", required=True)
+    w = sub.add_parser("ws", help="локальный kline WebSocket-сервер")
+    w.add_argument("--port", type=int, default=Config.FAKE_WS_PORT)
+    w.add_argument("--speed", type=float, default=Config.FAKE_WS_SPEED, help="во сколько раз симулированное время быстрее реального")
+    args = p.parse_args()
+    if args.cmd == "ws":
+        server = FakeKlineServer(port=args.port, speed=args.speed)
+        loop = asyncio.new_event_loop()
+        loop.run_until_complete(server.start_async())
+        loop.run_forever()
+
+if __name__ == "__main__":
+    main()
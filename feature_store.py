@@ -0,0 +1,171 @@
+import hashlib
+import inspect
+import json
+import os
+import threading
+import time
+import logging
+import numpy as np
+import pandas as pd
+import features
+import features_np
+import indicators
+from config import Config
+from ohlcv_store import index_to_ms
+
+logger = logging.getLogger("feature_store")
+
+# Материализованные признаки build_features на (symbol, timeframe): файл записей [t, признаки...]
+# по open_time + json с версией набора признаков. Версия — хэш исходников индикаторов и плана
+# (включённые индикаторы и их параметры): правка определения или настроек символа делает старые
+# файлы недействительными, они пересчитываются с нуля.
+
+_FEATURE_FUNCS = [features.sma, features.ema, features.rsi, features.macd, features.bollinger,
+                  features.atr, features.candlestick_patterns, features.build_features]
+
+def feature_builder(plan=None):
+    # план индикаторов (NumPy) или features.build_features (pandas) — Config.FEATURE_KERNEL;
+    # pandas-ядро умеет только колонки build_features
+    plan = plan or indicators.DEFAULT_PLAN
+    if Config.FEATURE_KERNEL == "pandas" and set(plan.columns) <= set(indicators.DEFAULT_PLAN.columns):
+        return lambda df: features.build_features(df)[plan.columns]
+    return plan
+
+def feature_version():
+    h = hashlib.sha1()
+    for fn in _FEATURE_FUNCS:
+        h.update(inspect.getsource(fn).encode())
+    if Config.FEATURE_KERNEL != "pandas":
+        h.update(inspect.getsource(indicators).encode())
+        h.update(inspect.getsource(features_np).encode())
+    return h.hexdigest()[:12]
+
+FEATURE_VERSION = feature_version()
+
+def _dtype(columns):
+    return np.dtype([("t", "<i8")] + [(c, "<f8") for c in columns])
+
+class FeatureStore:
+    def __init__(self, db, base_dir=None, warmup=None):
+        self.db = db
+        self.base_dir = base_dir or Config.FEATURE_STORE_DIR
+        # EMA-признаки зависят от всей истории; warmup баров перед пересчитываемым участком
+        # сводят расхождение с полным пересчётом к ~(1 - 2/27)^warmup
+        self.warmup = Config.FEATURE_WARMUP_BARS if warmup is None else warmup
+        self.version = FEATURE_VERSION
+        os.makedirs(self.base_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._stats = {"full": 0, "incremental": 0, "rows_computed": 0, "compute_time_sec": 0.0}
+
+    def _base(self, symbol, timeframe):
+        return os.path.join(self.base_dir, f"{symbol.replace('/', '-')}_{timeframe}")
+
+    def _version(self, plan):
+        if plan is indicators.DEFAULT_PLAN:
+            return self.version
+        return hashlib.sha1(f"{self.version}:{plan.key}".encode()).hexdigest()[:12]
+
+    def path(self, symbol, timeframe, version=None):
+        return f"{self._base(symbol, timeframe)}.{version or self.version}.feat"
+
+    def _meta_path(self, symbol, timeframe, version=None):
+        return f"{self._base(symbol, timeframe)}.{version or self.version}.json"
+
+    def _load(self, symbol, timeframe, version):
+        try:
+            with open(self._meta_path(symbol, timeframe, version)) as f:
+                meta = json.load(f)
+            dt = _dtype(meta["columns"])
+            n = os.path.getsize(self.path(symbol, timeframe, version)) // dt.itemsize
+        except (FileNotFoundError, ValueError, KeyError):
+            return None, None
+        rec = np.memmap(self.path(symbol, timeframe, version), dtype=dt, mode="r", shape=(n,)) if n else np.empty(0, dtype=dt)
+        return meta, rec
+
+    def features(self, symbol, timeframe, df: pd.DataFrame = None, plan=None):
+        # признаки плана для каждой свечи df (как plan(df)); недостающий хвост досчитывается и сохраняется
+        if df is None:
+            df = self.db.load_ohlcv(symbol, timeframe)
+        if df is None or df.empty:
+            return pd.DataFrame()
+        plan = plan or indicators.DEFAULT_PLAN
+        with self._lock:
+            rec, columns = self._materialize(symbol, timeframe, df, plan)
+        return pd.DataFrame({c: rec[c] for c in columns}, index=df.index)
+
+    def _materialize(self, symbol, timeframe, df, plan):
+        ms = index_to_ms(df.index)
+        version = self._version(plan)
+        meta, rec = self._load(symbol, timeframe, version)
+        start = 0
+        if rec is not None and len(rec):
+            n_old = int(np.searchsorted(ms, rec["t"][-1], side="right"))
+            # история до последней сохранённой свечи не менялась — пересчитываем только хвост;
+            # последнюю сохранённую тоже: она могла быть ещё не закрыта
+            if n_old == len(rec) and ms[0] == rec["t"][0] and ms[n_old - 1] == rec["t"][-1]:
+                start = n_old - 1
+        t0 = time.perf_counter()
+        ctx = max(0, start - self.warmup)
+        feats = feature_builder(plan)(df.iloc[ctx:]).iloc[start - ctx:]
+        columns = list(feats.columns)
+        new = np.empty(len(feats), dtype=_dtype(columns))
+        new["t"] = ms[start:]
+        for c in columns:
+            new[c] = feats[c].to_numpy(dtype="float64")
+        if start:
+            del rec
+            self._append(symbol, timeframe, version, new, start)
+            _, rec = self._load(symbol, timeframe, version)
+        else:
+            rec = new
+            self._rewrite(symbol, timeframe, version, new, columns, plan)
+        self._stats["incremental" if start else "full"] += 1
+        self._stats["rows_computed"] += len(df) - ctx
+        self._stats["compute_time_sec"] += time.perf_counter() - t0
+        if not start:
+            logger.info("materialized features %s %s v%s: %d rows", symbol, timeframe, version, len(rec))
+        return rec, columns
+
+    def _append(self, symbol, timeframe, version, new, start):
+        with open(self.path(symbol, timeframe, version), "r+b") as f:
+            f.truncate(start * new.dtype.itemsize)
+            f.seek(0, os.SEEK_END)
+            f.write(new.tobytes())
+
+    def _rewrite(self, symbol, timeframe, version, rec, columns, plan):
+        p = self.path(symbol, timeframe, version)
+        with open(p + ".tmp", "wb") as f:
+            f.write(rec.tobytes())
+        os.replace(p + ".tmp", p)
+        mp = self._meta_path(symbol, timeframe, version)
+        with open(mp + ".tmp", "w") as f:
+            json.dump({"version": version, "columns": columns, "indicators": plan.spec, "symbol": symbol, "timeframe": timeframe}, f)
+        os.replace(mp + ".tmp", mp)
+        self._drop_stale(symbol, timeframe, version)
+
+    def _drop_stale(self, symbol, timeframe, version):
+        # файлы других версий набора признаков (и других наборов индикаторов) для этой пары больше не нужны
+        prefix = os.path.basename(self._base(symbol, timeframe)) + "."
+        for name in os.listdir(self.base_dir):
+            if name.startswith(prefix) and f".{version}." not in name:
+                try:
+                    os.remove(os.path.join(self.base_dir, name))
+                except OSError:
+                    pass
+
+    def invalidate(self, symbol, timeframe):
+        # все наборы признаков пары
+        prefix = os.path.basename(self._base(symbol, timeframe)) + "."
+        with self._lock:
+            for name in os.listdir(self.base_dir):
+                if name.startswith(prefix):
+                    try:
+                        os.remove(os.path.join(self.base_dir, name))
+                    except FileNotFoundError:
+                        pass
+
+    def stats(self):
+        with self._lock:
+            out = dict(self._stats)
+        out.update(version=self.version, warmup=self.warmup)
+        return out
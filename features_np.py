@@ -0,0 +1,126 @@
+import numpy as np
+import pandas as pd
+from scipy.signal import lfilter
+
+# NumPy-ядро build_features: те же колонки и значения, но на непрерывных float64-массивах без
+# промежуточных Series. Принимает панель (символы x время): ряды разной длины выравниваются по правому
+# краю, слева — NaN; каждый ряд считается так, как будто build_features вызвали только на нём.
+
+FEATURE_COLUMNS = ["ret_1", "sma_20", "ema_20", "rsi_14", "macd", "macd_sig", "macd_hist",
+                   "bb_mid", "bb_up", "bb_lo", "atr_14", "doji", "bull_engulf", "bear_engulf"]
+
+def ema(x, span):
+    # ewm(span, adjust=False) по оси времени: рекурсия y = (1 - a) * y_prev + a * x через lfilter (C)
+    a = 2.0 / (span + 1.0)
+    zi = (1.0 - a) * x[:, :1]
+    y, _ = lfilter([a], [1.0, a - 1.0], x, axis=1, zi=zi)
+    return y
+
+def rolling_mean_std(x, n, block=64):
+    # скользящие mean/std (ddof=1) через кумулятивные суммы. Суммы считаются поблочно от опорного
+    # значения блока: вычитаются величины порядка локального разброса цены, а не всей истории
+    S, T = x.shape
+    if T < n:
+        nan = np.full_like(x, np.nan)
+        return nan, nan
+    nb = -(-T // block)
+    xp = np.concatenate([np.repeat(x[:, :1], n - 1, axis=1), x, np.repeat(x[:, -1:], nb * block - T, axis=1)], axis=1)
+    w = np.lib.stride_tricks.sliding_window_view(xp, block + n - 1, axis=1)[:, ::block]
+    anchor = w[..., :1]
+    d = w - anchor
+    zero = np.zeros(d.shape[:-1] + (1,))
+    s1 = np.concatenate([zero, np.cumsum(d, axis=-1)], axis=-1)
+    s2 = np.concatenate([zero, np.cumsum(d * d, axis=-1)], axis=-1)
+    S1 = s1[..., n:] - s1[..., :-n]
+    S2 = s2[..., n:] - s2[..., :-n]
+    mean = (S1 / n + anchor).reshape(S, -1)[:, :T]
+    var = (np.maximum(S2 - S1 * S1 / n, 0.0) / (n - 1)).reshape(S, -1)[:, :T]
+    mean[:, :n - 1] = np.nan
+    var[:, :n - 1] = np.nan
+    return mean, np.sqrt(var)
+
+def feature_kernel(o, h, l, c):
+    # (S, T) -> (S, T, len(FEATURE_COLUMNS)); NaN слева — отсутствие истории у ряда
+    o, h, l, c = (np.atleast_2d(np.asarray(v, dtype="float64")) for v in (o, h, l, c))
+    S, T = c.shape
+    valid = ~np.isnan(c)
+    first = np.where(valid.any(axis=1), valid.argmax(axis=1), T)
+    if (first > 0).any():
+        # до начала ряда повторяем первую свечу: EMA стартует с первого значения, как у pandas;
+        # всё, что зависит от этих позиций, ниже маскируется
+        src = np.minimum(first, T - 1)[:, None]
+        pad = np.arange(T)[None, :] < first[:, None]
+        o, h, l, c = (np.where(pad, np.take_along_axis(v, src, axis=1), v) for v in (o, h, l, c))
+    t = np.arange(T)[None, :]
+    pc = np.concatenate([c[:, :1], c[:, :-1]], axis=1)
+    po = np.concatenate([o[:, :1], o[:, :-1]], axis=1)
+    has_prev = t > first[:, None]
+
+    # (колонка, ряд, время): каждая колонка — непрерывный блок
+    out = np.empty((len(FEATURE_COLUMNS), S, T))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        out[0] = np.where(has_prev, c / pc - 1.0, np.nan)
+        mean, sd = rolling_mean_std(c, 20)
+        enough = t >= first[:, None] + 19
+        mean = np.where(enough, mean, np.nan)
+        sd = np.where(enough, sd, np.nan)
+        out[1] = mean
+        out[2] = ema(c, 20)
+        delta = np.where(has_prev, c - pc, 0.0)
+        up = ema(np.where(delta > 0, delta, 0.0), 14)
+        down = ema(np.where(delta < 0, -delta, 0.0), 14)
+        out[3] = 100.0 - 100.0 / (1.0 + up / (down + 1e-9))
+        macd_line = ema(c, 12) - ema(c, 26)
+        signal = ema(macd_line, 9)
+        out[4] = macd_line
+        out[5] = signal
+        out[6] = macd_line - signal
+        out[7] = mean
+        out[8] = mean + 2 * sd
+        out[9] = mean - 2 * sd
+        tr = np.maximum(h - l, np.where(has_prev, np.maximum(np.abs(h - pc), np.abs(l - pc)), -np.inf))
+        out[10] = ema(tr, 14)
+        rng = h - l
+        out[11] = (rng != 0) & (np.abs(c - o) / np.where(rng != 0, rng, 1.0) < 0.1)
+        out[12] = has_prev & (c > o) & (pc < po) & (c >= po) & (o <= pc)
+        out[13] = has_prev & (c < o) & (pc > po) & (c <= po) & (o >= pc)
+    before = t < first[:, None]
+    for col in out:
+        col[before] = np.nan
+        _ffill_zero(col)
+    return np.moveaxis(out, 0, -1)
+
+def _ffill_zero(x):
+    # ffill().fillna(0) по оси времени, на месте; NaN обычно только в начале ряда — их просто обнуляем
+    nan = np.isnan(x)
+    if not nan.any():
+        return
+    lead = np.logical_and.accumulate(nan, axis=1)
+    if (lead == nan).all():
+        x[nan] = 0.0
+        return
+    idx = np.where(nan, 0, np.arange(x.shape[1])[None, :])
+    np.maximum.accumulate(idx, axis=1, out=idx)
+    x[:] = np.take_along_axis(x, idx, axis=1)
+    x[np.isnan(x)] = 0.0
+
+def build_features_np(df: pd.DataFrame):
+    # замена features.build_features для одного ряда
+    cols = [df[k].to_numpy(dtype="float64") for k in ("open", "high", "low", "close")]
+    out = feature_kernel(*cols)[0]
+    return pd.DataFrame(out, index=df.index, columns=FEATURE_COLUMNS)
+
+def build_features_panel(frames: dict):
+    # {symbol: ohlcv df} -> {symbol: признаки}; все ряды — одним проходом ядра по панели
+    if not frames:
+        return {}
+    T = max(len(df) for df in frames.values())
+    panel = {k: np.full((len(frames), T), np.nan) for k in ("open", "high", "low", "close")}
+    for i, df in enumerate(frames.values()):
+        n = len(df)
+        if n:
+            for k, arr in panel.items():
+                arr[i, T - n:] = df[k].to_numpy(dtype="float64")
+    out = feature_kernel(panel["open"], panel["high"], panel["low"], panel["close"])
+    return {sym: pd.DataFrame(out[i, T - len(df):], index=df.index, columns=FEATURE_COLUMNS)
+            for i, (sym, df) in enumerate(frames.items())}
@@ -0,0 +1,184 @@
+import math
+import threading
+import numpy as np
+import pandas as pd
+from ohlcv_store import index_to_ms
+
+# Потоковый аналог features.build_features: состояние индикаторов (EMA-аккумуляторы, скользящее окно
+# для SMA/Bollinger) хранится на (symbol, timeframe), новая закрытая свеча обновляет вектор признаков за O(1).
+# Значения совпадают с build_features по той же истории свечей (с точностью до округления float).
+
+FEATURE_COLUMNS = ["ret_1", "sma_20", "ema_20", "rsi_14", "macd", "macd_sig", "macd_hist",
+                   "bb_mid", "bb_up", "bb_lo", "atr_14", "doji", "bull_engulf", "bear_engulf"]
+
+BB_N = 20
+BB_K = 2
+NAN = float("nan")
+# build_features по окну начинает EMA с первой свечи окна. Если окно сдвинулось, состояние помнит свечи
+# до его начала; их вклад затухает как (1 - a)^len с самой медленной EMA (span 26). Начиная с этой длины
+# окна он ниже точности float64 ((25/27)^500 ~ 2e-17), короче — состояние пересобирается по окну
+EXACT_BARS = 500
+
+def _alpha(span):
+    # ewm(span=n, adjust=False): y = (1 - a) * y_prev + a * x
+    return 2.0 / (span + 1.0)
+
+A_EMA20, A_EMA12, A_EMA26, A_SIG, A_RSI, A_ATR = (_alpha(n) for n in (20, 12, 26, 9, 14, 14))
+
+def _ewm(prev, x, a):
+    return x if prev is None else (1.0 - a) * prev + a * x
+
+class IncrementalFeatures:
+    def __init__(self):
+        self.count = 0
+        self.first_time = None
+        self.last_time = None
+        self.prev_open = None
+        self.prev_close = None
+        self.ema20 = self.ema12 = self.ema26 = self.sig = None
+        self.rsi_up = self.rsi_down = self.atr = None
+        # кольцевой буфер последних BB_N закрытий, скользящие среднее и M2 (Уэлфорд)
+        self.ring = [0.0] * BB_N
+        self.pos = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        # build_features делает ffill().fillna(0) — храним последнее не-NaN значение каждой колонки
+        self.last_valid = [0.0] * len(FEATURE_COLUMNS)
+
+    def update(self, o, h, l, c, open_ms=None, commit=True):
+        # commit=False — вектор для незакрытой свечи без изменения состояния
+        pc, po = self.prev_close, self.prev_open
+        first = pc is None
+        if first:
+            ret = NAN
+        elif pc != 0:
+            ret = c / pc - 1.0
+        else:
+            ret = NAN if c == 0 else math.copysign(math.inf, c)
+
+        ema20 = _ewm(self.ema20, c, A_EMA20)
+        ema12 = _ewm(self.ema12, c, A_EMA12)
+        ema26 = _ewm(self.ema26, c, A_EMA26)
+        macd = ema12 - ema26
+        sig = _ewm(self.sig, macd, A_SIG)
+
+        delta = NAN if first else c - pc
+        rsi_up = _ewm(self.rsi_up, delta if delta > 0 else 0.0, A_RSI)
+        rsi_down = _ewm(self.rsi_down, -delta if delta < 0 else 0.0, A_RSI)
+        rs = rsi_up / (rsi_down + 1e-9)
+        rsi = 100.0 - 100.0 / (1.0 + rs)
+
+        tr = h - l if first else max(h - l, abs(h - pc), abs(l - pc))
+        atr = _ewm(self.atr, tr, A_ATR)
+
+        n = self.count + 1
+        if self.count < BB_N:
+            d = c - self.mean
+            mean = self.mean + d / n
+            m2 = self.m2 + d * (c - mean)
+        else:
+            out = self.ring[self.pos]
+            mean = self.mean + (c - out) / BB_N
+            m2 = self.m2 + (c - out) * (c - mean + out - self.mean)
+        if n >= BB_N:
+            sd = math.sqrt(max(m2, 0.0) / (BB_N - 1))
+            bb = (mean, mean + BB_K * sd, mean - BB_K * sd)
+        else:
+            bb = (NAN, NAN, NAN)
+
+        rng = h - l
+        doji = 1.0 if rng != 0 and abs(c - o) / rng < 0.1 else 0.0
+        if first:
+            bull = bear = 0.0
+        else:
+            bull = 1.0 if (c > o and pc < po and c >= po and o <= pc) else 0.0
+            bear = 1.0 if (c < o and pc > po and c <= po and o >= pc) else 0.0
+
+        vals = [ret, bb[0], ema20, rsi, macd, sig, macd - sig, bb[0], bb[1], bb[2], atr, doji, bull, bear]
+        last_valid = self.last_valid
+        for j, v in enumerate(vals):
+            if v != v:
+                vals[j] = last_valid[j]
+            elif commit:
+                last_valid[j] = v
+        if commit:
+            if self.count == 0:
+                self.first_time = open_ms
+            self.count = n
+            self.last_time = open_ms
+            self.prev_open, self.prev_close = o, c
+            self.ema20, self.ema12, self.ema26, self.sig = ema20, ema12, ema26, sig
+            self.rsi_up, self.rsi_down, self.atr = rsi_up, rsi_down, atr
+            self.ring[self.pos] = c
+            self.pos = (self.pos + 1) % BB_N
+            if self.pos == 0 and n >= BB_N:
+                # раз в оборот буфера пересчитываем точно — скользящие поправки не накапливают ошибку
+                mean = math.fsum(self.ring) / BB_N
+                m2 = math.fsum((x - mean) ** 2 for x in self.ring)
+            self.mean, self.m2 = mean, m2
+        return vals
+
+class FeatureStream:
+    # IncrementalFeatures на каждую (symbol, timeframe). Окно свечей из predict_hierarchical сверяется
+    # с состоянием по open_time: дописываются только новые свечи; последняя строка окна (может быть
+    # ещё не закрыта) считается без изменения состояния. Разрыв с состоянием — пересборка по окну,
+    # как и сдвиг начала окна короче EXACT_BARS: иначе EMA/RSI/ATR расходятся с build_features(окно).
+    def __init__(self):
+        self._states = {}
+        self._lock = threading.Lock()
+        self._stats = {"rebuilds": 0, "committed": 0, "ticks": 0}
+
+    def latest(self, symbol, timeframe, df: pd.DataFrame):
+        # -> np.ndarray (1, len(FEATURE_COLUMNS)) — то же, что build_features(df).values[-1:]
+        if df is None or df.empty:
+            return np.empty((0, len(FEATURE_COLUMNS)))
+        key = (symbol, timeframe)
+        with self._lock:
+            entry = self._states.get(key)
+            if entry is None:
+                entry = self._states[key] = [threading.Lock(), None]
+        with entry[0]:
+            ms = index_to_ms(df.index)
+            st = entry[1]
+            start = None
+            if st is not None and st.last_time is not None:
+                pos = int(np.searchsorted(ms, st.last_time, side="right"))
+                same_start = st.first_time == ms[0] or len(ms) >= EXACT_BARS
+                if same_start and 0 < pos < len(ms) and ms[pos - 1] == st.last_time:
+                    start = pos
+            rebuilt = start is None
+            if rebuilt:
+                st = entry[1] = IncrementalFeatures()
+                start = 0
+            # в numpy переводим только новые строки окна
+            arr = np.column_stack([df[col].to_numpy(dtype="float64")[start:] for col in ("open", "high", "low", "close")])
+            rows = arr[:-1].tolist()
+            times = ms[start:-1].tolist()
+            for (o, h, l, c), t in zip(rows, times):
+                st.update(o, h, l, c, t)
+            o, h, l, c = arr[-1].tolist()
+            vec = st.update(o, h, l, c, commit=False)
+        with self._lock:
+            self._stats["rebuilds"] += int(rebuilt)
+            self._stats["committed"] += len(rows)
+            self._stats["ticks"] += 1
+        return np.asarray([vec], dtype="float64")
+
+    def reset(self, symbol=None, timeframe=None):
+        with self._lock:
+            for key in [k for k in self._states if symbol in (None, k[0]) and timeframe in (None, k[1])]:
+                del self._states[key]
+
+    def stats(self):
+        with self._lock:
+            out = dict(self._stats)
+            out["states"] = len(self._states)
+        return out
+
+def stream_features(df: pd.DataFrame):
+    # вся история через IncrementalFeatures — для сверки с build_features
+    st = IncrementalFeatures()
+    arr = df[["open", "high", "low", "close"]].to_numpy(dtype="float64").tolist()
+    ms = index_to_ms(df.index).tolist()
+    rows = [st.update(o, h, l, c, t) for (o, h, l, c), t in zip(arr, ms)]
+    return pd.DataFrame(rows, index=df.index, columns=FEATURE_COLUMNS)
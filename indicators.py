@@ -0,0 +1,242 @@
+import hashlib
+import json
+import threading
+import numpy as np
+import pandas as pd
+from scipy.signal import lfilter
+from features_np import rolling_mean_std, _ffill_zero
+
+# Реестр индикаторов: каждый объявляет параметры, входы (узлы графа) и колонки. Включённые индикаторы
+# компилируются в план: узлы — кортежи (op, *args), аргумент-кортеж — зависимость; одинаковые кортежи
+# (EMA одного span, сдвинутый close, скользящее окно) — один узел, считается один раз на кадр.
+# Набор по умолчанию (все индикаторы, параметры по умолчанию) даёт те же колонки, что features.build_features.
+
+OPEN, HIGH, LOW, CLOSE = (("col", k) for k in ("open", "high", "low", "close"))
+PREV_OPEN = ("shift", OPEN)
+PREV_CLOSE = ("shift", CLOSE)
+DELTA = ("sub", CLOSE, PREV_CLOSE)
+TRUE_RANGE = ("tr", HIGH, LOW, PREV_CLOSE)
+
+def _shift(x):
+    out = np.empty_like(x)
+    out[:1] = np.nan
+    out[1:] = x[:-1]
+    return out
+
+def _ema(x, span):
+    # ewm(span, adjust=False): y = (1 - a) * y_prev + a * x, старт с первого значения
+    a = 2.0 / (span + 1.0)
+    if not len(x):
+        return x.copy()
+    y, _ = lfilter([a], [1.0, a - 1.0], x, zi=[(1.0 - a) * x[0]])
+    return y
+
+def _rolling(x, n):
+    mean, sd = rolling_mean_std(x[None, :], n)
+    return mean[0], sd[0]
+
+def _true_range(h, l, pc):
+    # первая свеча без предыдущего close — просто h - l, как max(axis=1) по NaN у pandas
+    return np.fmax(h - l, np.fmax(np.abs(h - pc), np.abs(l - pc)))
+
+OPS = {
+    "shift": _shift,
+    "sub": lambda a, b: a - b,
+    "pos": lambda x: np.where(x > 0, x, 0.0),
+    "neg": lambda x: np.where(x < 0, -x, 0.0),
+    "ema": _ema,
+    "roll": _rolling,
+    "tr": _true_range,
+}
+
+class Indicator:
+    def __init__(self, name, title, params, inputs, columns, compute):
+        self.name = name
+        self.title = title
+        self.params = params          # параметры по умолчанию: {имя: значение}
+        self.inputs = inputs          # params -> {аргумент compute: узел}
+        self.columns = columns        # params -> имена колонок
+        self.compute = compute        # (params, **значения узлов) -> список массивов по колонкам
+
+INDICATORS = {}
+
+def indicator(name, title, params=None, inputs=None, columns=None):
+    def wrap(fn):
+        INDICATORS[name] = Indicator(name, title, params or {}, inputs, columns or (lambda p: [name]), fn)
+        return fn
+    return wrap
+
+def _suffix(p, defaults):
+    # параметры в имени колонки только если отличаются от умолчаний — имена по умолчанию как в build_features
+    return "" if p == defaults else "_" + "_".join(f"{v:g}" for v in p.values())
+
+@indicator("ret_1", "Доходность за бар", inputs=lambda p: {"c": CLOSE, "pc": PREV_CLOSE})
+def _ret(p, c, pc):
+    return [c / pc - 1.0]
+
+@indicator("sma", "SMA", {"n": 20}, inputs=lambda p: {"roll": ("roll", CLOSE, p["n"])},
+           columns=lambda p: [f"sma_{p['n']}"])
+def _sma(p, roll):
+    return [roll[0]]
+
+@indicator("ema", "EMA", {"n": 20}, inputs=lambda p: {"y": ("ema", CLOSE, p["n"])},
+           columns=lambda p: [f"ema_{p['n']}"])
+def _ema_ind(p, y):
+    return [y]
+
+@indicator("rsi", "RSI", {"n": 14},
+           inputs=lambda p: {"up": ("ema", ("pos", DELTA), p["n"]), "down": ("ema", ("neg", DELTA), p["n"])},
+           columns=lambda p: [f"rsi_{p['n']}"])
+def _rsi(p, up, down):
+    return [100.0 - 100.0 / (1.0 + up / (down + 1e-9))]
+
+def _macd_line(p):
+    return ("sub", ("ema", CLOSE, p["fast"]), ("ema", CLOSE, p["slow"]))
+
+@indicator("macd", "MACD", {"fast": 12, "slow": 26, "signal": 9},
+           inputs=lambda p: {"line": _macd_line(p), "sig": ("ema", _macd_line(p), p["signal"])},
+           columns=lambda p: [f"macd{_suffix(p, INDICATORS['macd'].params)}{s}" for s in ("", "_sig", "_hist")])
+def _macd(p, line, sig):
+    return [line, sig, line - sig]
+
+@indicator("bollinger", "Bollinger Bands", {"n": 20, "k": 2.0}, inputs=lambda p: {"roll": ("roll", CLOSE, p["n"])},
+           columns=lambda p: [f"bb{_suffix(p, INDICATORS['bollinger'].params)}_{s}" for s in ("mid", "up", "lo")])
+def _bollinger(p, roll):
+    mean, sd = roll
+    return [mean, mean + p["k"] * sd, mean - p["k"] * sd]
+
+@indicator("atr", "ATR", {"n": 14}, inputs=lambda p: {"tr": ("ema", TRUE_RANGE, p["n"])},
+           columns=lambda p: [f"atr_{p['n']}"])
+def _atr(p, tr):
+    return [tr]
+
+@indicator("patterns", "Свечные паттерны (doji, engulfing)",
+           inputs=lambda p: {"o": OPEN, "h": HIGH, "l": LOW, "c": CLOSE, "po": PREV_OPEN, "pc": PREV_CLOSE},
+           columns=lambda p: ["doji", "bull_engulf", "bear_engulf"])
+def _patterns(p, o, h, l, c, po, pc):
+    rng = h - l
+    doji = (rng != 0) & (np.abs(c - o) / np.where(rng != 0, rng, 1.0) < 0.1)
+    bull = (c > o) & (pc < po) & (c >= po) & (o <= pc)
+    bear = (c < o) & (pc > po) & (c <= po) & (o >= pc)
+    return [doji, bull, bear]
+
+def _nodes(roots):
+    # все узлы подграфов roots (с повторами)
+    stack = list(roots)
+    while stack:
+        node = stack.pop()
+        yield node
+        if node[0] != "col":
+            stack += [a for a in node[1:] if isinstance(a, tuple)]
+
+def resolve(settings=None):
+    # {indicator: {"enabled": bool, "params": {...}}} -> spec [(indicator, params)] в порядке реестра.
+    # Неуказанные индикаторы включены с параметрами по умолчанию; ValueError на неизвестные имена/параметры
+    settings = settings or {}
+    unknown = set(settings) - set(INDICATORS)
+    if unknown:
+        raise ValueError(f"unknown indicators: {sorted(unknown)}")
+    spec = []
+    for name, ind in INDICATORS.items():
+        s = settings.get(name) or {}
+        if not s.get("enabled", True):
+            continue
+        params = dict(ind.params)
+        for k, v in (s.get("params") or {}).items():
+            if k not in params:
+                raise ValueError(f"{name}: unknown parameter {k}")
+            try:
+                v = type(params[k])(v)
+            except (TypeError, ValueError):
+                raise ValueError(f"{name}.{k}: expected {type(params[k]).__name__}, got {v!r}")
+            if v <= 0:
+                raise ValueError(f"{name}.{k} must be positive")
+            params[k] = v
+        if name == "macd" and params["fast"] >= params["slow"]:
+            raise ValueError("macd: fast must be less than slow")
+        if any(node[2] < 2 for node in _nodes(ind.inputs(params).values()) if node[0] == "roll"):
+            # скользящее окно считает std с ddof=1: при n=1 деление на 0 и inf в признаках
+            raise ValueError(f"{name}: rolling window must be at least 2")
+        spec.append((name, params))
+    if not spec:
+        raise ValueError("at least one indicator must be enabled")
+    return spec
+
+class FeaturePlan:
+    def __init__(self, spec):
+        self.spec = [(name, dict(params)) for name, params in spec]
+        self.columns = []
+        self._calls = []
+        order, seen = [], set()
+
+        def visit(node):
+            if node in seen:
+                return
+            seen.add(node)
+            if node[0] != "col":
+                for arg in node[1:]:
+                    if isinstance(arg, tuple):
+                        visit(arg)
+            order.append(node)
+
+        for name, params in self.spec:
+            ind = INDICATORS[name]
+            inputs = ind.inputs(params)
+            for node in inputs.values():
+                visit(node)
+            self._calls.append((ind, params, inputs))
+            self.columns += ind.columns(params)
+        self.nodes = order
+        self.key = hashlib.sha1(json.dumps(self.spec, sort_keys=True).encode()).hexdigest()[:12]
+
+    def evaluate(self, o, h, l, c):
+        # 1-D массивы одного ряда -> (len(columns), T), NaN заполнены как ffill().fillna(0)
+        cols = {"open": o, "high": h, "low": l, "close": c}
+        values = {}
+        with np.errstate(divide="ignore", invalid="ignore"):
+            for node in self.nodes:
+                if node[0] == "col":
+                    values[node] = cols[node[1]]
+                else:
+                    args = [values[a] if isinstance(a, tuple) else a for a in node[1:]]
+                    values[node] = OPS[node[0]](*args)
+            out = np.empty((len(self.columns), len(c)))
+            j = 0
+            for ind, params, inputs in self._calls:
+                for arr in ind.compute(params, **{k: values[v] for k, v in inputs.items()}):
+                    out[j] = arr
+                    j += 1
+        _ffill_zero(out)
+        return out
+
+    def __call__(self, df: pd.DataFrame):
+        # замена build_features: признаки только включённых индикаторов
+        arrs = [df[k].to_numpy(dtype="float64") for k in ("open", "high", "low", "close")]
+        return pd.DataFrame(self.evaluate(*arrs).T, index=df.index, columns=self.columns)
+
+_plans = {}
+_plans_lock = threading.Lock()
+
+def compile_plan(spec):
+    key = json.dumps(spec, sort_keys=True)
+    with _plans_lock:
+        plan = _plans.get(key)
+        if plan is None:
+            plan = _plans[key] = FeaturePlan(spec)
+    return plan
+
+def plan_for(settings=None):
+    return compile_plan(resolve(settings))
+
+def describe(settings=None):
+    # для страницы настроек: действующее состояние каждого индикатора
+    settings = settings or {}
+    out = []
+    for name, ind in INDICATORS.items():
+        s = settings.get(name) or {}
+        params = dict(ind.params, **(s.get("params") or {}))
+        out.append({"name": name, "title": ind.title, "enabled": bool(s.get("enabled", True)),
+                    "params": params, "defaults": ind.params, "columns": ind.columns(params)})
+    return out
+
+DEFAULT_PLAN = plan_for()
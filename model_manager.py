@@ -1,18 +1,24 @@
+import os
+import time
+import threading
 import numpy as np
 import pandas as pd
-from sklearn.linear_model import SGDClassifier
-from sklearn.preprocessing import StandardScaler
-from sklearn.pipeline import Pipeline
-from sklearn.metrics import accuracy_score
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import TimeoutError as FutureTimeout
 from config import Config
 from database import DatabaseManager
-from features import build_features, make_labels
+from features import make_labels
+from features_stream import FeatureStream, FEATURE_COLUMNS
+from feature_store import FeatureStore, feature_builder
+from ohlcv_resample import TF_TO_MS
+from ohlcv_store import index_to_ms
+from indicators import compile_plan, plan_for, DEFAULT_PLAN
+from batch_inference import LinearParamsCache, predict_proba_batch
+from training_pool import CLASSES, TrainingPool, TrainingCancelled, fit_model, fit_shared, share_arrays
 import logging
 
 logger = logging.getLogger("model")
 
-CLASSES = np.array([-1, 0, 1], dtype=int)
+HIERARCHY = ["1w", "1d", "4h", "1h", "15m"]
 
 # Минимально необходимое число баров по ТФ (разумные значения для 3 лет истории на 1w ~ 156)
 MIN_BARS_BY_TF = {
@@ -26,144 +32,271 @@ MIN_BARS_BY_TF = {
 class ModelManager:
     def __init__(self, db: DatabaseManager):
         self.db = db
-        self.pool = ThreadPoolExecutor(max_workers=Config.MAX_WORKERS)
-
-    def _make_pipeline(self):
-        # Инкрементально обучаемый пайплайн: scaler + SGDClassifier (log loss, probas)
-        # with_mean=True для плотных данных
-        return Pipeline([
-            ("scaler", StandardScaler(with_mean=True)),
-            ("clf", SGDClassifier(loss="log_loss", max_iter=1, tol=None, random_state=42))
-        ])
-
-    def train_symbol(self, symbol: str, timeframes: list, years: int, job_id: int=None):
-        futures = [self.pool.submit(self._train_one_tf, symbol, tf, years, job_id) for tf in timeframes]
-        total = len(futures)
-        done = 0
-        for fut in as_completed(futures):
-            try:
-                fut.result()
-            except Exception as e:
-                logger.exception("train tf error: %s", e)
-            finally:
-                done += 1
-                if job_id:
-                    self.db.update_training_job(job_id, status="running", progress=done/total, message=f"{done}/{total} finished")
-        if job_id:
-            self.db.update_training_job(job_id, status="finished", progress=1.0, message="Completed")
-        return True
+        # признаки последней свечи для предикта — инкрементально, без пересчёта всего окна на каждом тике
+        self.features = FeatureStream() if Config.STREAM_FEATURES else None
+        # признаки истории для обучения — из материализованного хранилища
+        self.feature_store = FeatureStore(db) if Config.FEATURE_STORE else None
+        # пул процессов (TRAIN_MODE=process) стартует при первом обучении; пары в него отдаёт TrainingScheduler
+        self.train_pool = TrainingPool()
+        # коэффициенты линейных моделей для пакетного инференса
+        self.linear_params = LinearParamsCache()
+        # (symbol, timeframe) -> ((open_time последней закрытой свечи, версия модели), pred, probs)
+        self._pred_cache = {}
+        self._pred_lock = threading.Lock()
+        self._pred_stats = {"ticks": 0, "computed": 0, "cache_hits": 0, "skipped": 0}
+
+    def plan(self, symbol):
+        # набор индикаторов символа со страницы настроек; некорректные настройки — набор по умолчанию
+        try:
+            return plan_for(self.db.get_indicator_settings(symbol))
+        except ValueError as e:
+            logger.warning("indicator settings for %s ignored: %s", symbol, e)
+            return DEFAULT_PLAN
 
     def _enough_bars(self, df_len: int, timeframe: str) -> bool:
         need = MIN_BARS_BY_TF.get(timeframe, 500)
         return df_len >= need
 
-    def _train_one_tf(self, symbol: str, timeframe: str, years: int, job_id: int=None):
+    def train_pair(self, symbol: str, timeframe: str, should_stop=None):
+        # одна пара: тайминги {"prepare_sec", "fit_sec", "save_sec", "pid"} — модель сохранена, None — учить нечего;
+        # TrainingCancelled — отменено (модель не тронута). В режиме process обучение идёт в пуле процессов
+        # время — CPU потока/процесса пула (thread_time), не wall: пары идут параллельно
+        t0 = time.thread_time()
+        task = self._prepare_tf(symbol, timeframe)
+        if task is None:
+            return None
+        t1 = time.thread_time()
+        if Config.TRAIN_MODE == "process":
+            model, acc, fit_sec, pid = self._fit_in_pool(task, should_stop)
+        else:
+            model, acc = fit_model(task.pop("X"), task.pop("y"), task["model"], should_stop=should_stop)
+            fit_sec, pid = time.thread_time() - t1, os.getpid()
+        t2 = time.thread_time()
+        self._save_fit(task, model, acc)
+        return {"prepare_sec": t1 - t0, "fit_sec": fit_sec, "save_sec": time.thread_time() - t2, "pid": pid}
+
+    def _fit_in_pool(self, task, should_stop=None):
+        # -> (model, acc, fit_sec, pid). X/y идут процессу через shared memory; процесс пула не прерывается
+        # посреди partial_fit: при отмене результат просто отбрасывается
+        shm, desc = share_arrays(X=task.pop("X"), y=task.pop("y"))
+        try:
+            fut = self.train_pool.executor().submit(fit_shared, desc, task["model"])
+            while True:
+                try:
+                    return fut.result(timeout=0.2)
+                except FutureTimeout:
+                    if should_stop is not None and should_stop():
+                        fut.cancel()
+                        raise TrainingCancelled()
+        finally:
+            shm.close()
+            shm.unlink()
+
+    def _prepare_tf(self, symbol: str, timeframe: str):
+        # данные для обучения пары: {"X", "y", "model" (None — полное обучение), ...} или None, если учить нечего
         df = self.db.load_ohlcv(symbol, timeframe)
         if df is None or df.empty:
             logger.warning("No data for %s %s", symbol, timeframe)
-            return False
+            return None
 
         if not self._enough_bars(len(df), timeframe):
             logger.warning("Not enough data for %s %s (have=%d, need=%d)", symbol, timeframe, len(df), MIN_BARS_BY_TF.get(timeframe, 500))
-            return False
+            return None
 
-        feats = build_features(df)
+        plan = self.plan(symbol)
+        feats = self.feature_store.features(symbol, timeframe, df, plan) if self.feature_store else feature_builder(plan)(df)
         labels = make_labels(df)
 
         # Сдвигаем, чтобы не использовать футуристическую информацию
         # Требуем минимум 2 строки для безопасного доступа [-2]
         if len(feats) < 2 or len(labels) < 2:
             logger.warning("Too few feature rows after build for %s %s", symbol, timeframe)
-            return False
+            return None
 
         X = feats.iloc[:-1].values
         y = labels.iloc[:-1].values
+        last_end = feats.index[-2].to_pydatetime()
+        task = {"symbol": symbol, "timeframe": timeframe, "columns": list(feats.columns), "plan": plan,
+                "last_end": last_end, "last_full_end": last_end, "model": None}
 
         # Проверяем существующую модель для инкремента
         meta = self.db.load_model(symbol, timeframe)
-        if meta and meta["model"] is not None and meta["last_full_train_end"]:
+        if meta and meta["model"] is not None and meta["last_full_train_end"] and meta["features"] != list(feats.columns):
+            # набор индикаторов поменялся — старую модель не дообучить, учим заново
+            logger.info("Feature set changed for %s %s, full retrain", symbol, timeframe)
+        elif meta and meta["model"] is not None and meta["last_full_train_end"]:
             last_seen = meta["last_incremental_train_end"] or meta["last_full_train_end"]
             mask = feats.index[:-1] > pd.Timestamp(last_seen)
-            X_new = feats[mask].values
-            y_new = labels[mask].values
+            X_new = X[mask]
             if len(X_new) >= max(50, int(0.05 * len(X))):
-                model = meta["model"]
-                model.named_steps["clf"].partial_fit(X_new, y_new, classes=CLASSES)
-                # оценка на последних N новых выборок
-                N = min(500, len(X_new))
-                yhat = model.predict(X_new[-N:])
-                acc = float(accuracy_score(y_new[-N:], yhat))
-                last_end = feats.index[-2] if len(feats) >= 2 else feats.index[-1]
-                self.db.save_model(
-                    symbol, timeframe, "SGDClassifier", model, CLASSES, list(feats.columns),
-                    last_full_end=meta["last_full_train_end"], last_incr_end=last_end.to_pydatetime(),
-                    metrics={"accuracy": acc}
-                )
-                logger.info("Incremental trained %s %s, acc=%.3f", symbol, timeframe, acc)
-                return True
-            else:
-                logger.info("No enough new data for incremental %s %s (new=%d)", symbol, timeframe, len(X_new))
-                return False
-
-        # Полное обучение
-        model = self._make_pipeline()
-        # Если мало данных, обучаем целиком за один проход
-        if len(X) <= 1024:
-            model.named_steps["clf"].partial_fit(X, y, classes=CLASSES)
-        else:
-            # Warm start на первом чанке
-            first_chunk = min(256, len(X))
-            model.named_steps["clf"].partial_fit(X[:first_chunk], y[:first_chunk], classes=CLASSES)
-            # Остальные чанки
-            for start in range(first_chunk, len(X), 1024):
-                end = min(len(X), start + 1024)
-                model.named_steps["clf"].partial_fit(X[start:end], y[start:end])
-
-        # Оценка
-        N = min(1000, len(X))
-        yhat = model.predict(X[-N:])
-        acc = float(accuracy_score(y[-N:], yhat))
-        last_end = feats.index[-2] if len(feats) >= 2 else feats.index[-1]
+                task.update(X=X_new, y=y[mask], model=meta["model"], last_full_end=meta["last_full_train_end"])
+                return task
+            logger.info("No enough new data for incremental %s %s (new=%d)", symbol, timeframe, len(X_new))
+            return None
+
+        task.update(X=X, y=y)
+        return task
+
+    def _save_fit(self, task, model, acc):
+        symbol, timeframe = task["symbol"], task["timeframe"]
         self.db.save_model(
-            symbol, timeframe, "SGDClassifier", model, CLASSES, list(feats.columns),
-            last_full_end=last_end.to_pydatetime(), last_incr_end=last_end.to_pydatetime(),
-            metrics={"accuracy": acc}
+            symbol, timeframe, "SGDClassifier", model, CLASSES, task["columns"],
+            last_full_end=task["last_full_end"], last_incr_end=task["last_end"],
+            metrics={"accuracy": acc}, indicators=task["plan"].spec
         )
-        logger.info("Full trained %s %s, acc=%.3f", symbol, timeframe, acc)
-        return True
+        logger.info("%s trained %s %s, acc=%.3f", "Incremental" if task["model"] is not None else "Full", symbol, timeframe, acc)
+
+    def _latest_features(self, symbol, tf, df, meta):
+        # вектор признаков последней свечи в порядке колонок модели. Колонки из build_features (любое
+        # подмножество) — из потокового состояния, иначе — план индикаторов, с которым модель обучена
+        cols = meta["features"]
+        if self.features is not None and cols and set(cols) <= set(FEATURE_COLUMNS):
+            X = self.features.latest(symbol, tf, df)
+            return X if cols == FEATURE_COLUMNS else X[:, [FEATURE_COLUMNS.index(c) for c in cols]]
+        plan = compile_plan(meta["indicators"]) if meta.get("indicators") else DEFAULT_PLAN
+        return plan(df)[cols].values[-1:].copy() if cols else plan(df).values[-1:].copy()
 
-    def predict_hierarchical(self, symbol: str, timeframes: list, latest_windows: dict):
+    def _prepare_prediction(self, symbol, tf, df, now_ms):
+        # -> ("done", pred, probs) — готовый ответ (нет модели/данных или попадание в кэш)
+        #    ("row", X, meta, cache_key) — строку признаков нужно прогнать через модель
+        meta = self.db.load_model_cached(symbol, tf)
+        if df is None or df.empty or not meta or meta["model"] is None:
+            return ("done", None, None)
+        key = None
+        if Config.PREDICT_CACHE and tf in Config.PREDICT_CACHE_TFS and tf in TF_TO_MS:
+            # незакрытая свеча старшего ТФ не участвует: ответ меняется только на закрытии свечи
+            last_ms = int(index_to_ms(df.index[-1:])[0])
+            if last_ms + TF_TO_MS[tf] > now_ms:
+                df = df.iloc[:-1]
+                if df.empty:
+                    return ("done", None, None)
+                last_ms = int(index_to_ms(df.index[-1:])[0])
+            key = (last_ms, meta["version"])
+            with self._pred_lock:
+                hit = self._pred_cache.get((symbol, tf))
+                if hit is not None and hit[0] == key:
+                    self._pred_stats["cache_hits"] += 1
+                    return ("done", hit[1], hit[2])
+        X = self._latest_features(symbol, tf, df, meta)
+        if not len(X):
+            return ("done", None, None)
+        return ("row", X, meta, key)
+
+    def _finish_prediction(self, symbol, tf, pred, pb, key):
+        with self._pred_lock:
+            self._pred_stats["computed"] += 1
+            if key is not None:
+                self._pred_cache[(symbol, tf)] = (key, pred, pb)
+
+    @staticmethod
+    def _chain(timeframes):
+        # ТФ иерархии сверху вниз; остальные запрошенные ТФ в консенсусе не участвуют
+        order = [tf for tf in HIERARCHY if tf in timeframes]
+        return order, [tf for tf in timeframes if tf not in order]
+
+    def predict_hierarchical(self, symbol: str, timeframes: list, latest_windows: dict, now_ms: int=None):
+        now_ms = int(time.time() * 1000) if now_ms is None else now_ms
         preds = {}
         probs = {}
-        for tf in timeframes:
-            df = latest_windows.get(tf)
-            meta = self.db.load_model(symbol, tf)
-            if (df is not None) and (not df.empty) and meta and (meta["model"] is not None):
-                feats = build_features(df)
-                if feats.empty:
-                    preds[tf] = None
-                    probs[tf] = None
-                    continue
-                X = feats.values[-1:].copy()
+        order, rest = self._chain(timeframes)
+        dir_ref = None
+        broken = False
+        for tf in order + rest:
+            if broken and tf in order:
+                # консенсус уже 0 — младшие ТФ иерархии не считаем
+                preds[tf] = probs[tf] = None
+                with self._pred_lock:
+                    self._pred_stats["skipped"] += 1
+                continue
+            prep = self._prepare_prediction(symbol, tf, latest_windows.get(tf), now_ms)
+            if prep[0] == "done":
+                preds[tf], probs[tf] = prep[1], prep[2]
+            else:
+                _, X, meta, key = prep
                 if hasattr(meta["model"], "predict_proba"):
-                    pr = meta["model"].predict_proba(X)[0]
-                    cls = meta["classes"].tolist()
-                    def get_prob(val):
-                        return float(pr[cls.index(val)]) if val in cls else 0.0
-                    pb = {"buy": get_prob(1), "hold": get_prob(0), "sell": get_prob(-1)}
-                    probs[tf] = pb
-                    preds[tf] = 1 if pb["buy"] >= pb["sell"] and pb["buy"] >= pb["hold"] else (-1 if pb["sell"] > pb["hold"] else 0)
+                    preds[tf], probs[tf] = self._signal(meta["model"].predict_proba(X)[0], meta["classes"])
                 else:
                     yh = int(meta["model"].predict(X)[0])
                     preds[tf] = yh
                     probs[tf] = {"buy": 0.5 if yh == 1 else 0.0, "hold": 0.5 if yh == 0 else 0.0, "sell": 0.5 if yh == -1 else 0.0}
-            else:
-                preds[tf] = None
-                probs[tf] = None
+                self._finish_prediction(symbol, tf, preds[tf], probs[tf], key)
+            if tf in order and Config.PREDICT_CACHE:
+                broken = preds[tf] is None or (dir_ref is not None and preds[tf] != dir_ref)
+                dir_ref = preds[tf] if dir_ref is None else dir_ref
+        with self._pred_lock:
+            self._pred_stats["ticks"] += 1
+        return self._consensus({tf: preds[tf] for tf in timeframes}, {tf: probs[tf] for tf in timeframes}, timeframes)
+
+    def predict_universe(self, timeframes: list, windows: dict, now_ms: int=None):
+        # predict_hierarchical для всех символов сразу: windows = {symbol: {tf: df}} -> {symbol: результат}.
+        # Иерархия считается по уровням (1w у всех символов, затем 1d у тех, где цепочка не прервана, ...);
+        # на каждом уровне строки признаков всех пар с линейной моделью — одна пачка (batch_inference.py)
+        now_ms = int(time.time() * 1000) if now_ms is None else now_ms
+        preds = {s: {} for s in windows}
+        probs = {s: {} for s in windows}
+        order, rest = self._chain(timeframes)
+        active = set(windows)
+        dir_ref = {}
+        for level in [[tf] for tf in order] + [rest]:
+            groups = {}  # форма coef_ -> [(symbol, tf, row, params, classes, key)]
+            for symbol in windows:
+                for tf in level:
+                    if tf in order and symbol not in active:
+                        preds[symbol][tf] = probs[symbol][tf] = None
+                        with self._pred_lock:
+                            self._pred_stats["skipped"] += 1
+                        continue
+                    prep = self._prepare_prediction(symbol, tf, windows[symbol].get(tf), now_ms)
+                    if prep[0] == "done":
+                        preds[symbol][tf], probs[symbol][tf] = prep[1], prep[2]
+                        continue
+                    _, X, meta, key = prep
+                    params = self.linear_params.get(symbol, tf, meta)
+                    if params is not None and params.coef.shape[1] == X.shape[1]:
+                        groups.setdefault(params.coef.shape, []).append((symbol, tf, X[0], params, meta["classes"], key))
+                        continue
+                    if hasattr(meta["model"], "predict_proba"):
+                        preds[symbol][tf], probs[symbol][tf] = self._signal(meta["model"].predict_proba(X)[0], meta["classes"])
+                    else:
+                        yh = int(meta["model"].predict(X)[0])
+                        preds[symbol][tf] = yh
+                        probs[symbol][tf] = {"buy": 0.5 if yh == 1 else 0.0, "hold": 0.5 if yh == 0 else 0.0, "sell": 0.5 if yh == -1 else 0.0}
+                    self._finish_prediction(symbol, tf, preds[symbol][tf], probs[symbol][tf], key)
+            for rows in groups.values():
+                P = predict_proba_batch(np.vstack([r[2] for r in rows]), [r[3] for r in rows])
+                for (symbol, tf, _, _, classes, key), pr in zip(rows, P):
+                    preds[symbol][tf], probs[symbol][tf] = self._signal(pr, classes)
+                    self._finish_prediction(symbol, tf, preds[symbol][tf], probs[symbol][tf], key)
+            if Config.PREDICT_CACHE and level and level[0] in order:
+                tf = level[0]
+                for symbol in list(active):
+                    p = preds[symbol][tf]
+                    if p is None or dir_ref.setdefault(symbol, p) != p:
+                        active.discard(symbol)
+        with self._pred_lock:
+            self._pred_stats["ticks"] += len(windows)
+        return {s: self._consensus({tf: preds[s][tf] for tf in timeframes}, {tf: probs[s][tf] for tf in timeframes}, timeframes)
+                for s in windows}
+
+    def prediction_stats(self):
+        with self._pred_lock:
+            out = dict(self._pred_stats)
+            out["cached_pairs"] = len(self._pred_cache)
+        return out
+
+    @staticmethod
+    def _signal(pr, classes):
+        cls = classes.tolist()
+        def get_prob(val):
+            return float(pr[cls.index(val)]) if val in cls else 0.0
+        pb = {"buy": get_prob(1), "hold": get_prob(0), "sell": get_prob(-1)}
+        pred = 1 if pb["buy"] >= pb["sell"] and pb["buy"] >= pb["hold"] else (-1 if pb["sell"] > pb["hold"] else 0)
+        return pred, pb
 
+    @staticmethod
+    def _consensus(preds, probs, timeframes):
         # Иерархия (старшие подтверждают): 1w -> 1d -> 4h -> 1h -> 15m
-        order = ["1w", "1d", "4h", "1h", "15m"]
-        order = [tf for tf in order if tf in timeframes]
+        order = [tf for tf in HIERARCHY if tf in timeframes]
         final = 0
         confidence = 0.0
         ok = True
@@ -0,0 +1,47 @@
+import threading
+import logging
+
+logger = logging.getLogger("model_registry")
+
+class ModelRegistry:
+    # In-process реестр десериализованных моделей: (symbol, timeframe) -> (version, meta).
+    # Перед выдачей сверяется только models.version (дешёвый индексный запрос) вместо
+    # чтения BLOB и joblib.load на каждом тике.
+    def __init__(self, db):
+        self.db = db
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._stats = {"hits": 0, "loads": 0, "invalidations": 0}
+
+    def get(self, symbol, timeframe):
+        key = (symbol, timeframe)
+        version = self.db.get_model_version(symbol, timeframe)
+        if version is None:
+            self.invalidate(symbol, timeframe)
+            return None
+        with self._lock:
+            cached = self._entries.get(key)
+            if cached and cached[0] == version:
+                self._stats["hits"] += 1
+                return cached[1]
+        meta = self.db.load_model(symbol, timeframe)
+        with self._lock:
+            self._stats["loads"] += 1
+            if meta is not None:
+                cur = self._entries.get(key)
+                if cur is None or cur[0] <= meta["version"]:
+                    self._entries[key] = (meta["version"], meta)
+        return meta
+
+    def invalidate(self, symbol=None, timeframe=None):
+        with self._lock:
+            for key in list(self._entries):
+                if (symbol is None or key[0] == symbol) and (timeframe is None or key[1] == timeframe):
+                    del self._entries[key]
+                    self._stats["invalidations"] += 1
+
+    def stats(self):
+        with self._lock:
+            out = dict(self._stats)
+            out["entries"] = len(self._entries)
+        return out
@@ -67,9 +67,9 @@ class NewsIngestor:
                         items.append((title, link, published, desc))
                     except Exception:
                         continue
-                for (title, link, published, desc) in items:
-                    sent = simple_sentiment(title + " " + desc)
-                    self.db.add_news(provider=url, title=title, url=link, published_at=published, summary=desc, sentiment=sent, symbols_csv="")
+                rows = [(url, title, link, published, desc, simple_sentiment(title + " " + desc), "")
+                        for (title, link, published, desc) in items]
+                self.db.add_news_batch(rows)
                 logger.info("news fetched %s items from %s", len(items), url)
             except Exception as e:
                 logger.debug("news fetch error %s: %s", url, e)
\ No newline at end of file
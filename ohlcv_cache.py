@@ -0,0 +1,131 @@
+import threading
+import logging
+from collections import OrderedDict
+import pandas as pd
+from config import Config
+
+logger = logging.getLogger("ohlcv_cache")
+
+COLUMNS = ["open", "high", "low", "close", "volume"]
+
+def _naive(ts):
+    t = pd.Timestamp(ts)
+    return t.tz_convert(None) if t.tzinfo is not None else t
+
+class OHLCVCache:
+    # Общий LRU-кэш свечей по (symbol, timeframe), ограниченный суммарным числом строк.
+    # Запись покрывает [start, tail] (start=None — вся история); при повторном чтении
+    # из БД дочитывается только хвост начиная с последней закэшированной свечи.
+    def __init__(self, max_rows=None):
+        self.max_rows = Config.OHLCV_CACHE_MAX_ROWS if max_rows is None else max_rows
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> {"df", "start", "version"}
+        self._rows = 0
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0, "tail_queries": 0, "tail_rows": 0,
+                       "upsert_appends": 0, "upsert_merges": 0}
+
+    def load(self, symbol, timeframe, since, limit, loader):
+        key = (symbol, timeframe)
+        since_ts = _naive(since) if since else None
+        with self._lock:
+            entry = self._entries.get(key)
+            covered = entry is not None and (entry["start"] is None or (since_ts is not None and since_ts >= entry["start"]))
+            if covered:
+                self._entries.move_to_end(key)
+                self._stats["hits"] += 1
+            else:
+                self._stats["misses"] += 1
+
+        if not covered:
+            if limit and since_ts is None:
+                # "первые N свечей истории" — не повод тянуть в кэш всю историю
+                return loader(symbol, timeframe, since=since, limit=limit)
+            df = loader(symbol, timeframe, since=since)
+            self._store(key, df, since_ts, expected_version=None)
+        else:
+            base = entry["df"]
+            if base.empty:
+                fresh = loader(symbol, timeframe, since=since)
+                df = fresh
+            else:
+                # последнюю свечу перечитываем: она могла быть обновлена мимо кэша
+                tail = base.index[-1]
+                fresh = loader(symbol, timeframe, since=tail.to_pydatetime())
+                df = pd.concat([base.iloc[:-1], fresh]) if not fresh.empty else base
+            with self._lock:
+                self._stats["tail_queries"] += 1
+                self._stats["tail_rows"] += max(0, len(fresh) - 1)
+            if len(fresh) > 1 or base.empty:
+                self._store(key, df, entry["start"], expected_version=entry["version"])
+
+        out = df.iloc[df.index.searchsorted(since_ts, side="left"):] if since_ts is not None else df
+        if limit:
+            out = out.head(int(limit))
+        return out.copy()
+
+    def _store(self, key, df, start, expected_version):
+        with self._lock:
+            cur = self._entries.get(key)
+            if expected_version is not None and (cur is None or cur["version"] != expected_version):
+                # запись успела измениться (upsert/другой поток) — не перетираем её устаревшей копией
+                return
+            if len(df) > self.max_rows:
+                return
+            if cur is not None:
+                self._rows -= len(cur["df"])
+            self._entries[key] = {"df": df, "start": start, "version": (cur["version"] + 1) if cur else 0}
+            self._entries.move_to_end(key)
+            self._rows += len(df)
+            self._evict()
+
+    def _evict(self):
+        while self._rows > self.max_rows and len(self._entries) > 1:
+            _, old = self._entries.popitem(last=False)
+            self._rows -= len(old["df"])
+            self._stats["evictions"] += 1
+
+    def apply_upsert(self, symbol, timeframe, df: pd.DataFrame):
+        # Вызывается после коммита upsert: дописываем хвост в закэшированную запись вместо инвалидации
+        if df is None or df.empty:
+            return
+        key = (symbol, timeframe)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return
+            base = entry["df"]
+            new = df[COLUMNS].astype("float64")
+            idx = pd.DatetimeIndex(new.index)
+            if idx.tz is not None:
+                idx = idx.tz_convert(None)
+            if not base.empty:
+                idx = idx.astype(base.index.dtype)
+            new.index = idx.rename("open_time")
+            new = new[~new.index.duplicated(keep="last")].sort_index()
+            if entry["start"] is not None:
+                new = new[new.index >= entry["start"]]
+            if new.empty:
+                return
+            if base.empty or new.index[0] >= base.index[-1]:
+                # типичный случай: обновилась последняя свеча и/или пришли новые
+                keep = base.iloc[:-1] if not base.empty and new.index[0] == base.index[-1] else base
+                merged = pd.concat([keep, new]) if not keep.empty else new
+                self._stats["upsert_appends"] += 1
+            else:
+                merged = pd.concat([base[~base.index.isin(new.index)], new]).sort_index()
+                self._stats["upsert_merges"] += 1
+            self._rows += len(merged) - len(base)
+            self._entries[key] = {"df": merged, "start": entry["start"], "version": entry["version"] + 1}
+            self._evict()
+
+    def invalidate(self, symbol=None, timeframe=None):
+        with self._lock:
+            for key in list(self._entries):
+                if (symbol is None or key[0] == symbol) and (timeframe is None or key[1] == timeframe):
+                    self._rows -= len(self._entries.pop(key)["df"])
+
+    def stats(self):
+        with self._lock:
+            out = dict(self._stats)
+            out.update(entries=len(self._entries), rows=self._rows, max_rows=self.max_rows)
+        return out
@@ -0,0 +1,47 @@
+import numpy as np
+import pandas as pd
+from ohlcv_store import COLUMNS, index_to_ms, ms_to_index, empty_ohlcv_frame
+
+TF_TO_MS = {
+    "1m": 60_000, "3m": 180_000, "5m": 300_000, "15m": 900_000, "30m": 1_800_000,
+    "1h": 3_600_000, "2h": 7_200_000, "4h": 14_400_000, "1d": 86_400_000, "1w": 604_800_000
+}
+# 1970-01-01 — четверг; недельные свечи Binance начинаются в понедельник 00:00 UTC (1970-01-05)
+WEEK_OFFSET_MS = 4 * 86_400_000
+
+def can_derive(base_tf, target_tf):
+    base, target = TF_TO_MS.get(base_tf), TF_TO_MS.get(target_tf)
+    return bool(base and target) and target > base and target % base == 0
+
+def bucket_start_ms(ms, timeframe):
+    # начало свечи timeframe, в которую попадает время ms (границы как у биржи: от полуночи UTC / понедельника)
+    step = TF_TO_MS[timeframe]
+    offset = WEEK_OFFSET_MS if timeframe == "1w" else 0
+    ms = np.asarray(ms, dtype="int64")
+    return (ms - offset) // step * step + offset
+
+def resample_ohlcv(df: pd.DataFrame, base_tf, target_tf, drop_partial_head=False):
+    # df — свечи base_tf (индекс open_time, отсортирован); возвращает (свечи target_tf, число базовых свечей в каждой)
+    if not can_derive(base_tf, target_tf):
+        raise ValueError(f"cannot derive {target_tf} from {base_tf}")
+    if df is None or df.empty:
+        return empty_ohlcv_frame(), np.empty(0, dtype="int64")
+    ms = index_to_ms(df.index)
+    buckets = bucket_start_ms(ms, target_tf)
+    starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+    counts = np.diff(np.r_[starts, len(ms)])
+    if drop_partial_head and ms[0] > buckets[0]:
+        # история начинается посреди свечи — такая свеча у биржи полная, у нас нет; не выдаём её
+        starts, counts = starts[1:], counts[1:]
+        if not len(starts):
+            return empty_ohlcv_frame(), np.empty(0, dtype="int64")
+    ends = starts + counts
+    v = {c: df[c].to_numpy(dtype="float64") for c in COLUMNS}
+    out = pd.DataFrame({
+        "open": v["open"][starts],
+        "high": np.maximum.reduceat(v["high"], starts),
+        "low": np.minimum.reduceat(v["low"], starts),
+        "close": v["close"][ends - 1],
+        "volume": np.add.reduceat(v["volume"], starts),
+    }, index=ms_to_index(buckets[starts]))
+    return out, counts
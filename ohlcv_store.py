@@ -0,0 +1,197 @@
+import argparse
+import os
+import threading
+import logging
+import numpy as np
+import pandas as pd
+from config import Config
+
+logger = logging.getLogger("ohlcv_store")
+
+# Одна запись = свеча: int64 epoch-ms + float64 OHLCV (48 байт), файл только дописывается или подменяется целиком
+OHLCV_DTYPE = np.dtype([("t", "<i8"), ("open", "<f8"), ("high", "<f8"), ("low", "<f8"), ("close", "<f8"), ("volume", "<f8")])
+COLUMNS = ["open", "high", "low", "close", "volume"]
+# Разрешение, которое pandas выбирает при разборе текстовых дат из SQLite (ns в pandas 2, us в pandas 3)
+_SQL_TIME_DTYPE = pd.to_datetime(["2021-01-01 00:00:00"]).dtype
+
+def to_epoch_ms(ts):
+    t = pd.Timestamp(ts)
+    if t.tzinfo is not None:
+        t = t.tz_convert(None)
+    return int(t.value // 1_000_000)
+
+def index_to_ms(index):
+    idx = pd.DatetimeIndex(index)
+    if idx.tz is not None:
+        idx = idx.tz_convert(None)
+    return idx.as_unit("ms").asi8
+
+def ms_to_index(ms):
+    # epoch-ms -> DatetimeIndex того же вида, что load_ohlcv получал из SQLite
+    return pd.DatetimeIndex(np.asarray(ms, dtype="int64").astype("datetime64[ms]").astype(_SQL_TIME_DTYPE), name="open_time")
+
+def empty_ohlcv_frame():
+    return pd.DataFrame({c: np.empty(0, dtype="float64") for c in COLUMNS}, index=ms_to_index([]))
+
+def frame_to_records(df: pd.DataFrame):
+    rec = np.empty(len(df), dtype=OHLCV_DTYPE)
+    rec["t"] = index_to_ms(df.index)
+    for c in COLUMNS:
+        rec[c] = df[c].to_numpy(dtype="float64")
+    # сортировка + дедупликация по времени (последняя строка побеждает)
+    order = np.argsort(rec["t"], kind="stable")
+    rec = rec[order]
+    if len(rec) > 1:
+        keep = np.ones(len(rec), dtype=bool)
+        keep[:-1] = rec["t"][1:] != rec["t"][:-1]
+        rec = rec[keep]
+    return rec
+
+def columnar_dir(db_path=None):
+    # файлы — производная копия свечей конкретной БД: две БД не должны делить один каталог
+    return Config.COLUMNAR_DIR or os.path.splitext(db_path or Config.DB_PATH)[0] + "_ohlcv"
+
+class ColumnarOHLCVStore:
+    def __init__(self, base_dir=None):
+        self.base_dir = base_dir or columnar_dir()
+        os.makedirs(self.base_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        # path -> ((nrows, inode, mtime), memmap); переоткрываем, если файл вырос/был переписан
+        self._maps = {}
+
+    def path(self, symbol, timeframe):
+        return os.path.join(self.base_dir, f"{symbol.replace('/', '-')}_{timeframe}.ohlcv")
+
+    def exists(self, symbol, timeframe):
+        return os.path.exists(self.path(symbol, timeframe))
+
+    def pairs(self):
+        out = []
+        for name in sorted(os.listdir(self.base_dir)):
+            if name.endswith(".ohlcv"):
+                sym, tf = name[:-len(".ohlcv")].rsplit("_", 1)
+                out.append((sym.replace("-", "/"), tf))
+        return out
+
+    def _map(self, symbol, timeframe):
+        p = self.path(symbol, timeframe)
+        try:
+            st = os.stat(p)
+        except FileNotFoundError:
+            return None
+        # хвостовая неполная запись (обрыв при дозаписи) игнорируется
+        n = st.st_size // OHLCV_DTYPE.itemsize
+        key = (n, st.st_ino, st.st_mtime_ns)
+        cached = self._maps.get(p)
+        if cached and cached[0] == key:
+            return cached[1]
+        mm = np.memmap(p, dtype=OHLCV_DTYPE, mode="r", shape=(n,)) if n else np.empty(0, dtype=OHLCV_DTYPE)
+        self._maps[p] = (key, mm)
+        return mm
+
+    def last_time_ms(self, symbol, timeframe):
+        mm = self._map(symbol, timeframe)
+        return int(mm["t"][-1]) if mm is not None and len(mm) else None
+
+    def read(self, symbol, timeframe, since=None, limit=None):
+        mm = self._map(symbol, timeframe)
+        if mm is None or not len(mm):
+            return self._frame(np.empty(0, dtype=OHLCV_DTYPE))
+        t = mm["t"]
+        start = int(np.searchsorted(t, to_epoch_ms(since), side="left")) if since else 0
+        end = min(len(mm), start + int(limit)) if limit else len(mm)
+        return self._frame(mm, start, end)
+
+    def _frame(self, mm, start=0, end=0):
+        n = max(0, end - start)
+        if n == 0:
+            return empty_ohlcv_frame()
+        # (n, 5) float64-вид поверх записей memmap без копирования
+        values = np.ndarray(
+            shape=(n, len(COLUMNS)), dtype="<f8", buffer=mm,
+            offset=start * OHLCV_DTYPE.itemsize + OHLCV_DTYPE.fields["open"][1],
+            strides=(OHLCV_DTYPE.itemsize, 8),
+        )
+        return pd.DataFrame(values, index=ms_to_index(mm["t"][start:end]), columns=COLUMNS, copy=False)
+
+    def write(self, symbol, timeframe, df: pd.DataFrame):
+        rec = frame_to_records(df) if df is not None and len(df) else np.empty(0, dtype=OHLCV_DTYPE)
+        p = self.path(symbol, timeframe)
+        with self._lock:
+            mm = self._map(symbol, timeframe)
+            if mm is None or not len(mm):
+                self._rewrite(p, rec)
+                return len(rec)
+            t = mm["t"]
+            last = int(t[-1])
+            tail = rec["t"] > last
+            head = rec[~tail]
+            if len(head):
+                pos = np.searchsorted(t, head["t"])
+                pos_c = np.minimum(pos, len(t) - 1)
+                matched = t[pos_c] == head["t"]
+                if not matched.all():
+                    # свечи в середину истории (заполнение дыр) — файл переписывается целиком
+                    merged = np.concatenate([np.asarray(mm), rec])
+                    merged = merged[np.argsort(merged["t"], kind="stable")]
+                    keep = np.ones(len(merged), dtype=bool)
+                    keep[:-1] = merged["t"][1:] != merged["t"][:-1]
+                    self._rewrite(p, merged[keep])
+                    return len(rec)
+                changed = mm[pos_c] != head
+                if changed.any():
+                    # обновление существующих свечей (обычно последней). На месте писать нельзя: read() отдаёт
+                    # кадры поверх memmap без копирования, и их держат кэш и построители признаков —
+                    # новая версия файла пишется рядом и подменяется rename, старые отображения не меняются
+                    merged = np.array(mm)
+                    merged[pos_c] = head
+                    self._rewrite(p, np.concatenate([merged, rec[tail]]))
+                    return len(rec)
+            if tail.any():
+                with open(p, "ab") as f:
+                    # выравниваем обрезанную запись, если прошлая дозапись оборвалась
+                    f.truncate(len(t) * OHLCV_DTYPE.itemsize)
+                    f.write(rec[tail].tobytes())
+            self._maps.pop(p, None)
+        return len(rec)
+
+    def replace(self, symbol, timeframe, df: pd.DataFrame):
+        rec = frame_to_records(df) if df is not None and len(df) else np.empty(0, dtype=OHLCV_DTYPE)
+        with self._lock:
+            self._rewrite(self.path(symbol, timeframe), rec)
+        return len(rec)
+
+    def _rewrite(self, p, rec):
+        tmp = p + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(np.ascontiguousarray(rec).tobytes())
+        os.replace(tmp, p)
+        self._maps.pop(p, None)
+
+def migrate_from_sqlite(db, store: ColumnarOHLCVStore, pairs=None):
+    # Полная выгрузка historical_data в колоночные файлы (перезаписывает существующие)
+    pairs = pairs or db.ohlcv_pairs()
+    total = 0
+    for symbol, timeframe in pairs:
+        df = db.load_ohlcv_sqlite(symbol, timeframe)
+        n = store.replace(symbol, timeframe, df)
+        total += n
+        logger.info("migrated %s %s: %d candles", symbol, timeframe, n)
+    return total
+
+def main():
+    from config import configure_logging
+    from database import DatabaseManager
+    configure_logging()
+    p = argparse.ArgumentParser(description="columnar OHLCV store tools")
+    sub = p.add_subparsers(dest="cmd", required=True)
+    m = sub.add_parser("migrate", help="выгрузить historical_data из SQLite в колоночные файлы")
+    m.add_argument("--db", default=Config.DB_PATH)
+    m.add_argument("--dir", default=None, help="по умолчанию — каталог рядом с --db")
+    args = p.parse_args()
+    if args.cmd == "migrate":
+        total = migrate_from_sqlite(DatabaseManager(args.db), ColumnarOHLCVStore(args.dir or columnar_dir(args.db)))
+        logger.info("migration done: %d candles", total)
+
+if __name__ == "__main__":
+    main()
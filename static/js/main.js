@@ -10,8 +10,8 @@ async function fetchJson(url, opts) {
 async function refreshAccounts() {
   const main = await fetchJson("/api/account?network=mainnet");
   const test = await fetchJson("/api/account?network=testnet");
-  document.getElementById("acc_mainnet").innerHTML = `Баланс: ${main.data.balance_usdt ?? "—"} | Закрытых: ${main.data.closed_trades} | PnL: ${main.data.total_pnl_percent.toFixed(2)}%`;
-  document.getElementById("acc_testnet").innerHTML = `Баланс: ${test.data.balance_usdt ?? "—"} | Открытых: ${test.data.open_positions} | PnL: ${test.data.total_pnl_percent.toFixed(2)}%`;
+  document.getElementById("acc_mainnet").innerHTML = `Баланс: ${main.data.balance_usdt ?? "—"} | Закрытых: ${main.data.closed_trades} | PnL: ${main.data.total_pnl_percent.toFixed(2)}% | Win rate: ${main.data.win_rate==null? "—" : (main.data.win_rate*100).toFixed(0)+"%"}`;
+  document.getElementById("acc_testnet").innerHTML = `Баланс: ${test.data.balance_usdt ?? "—"} | Открытых: ${test.data.open_positions} | PnL: ${test.data.total_pnl_percent.toFixed(2)}% | Win rate: ${test.data.win_rate==null? "—" : (test.data.win_rate*100).toFixed(0)+"%"}`;
   document.getElementById("ws_status").innerHTML = `<span class="badge bg-success">активен</span>`;
 }
 
@@ -45,7 +45,8 @@ async function refreshTrades() {
 }
 
 async function refreshNews() {
-  const js = await fetchJson("/api/news?hours=24");
+  const q = (document.getElementById("news_query")?.value || "").trim();
+  const js = await fetchJson(q ? `/api/news/search?q=${encodeURIComponent(q)}` : "/api/news?hours=24");
   const tb = document.querySelector("#news_table tbody");
   tb.innerHTML = "";
   (js.data||[]).forEach(n=>{
@@ -60,4 +61,5 @@ async function refreshNews() {
 
 document.getElementById("btn_refresh_pairs")?.addEventListener("click", refreshPairs);
 document.getElementById("btn_refresh_trades")?.addEventListener("click", refreshTrades);
-document.getElementById("btn_refresh_news")?.addEventListener("click", refreshNews);
\ No newline at end of file
+document.getElementById("btn_refresh_news")?.addEventListener("click", refreshNews);
+document.getElementById("news_query")?.addEventListener("keydown", e=>{ if (e.key==="Enter") refreshNews(); });
\ No newline at end of file
@@ -0,0 +1,76 @@
+async function fetchJson(url, opts) {
+  const res = await fetch(url, opts);
+  const txt = await res.text();
+  if (!res.ok) throw new Error(txt);
+  return JSON.parse(txt);
+}
+
+let _symbolsLoaded = false;
+let _state = null;
+
+async function loadIndicators() {
+  const sel = document.getElementById("ind_symbol");
+  const js = await fetchJson(`/api/indicators?symbol=${encodeURIComponent(sel.value)}`);
+  if (!_symbolsLoaded) {
+    js.symbols.forEach(s => { const o = document.createElement("option"); o.value = s; o.textContent = s; sel.appendChild(o); });
+    _symbolsLoaded = true;
+  }
+  _state = js;
+  // у пары строка либо наследует общие настройки, либо переопределяет их (правка поля снимает "Общие")
+  const perSymbol = js.symbol !== "*";
+  document.getElementById("ind_inherit_head").style.display = perSymbol ? "" : "none";
+  const rows = js.data.map(ind => {
+    const inherit = perSymbol && !(ind.name in js.overrides);
+    const params = Object.entries(ind.params).map(([k, v]) =>
+      `<label class="me-2">${k} <input class="form-control form-control-sm d-inline-block" style="width:5rem" data-ind="${ind.name}" data-param="${k}" value="${v}" oninput="overrideRow('${ind.name}')"></label>`
+    ).join("") || '<span class="text-muted">—</span>';
+    const inheritCell = perSymbol
+      ? `<td><input type="checkbox" class="form-check-input" data-inherit="${ind.name}" ${inherit ? "checked" : ""}></td>` : "";
+    return `<tr>${inheritCell}
+      <td><input type="checkbox" class="form-check-input" data-ind="${ind.name}" ${ind.enabled ? "checked" : ""} onchange="overrideRow('${ind.name}')"></td>
+      <td>${ind.title}</td><td>${params}</td><td class="small text-muted">${ind.columns.join(", ")}</td></tr>`;
+  });
+  document.getElementById("ind_table").innerHTML = rows.join("");
+  document.getElementById("ind_status").textContent = `Признаков: ${js.columns.length}`;
+}
+
+function overrideRow(name) {
+  const cb = document.querySelector(`#ind_table input[data-inherit="${name}"]`);
+  if (cb) cb.checked = false;
+}
+
+async function postIndicators(indicators) {
+  const symbol = document.getElementById("ind_symbol").value;
+  try {
+    const js = await fetchJson("/api/indicators", {method:"POST", headers:{"Content-Type":"application/json"}, body: JSON.stringify({symbol, indicators})});
+    document.getElementById("ind_status").textContent = `Сохранено, признаков: ${js.columns.length}`;
+    loadIndicators();
+  } catch (e) {
+    document.getElementById("ind_status").textContent = `Ошибка: ${e.message}`;
+  }
+}
+
+function saveIndicators() {
+  // общие настройки — все строки; у пары — только переопределённые строки и только параметры, отличные от общих
+  const perSymbol = _state && _state.symbol !== "*";
+  const items = {};
+  document.querySelectorAll("#ind_table input[data-ind]:not([data-param])").forEach(cb => {
+    const inherit = document.querySelector(`#ind_table input[data-inherit="${cb.dataset.ind}"]`);
+    if (inherit && inherit.checked) return;
+    items[cb.dataset.ind] = {name: cb.dataset.ind, enabled: cb.checked, params: {}};
+  });
+  document.querySelectorAll("#ind_table input[data-param]").forEach(inp => {
+    const item = items[inp.dataset.ind];
+    if (!item) return;
+    const v = Number(inp.value);
+    if (perSymbol && _state.global[inp.dataset.ind].params[inp.dataset.param] === v) return;
+    item.params[inp.dataset.param] = v;
+  });
+  postIndicators(Object.values(items));
+}
+
+function resetIndicators() {
+  postIndicators([]);
+}
+
+window.addEventListener("load", loadIndicators);
@@ -11,12 +11,29 @@ async function syncHistory() {
   const timeframes = Array.from(document.getElementById("train_tfs").selectedOptions).map(o=>o.value);
   const body = {symbol, years, timeframes};
   const js = await fetchJson("/api/sync_history", {method:"POST", headers:{"Content-Type":"application/json"}, body: JSON.stringify(body)});
-  alert("Синхронизация запущена");
+  _syncId = js.job_id;
+  document.getElementById("sync_job_box").innerHTML = `sync ${_syncId}: <span class="badge bg-info">queued</span>`;
+  pollSync();
+}
+
+let _syncId = null;
+async function pollSync() {
+  if (!_syncId) return;
+  const js = await fetchJson(`/api/sync/${_syncId}`);
+  const d = js.data;
+  document.getElementById("sync_job_box").innerHTML = `
+    <div>Задача ${d.id}: ${d.symbols.join(", ")} [${d.timeframes.join(", ")}]</div>
+    <div>Статус: <span class="badge ${d.status=='finished'?'bg-success':(d.status=='error'?'bg-danger':'bg-warning')}">${d.status}</span></div>
+    <div>Прогресс: ${(d.progress*100).toFixed(0)}% · свечей: ${d.candles} · ${Number(d.candles_per_sec).toFixed(0)} свечей/с</div>
+    <div class="text-muted">${d.message||''}</div>
+  `;
+  if (d.status=='finished' || d.status=='error') return;
+  setTimeout(pollSync, 1500);
 }
 
 let _jobId = null;
-async function startTraining() {
-  const symbol = document.getElementById("train_symbol").value.trim();
+async function startTraining(universe) {
+  const symbol = universe ? "*" : document.getElementById("train_symbol").value.trim();
   const years = Number(document.getElementById("train_years").value);
   const timeframes = Array.from(document.getElementById("train_tfs").selectedOptions).map(o=>o.value);
   const js = await fetchJson("/api/train", {method:"POST", headers:{"Content-Type":"application/json"}, body: JSON.stringify({symbol,years,timeframes})});
@@ -24,6 +41,10 @@ async function startTraining() {
   document.getElementById("train_job_box").innerHTML = `job ${_jobId}: <span class="badge bg-info">queued</span>`;
   pollJob();
 }
+async function cancelJob() {
+  if (!_jobId) return;
+  await fetchJson(`/api/training/${_jobId}/cancel`, {method:"POST"});
+}
 async function pollJob() {
   if (!_jobId) return;
   const js = await fetchJson(`/api/training/${_jobId}`);
@@ -32,7 +53,9 @@ async function pollJob() {
     <div>Статус: <span class="badge ${d.status=='finished'?'bg-success':(d.status=='error'?'bg-danger':'bg-warning')}">${d.status}</span></div>
     <div>Прогресс: ${(d.progress*100).toFixed(0)}%</div>
     <div class="text-muted">${d.message||''}</div>
+    ${d.wait_sec!=null?`<div class="text-muted small">В очереди: ${d.wait_sec.toFixed(1)} с (глубина при постановке: ${d.queue_depth})</div>`:''}
+    ${(d.status=='queued'||d.status=='running')?`<button class="btn btn-sm btn-outline-danger mt-2" onclick="cancelJob()">Отменить</button>`:''}
   `;
-  if (d.status=='finished' || d.status=='error') return;
+  if (d.status=='finished' || d.status=='error' || d.status=='cancelled') return;
   setTimeout(pollJob, 1500);
 }
\ No newline at end of file
@@ -0,0 +1,156 @@
+import threading
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor, wait
+from config import Config
+
+logger = logging.getLogger("sync_jobs")
+
+class SyncJobManager:
+    # Синхронизация истории как фоновая задача (аналог training_jobs): запрос сразу получает id,
+    # работа идёт в ограниченном пуле, прогресс и скорость пишутся в sync_jobs.
+    # Пары (symbol, timeframe), которые уже синхронизируются, повторно не запускаются.
+    def __init__(self, db, data, workers=None):
+        self.db = db
+        self.data = data
+        self.executor = ThreadPoolExecutor(max_workers=workers or Config.SYNC_WORKERS, thread_name_prefix="sync")
+        self._lock = threading.Lock()
+        self._active = {}  # (symbol, timeframe) -> job_id
+        self._futures = {}  # job_id -> Future
+        self._maintenance = {}  # (kind, symbol, timeframe) -> job_id: идущие repair/scan
+        stale = self.db.fail_unfinished_sync_jobs()
+        if stale:
+            logger.info("marked %s unfinished sync jobs from previous run as error", stale)
+
+    def submit(self, symbols, timeframes, years):
+        # -> (job_id, job_ids): id новой задачи (или уже идущей, если всё занято) и все задачи, покрывающие запрос
+        pairs = [(s, tf) for s in symbols for tf in timeframes]
+        with self._lock:
+            busy = {p: self._active[p] for p in pairs if p in self._active}
+            todo = [p for p in pairs if p not in busy]
+            related = set(busy.values())
+            if not todo:
+                job_id = busy[pairs[0]]
+                logger.info("sync %s already running as job %s", pairs, sorted(related))
+                return job_id, sorted(related)
+            # старшие TF строятся из базового: если базовый TF пары уже качает другая задача,
+            # дожидаемся её, а не качаем ту же историю второй раз
+            fetch_pairs = []
+            for s in dict.fromkeys(s for s, _ in todo):
+                fetch, _ = self.data.plan_timeframes([tf for ps, tf in todo if ps == s])
+                fetch_pairs += [(s, tf) for tf in fetch]
+            deps = [self._futures[j] for j in {self._active[p] for p in fetch_pairs if p in self._active} if j in self._futures]
+            job_symbols = list(dict.fromkeys(s for s, _ in todo))
+            job_tfs = list(dict.fromkeys(tf for _, tf in todo))
+            job_id = self.db.create_sync_job(job_symbols, job_tfs, years)
+            owned = todo + [p for p in fetch_pairs if p not in self._active and p not in todo]
+            for p in owned:
+                self._active[p] = job_id
+            self._futures[job_id] = self.executor.submit(self._run, job_id, todo, owned, years, deps)
+            related.add(job_id)
+        return job_id, sorted(related)
+
+    def submit_maintenance(self, kind, symbol=None, timeframe=None, max_gaps=200):
+        # kind: "repair" — догрузка дыр из candle_gaps (repair_gaps), "scan" — пересканирование дыр.
+        # -> job_id; та же задача, если она уже идёт — id уже идущей
+        if kind not in ("repair", "scan"):
+            raise ValueError("kind must be repair|scan")
+        key = (kind, symbol, timeframe)
+        with self._lock:
+            if key in self._maintenance:
+                return self._maintenance[key]
+            job_id = self.db.create_sync_job([symbol or "*"], [timeframe or "*"], 0, kind=kind)
+            self._maintenance[key] = job_id
+            self._futures[job_id] = self.executor.submit(self._run_maintenance, job_id, key, max_gaps)
+        return job_id
+
+    def _run_maintenance(self, job_id, key, max_gaps):
+        kind, symbol, timeframe = key
+        try:
+            self.db.update_sync_job(job_id, status="running", progress=0.0, message="started")
+            t0 = time.time()
+            if kind == "repair":
+                res = self.data.repair_gaps(symbol, timeframe, max_gaps)
+                message = (f"{res['gaps']} gaps: repaired {res['repaired']}, partial {res['partial']}, "
+                           f"unfillable {res['unfillable']}, failed {res['failed']}, {res['candles']} candles")
+            else:
+                res = self.db.scan_candle_gaps(symbol, timeframe)
+                message = f"{res.get('pairs', 0)} pairs: {res.get('gaps', 0)} gaps, {res.get('missing', 0)} missing candles"
+            elapsed = time.time() - t0
+            candles = res.get("candles", 0)
+            self.db.update_sync_job(job_id, status="finished", progress=1.0, candles=candles,
+                                    candles_per_sec=round(candles / max(elapsed, 1e-6), 1),
+                                    message=f"{message} in {elapsed:.1f}s", result=res)
+            logger.info("%s job %s: %s", kind, job_id, message)
+        except Exception as e:
+            logger.exception("%s job %s failed", kind, job_id)
+            self.db.update_sync_job(job_id, status="error", message=str(e))
+        finally:
+            with self._lock:
+                self._maintenance.pop(key, None)
+                self._futures.pop(job_id, None)
+
+    def wait(self, job_ids, timeout=None):
+        with self._lock:
+            futures = [self._futures[j] for j in job_ids if j in self._futures]
+        if futures:
+            wait(futures, timeout)
+
+    def active(self):
+        with self._lock:
+            return {f"{s}|{tf}": j for (s, tf), j in self._active.items()}
+
+    def _run(self, job_id, pairs, owned, years, deps):
+        # пары без общего набора TF синхронизируются группами: sync_history работает с symbols x timeframes
+        groups = {}
+        for s, tf in pairs:
+            groups.setdefault(s, []).append(tf)
+        by_tfs = {}
+        for s, tfs in groups.items():
+            by_tfs.setdefault(tuple(tfs), []).append(s)
+        state = {"done_groups": 0, "done_candles": 0, "last_write": 0.0}
+        progress_lock = threading.Lock()
+
+        def on_progress(jobs):
+            with progress_lock:
+                now = time.time()
+                if now - state["last_write"] < Config.SYNC_PROGRESS_SEC:
+                    return
+                state["last_write"] = now
+                frac = sum(j.progress() for j in jobs) / len(jobs)
+                candles = state["done_candles"] + sum(j.candles for j in jobs)
+                # 90% — загрузка, остаток — построение старших TF и скан дыр
+                progress = 0.9 * (state["done_groups"] + frac) / len(by_tfs)
+                self.db.update_sync_job(job_id, progress=round(progress, 4), candles=candles,
+                                        candles_per_sec=round(candles / max(now - t0, 1e-6), 1))
+
+        failed = []
+        try:
+            if deps:
+                self.db.update_sync_job(job_id, message="waiting for base timeframe sync")
+                wait(deps)
+            t0 = time.time()
+            self.db.update_sync_job(job_id, status="running", progress=0.0, message="started")
+            for tfs, symbols in by_tfs.items():
+                jobs = self.data.sync_history(symbols, list(tfs), years, on_progress=on_progress)
+                with progress_lock:
+                    state["done_groups"] += 1
+                    state["done_candles"] += sum(j["candles"] for j in jobs)
+                failed += [f"{j['symbol']} {j['timeframe']}: {j['error']}" for j in jobs if j["status"] == "error"]
+            elapsed = time.time() - t0
+            candles = state["done_candles"]
+            message = f"{candles} candles in {elapsed:.1f}s"
+            if failed:
+                message += "; failed: " + "; ".join(failed)
+            self.db.update_sync_job(job_id, status="error" if failed else "finished", progress=1.0, candles=candles,
+                                    candles_per_sec=round(candles / max(elapsed, 1e-6), 1), message=message)
+            logger.info("sync job %s: %s", job_id, message)
+        except Exception as e:
+            logger.exception("sync job %s failed", job_id)
+            self.db.update_sync_job(job_id, status="error", message=str(e))
+        finally:
+            with self._lock:
+                for p in owned:
+                    if self._active.get(p) == job_id:
+                        del self._active[p]
+                self._futures.pop(job_id, None)
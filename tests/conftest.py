@@ -0,0 +1,51 @@
+import os
+import sys
+import numpy as np
+import pandas as pd
+import pytest
+
+# модули проекта лежат в корне репозитория
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks import synthetic_ohlcv
+from config import Config
+from database import DatabaseManager
+
+FREQ = {"1w": "7D", "1d": "1D", "4h": "4h", "1h": "1h", "15m": "15min"}
+
+class FixedModel:
+    # модель без обучения: одни и те же вероятности классов (-1, 0, 1) на любой строке; не линейная —
+    # batch_inference её не берёт, предикт идёт через predict_proba
+    def __init__(self, sell, hold, buy):
+        self.probs = np.array([sell, hold, buy])
+
+    def predict_proba(self, X):
+        return np.tile(self.probs, (len(X), 1))
+
+def windows_until(end, timeframes, rows=300, seed=0):
+    # окна свечей, последняя открыта в end (1w — с понедельника, как у биржи)
+    out = {}
+    for tf in timeframes:
+        df = synthetic_ohlcv(rows, freq=FREQ[tf], seed=seed)
+        last = pd.Timestamp(end)
+        if tf == "1w":
+            last -= pd.Timedelta(days=last.dayofweek)
+        df.index = df.index - df.index[-1] + last
+        out[tf] = df
+    return out
+
+@pytest.fixture
+def ohlcv():
+    return synthetic_ohlcv(3000)
+
+@pytest.fixture
+def manager(tmp_path, monkeypatch):
+    from model_manager import ModelManager
+    monkeypatch.setattr(Config, "FEATURE_STORE_DIR", str(tmp_path / "features"))
+    monkeypatch.setattr(Config, "TRAIN_MODE", "thread")
+    monkeypatch.setattr(Config, "PREDICT_CACHE", True)
+    db = DatabaseManager(str(tmp_path / "models.db"))
+    mm = ModelManager(db)
+    yield mm
+    mm.train_pool.shutdown()
+    db.close()
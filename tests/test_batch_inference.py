@@ -0,0 +1,102 @@
+import numpy as np
+import pandas as pd
+import pytest
+from numpy.testing import assert_allclose
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.linear_model import SGDClassifier
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import StandardScaler
+from benchmarks import synthetic_ohlcv
+from conftest import FixedModel, windows_until
+from config import Config
+from features import build_features, make_labels
+from features_stream import FEATURE_COLUMNS
+from training_pool import CLASSES, fit_model, make_pipeline, partial_fit
+from batch_inference import LinearParamsCache, linear_params, predict_proba_batch
+
+def _models(n):
+    # модели, обученные на разных рядах, как у разных (symbol, timeframe)
+    out = []
+    for i in range(n):
+        df = synthetic_ohlcv(1500, seed=i)
+        X = build_features(df).to_numpy()
+        y = make_labels(df).to_numpy()
+        out.append((fit_model(X[:-1], y[:-1])[0], X[-1]))
+    return out
+
+def test_batch_matches_per_model_predict_proba():
+    models = _models(6)
+    X = np.stack([x for _, x in models])
+    got = predict_proba_batch(X, [linear_params(m) for m, _ in models])
+    ref = np.vstack([m.predict_proba(x[None, :]) for m, x in models])
+    assert got.shape == (6, 3)
+    assert_allclose(got, ref, rtol=1e-9, atol=1e-12)
+    assert_allclose(got.sum(axis=1), 1.0)
+
+def test_binary_model_matches_predict_proba():
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(400, 5))
+    y = (X[:, 0] + 0.3 * X[:, 1] > 0).astype(int)
+    model = make_pipeline()
+    partial_fit(model, X, y, classes=np.array([0, 1]))
+    params = linear_params(model)
+    assert params.coef.shape == (1, 5)
+    assert_allclose(predict_proba_batch(X[:20], [params] * 20), model.predict_proba(X[:20]), rtol=1e-9, atol=1e-12)
+
+def test_unsupported_models_are_skipped():
+    X = np.random.default_rng(1).normal(size=(50, 3))
+    y = np.arange(50) % 2
+    forest = RandomForestClassifier(n_estimators=2).fit(X, y)
+    hinge = Pipeline([("scaler", StandardScaler()), ("clf", SGDClassifier(loss="hinge"))]).fit(X, y)
+    assert linear_params(forest) is None
+    assert linear_params(hinge) is None
+
+def test_cache_rereads_params_on_new_version():
+    (m1, _), (m2, _) = _models(2)
+    cache = LinearParamsCache()
+    p1 = cache.get("X", "15m", {"version": 1, "model": m1})
+    assert cache.get("X", "15m", {"version": 1, "model": m2}) is p1
+    p2 = cache.get("X", "15m", {"version": 2, "model": m2})
+    assert_allclose(p2.coef, m2.named_steps["clf"].coef_)
+
+def _linear(db, symbol, tf, window):
+    X = build_features(window).to_numpy()
+    y = make_labels(window).to_numpy()
+    db.save_model(symbol, tf, "SGDClassifier", fit_model(X[:-1], y[:-1])[0], CLASSES, FEATURE_COLUMNS)
+
+@pytest.mark.parametrize("cache", [False, True])
+def test_predict_universe_matches_predict_hierarchical(manager, monkeypatch, cache):
+    monkeypatch.setattr(Config, "PREDICT_CACHE", cache)
+    db = manager.db
+    tfs = ["4h", "1h", "15m"]
+    end = pd.Timestamp("2024-06-03")
+    windows = {}
+    for i, symbol in enumerate(["A/USDT", "B/USDT", "C/USDT", "BREAK/USDT", "FALLBACK/USDT"]):
+        windows[symbol] = windows_until(end, tfs, rows=600, seed=i)
+        for tf in tfs:
+            _linear(db, symbol, tf, windows[symbol][tf])
+    # цепочка обрывается на 1h: 4h и 1h расходятся
+    db.save_model("BREAK/USDT", "4h", "Fixed", FixedModel(0.1, 0.2, 0.7), CLASSES, FEATURE_COLUMNS)
+    db.save_model("BREAK/USDT", "1h", "Fixed", FixedModel(0.7, 0.2, 0.1), CLASSES, FEATURE_COLUMNS)
+    # нелинейная модель посреди иерархии — считается через predict_proba, остальные ТФ символа — пачкой
+    db.save_model("FALLBACK/USDT", "1h", "Fixed", FixedModel(0.3, 0.3, 0.4), CLASSES, FEATURE_COLUMNS)
+    now = int((end + pd.Timedelta(hours=2)).value // 10**6)
+
+    ref = {s: manager.predict_hierarchical(s, tfs, windows[s], now_ms=now) for s in windows}
+    manager._pred_cache.clear()
+    manager.features.reset()
+    got = manager.predict_universe(tfs, windows, now_ms=now)
+    assert set(got) == set(ref)
+    for s in windows:
+        assert got[s]["preds"] == ref[s]["preds"]
+        assert got[s]["consensus"] == ref[s]["consensus"]
+        assert got[s]["confidence"] == pytest.approx(ref[s]["confidence"], abs=1e-12)
+        for tf in tfs:
+            if ref[s]["probs"][tf] is None:
+                assert got[s]["probs"][tf] is None
+            else:
+                assert got[s]["probs"][tf] == pytest.approx(ref[s]["probs"][tf], abs=1e-12)
+    assert ref["BREAK/USDT"]["consensus"] == 0
+    if cache:
+        assert ref["BREAK/USDT"]["preds"]["15m"] is None
+    assert ref["FALLBACK/USDT"]["preds"]["1h"] == 1
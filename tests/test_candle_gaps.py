@@ -0,0 +1,26 @@
+from benchmarks import synthetic_ohlcv
+from database import DatabaseManager
+
+def test_scan_finds_gaps_per_pair_and_keeps_status(tmp_path):
+    db = DatabaseManager(str(tmp_path / "gaps.db"))
+    a = synthetic_ohlcv(200, seed=1)
+    b = synthetic_ohlcv(100, freq="1h", seed=2)
+    db.upsert_ohlcv_bulk("A/USDT", "15m", a.drop(a.index[50:53]).drop(a.index[120:121]))
+    db.upsert_ohlcv_bulk("B/USDT", "1h", b.drop(b.index[10:20]))
+    res = db.scan_candle_gaps()
+    assert res == {"pairs": 2, "gaps": 3, "missing": 14}
+    gaps = db.list_candle_gaps()
+    assert [(g["symbol"], g["timeframe"], g["missing"]) for g in gaps] == [
+        ("A/USDT", "15m", 3), ("A/USDT", "15m", 1), ("B/USDT", "1h", 10)]
+
+    db.mark_candle_gap("B/USDT", "1h", gaps[2]["start_ms"], status="unfillable")
+    # дыра закрыта — пропадает; статус оставшейся сохраняется
+    db.upsert_ohlcv_bulk("A/USDT", "15m", a.iloc[50:53])
+    res = db.scan_candle_gaps()
+    assert res == {"pairs": 2, "gaps": 2, "missing": 11}
+    assert [(g["symbol"], g["missing"], g["status"]) for g in db.list_candle_gaps(status=None)] == [
+        ("A/USDT", 1, "open"), ("B/USDT", 10, "unfillable")]
+    assert db.scan_candle_gaps("A/USDT", "15m") == {"pairs": 1, "gaps": 1, "missing": 1}
+    done = {(r["symbol"], r["timeframe"]): r for r in db.candle_completeness()}
+    assert done[("A/USDT", "15m")]["candles"] == 199 and done[("A/USDT", "15m")]["expected"] == 200
+    db.close()
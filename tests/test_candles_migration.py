@@ -0,0 +1,88 @@
+import sqlite3
+import pandas as pd
+from benchmarks import synthetic_ohlcv, LEGACY_SCHEMA
+from config import Config
+from database import DatabaseManager, CANDLES_SCHEMA_VERSION
+
+def _legacy_db(path, frames):
+    conn = sqlite3.connect(path)
+    conn.executescript(LEGACY_SCHEMA)
+    for (symbol, tf), df in frames.items():
+        times = df.index.strftime("%Y-%m-%d %H:%M:%S").tolist()
+        conn.executemany(
+            "INSERT INTO historical_data(symbol,timeframe,open_time,open,high,low,close,volume) VALUES(?,?,?,?,?,?,?,?)",
+            [(symbol, tf, t, *v) for t, v in zip(times, df.to_numpy().tolist())])
+    conn.commit()
+    conn.close()
+
+def _same(a, b):
+    pd.testing.assert_frame_equal(a.reset_index(drop=True), b[a.columns].reset_index(drop=True), check_dtype=False)
+    assert list(pd.DatetimeIndex(a.index)) == list(pd.DatetimeIndex(b.index))
+
+def test_online_migration_keeps_rows_and_dual_writes(tmp_path, monkeypatch):
+    monkeypatch.setattr(Config, "OHLCV_BACKEND", "sqlite", raising=False)
+    path = str(tmp_path / "legacy.db")
+    frames = {("BTC/USDT", "15m"): synthetic_ohlcv(1500, seed=1), ("ETH/USDT", "1h"): synthetic_ohlcv(700, freq="1h", seed=2)}
+    _legacy_db(path, frames)
+
+    db = DatabaseManager(path)
+    assert db.candles_migration_pending()
+    # до миграции чтение идёт из historical_data
+    _same(db.load_ohlcv_sqlite("BTC/USDT", "15m"), frames[("BTC/USDT", "15m")])
+
+    # часть строк скопирована, затем запись во время миграции — попадает в обе таблицы
+    assert db.migrate_candles_step(chunk_rows=500) == 500
+    status = db.candles_migration_status()
+    assert status["pending"] and status["copied_until_id"] == 500
+    extra = synthetic_ohlcv(1510, seed=1).iloc[1500:]
+    db.upsert_ohlcv_bulk("BTC/USDT", "15m", extra)
+    db.flush_writes()
+
+    db.run_candles_migration(chunk_rows=400, pause_sec=0)
+    assert not db.candles_migration_pending()
+    assert db.candles_migration_status() == {"schema_version": CANDLES_SCHEMA_VERSION, "pending": False}
+    _same(db.load_ohlcv_sqlite("BTC/USDT", "15m"), pd.concat([frames[("BTC/USDT", "15m")], extra]))
+    _same(db.load_ohlcv_sqlite("ETH/USDT", "1h"), frames[("ETH/USDT", "1h")])
+    db.close()
+
+    conn = sqlite3.connect(path)
+    assert conn.execute("SELECT name FROM sqlite_master WHERE name='historical_data'").fetchone() is None
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == CANDLES_SCHEMA_VERSION
+    conn.close()
+
+    # повторное открытие: миграция не нужна
+    db = DatabaseManager(path)
+    assert not db.candles_migration_pending()
+    db.close()
+
+def test_new_database_starts_on_candles_schema(tmp_path):
+    db = DatabaseManager(str(tmp_path / "new.db"))
+    assert not db.candles_migration_pending()
+    df = synthetic_ohlcv(100)
+    db.upsert_ohlcv_bulk("BTC/USDT", "15m", df)
+    db.flush_writes()
+    _same(db.load_ohlcv_sqlite("BTC/USDT", "15m"), df)
+    db.close()
+
+def test_reads_routed_to_legacy_table_survive_the_final_drop(tmp_path, monkeypatch):
+    monkeypatch.setattr(Config, "OHLCV_BACKEND", "sqlite", raising=False)
+    monkeypatch.setattr(Config, "OHLCV_CACHE_MAX_ROWS", 0)
+    path = str(tmp_path / "legacy.db")
+    df = synthetic_ohlcv(300, seed=3)
+    _legacy_db(path, {("BTC/USDT", "15m"): df})
+    reader = DatabaseManager(path)
+    assert reader.candles_migration_pending()
+    # миграцию завершает другой процесс: reader ещё считает, что чтение идёт из historical_data
+    DatabaseManager(path).run_candles_migration(pause_sec=0)
+    assert reader.candles_migration_pending()
+
+    _same(reader.load_ohlcv_sqlite("BTC/USDT", "15m"), df)
+    assert reader.get_last_ohlcv_time("BTC/USDT", "15m") == df.index[-1].to_pydatetime()
+    assert reader.ohlcv_pairs() == [("BTC/USDT", "15m")]
+    assert reader.candles_migration_status() == {"schema_version": CANDLES_SCHEMA_VERSION, "pending": False}
+    # исчезновение historical_data переключает и запись на candles
+    assert not reader.candles_migration_pending()
+    extra = synthetic_ohlcv(310, seed=3).iloc[300:]
+    assert reader.upsert_ohlcv_bulk("BTC/USDT", "15m", extra)["inserted"] == 10
+    _same(reader.load_ohlcv_sqlite("BTC/USDT", "15m"), pd.concat([df, extra]))
+    reader.close()
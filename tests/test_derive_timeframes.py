@@ -0,0 +1,45 @@
+import pandas as pd
+import pytest
+from benchmarks import synthetic_ohlcv
+from config import Config
+from database import DatabaseManager
+from data_manager import CCXTDataManager
+from ohlcv_resample import resample_ohlcv
+from ohlcv_store import index_to_ms
+
+@pytest.fixture
+def data(tmp_path, monkeypatch):
+    monkeypatch.setattr(Config, "EXCHANGE_MODE", "fake")
+    monkeypatch.setattr(Config, "OHLCV_BACKEND", "sqlite")
+    db = DatabaseManager(str(tmp_path / "derive.db"))
+    yield CCXTDataManager(db)
+    db.close()
+
+def test_incomplete_closed_buckets_are_not_derived(data):
+    base = synthetic_ohlcv(4 * 24 * 2, seed=7)  # двое суток 15m
+    holed = base.drop(base.index[4 * 5 + 1:4 * 5 + 3])  # в свече 05:00 нет двух 15m
+    data.db.upsert_ohlcv_bulk("X/USDT", "15m", holed)
+    now_ms = int(index_to_ms(base.index)[-1]) + 10 * 86_400_000
+    data.derive_timeframes("X/USDT", ["1h", "4h"], base_tf="15m", now_ms=now_ms)
+
+    full_1h, _ = resample_ohlcv(base, "15m", "1h")
+    got_1h = data.db.load_ohlcv("X/USDT", "1h")
+    assert pd.Timestamp("2021-01-01 05:00") not in got_1h.index
+    expected = full_1h.drop(pd.Timestamp("2021-01-01 05:00"))
+    pd.testing.assert_frame_equal(got_1h, expected, check_freq=False, check_names=False)
+    got_4h = data.db.load_ohlcv("X/USDT", "4h")
+    assert pd.Timestamp("2021-01-01 04:00") not in got_4h.index
+    assert len(got_4h) == 11
+
+def test_forming_bucket_is_kept_and_recomputed(data):
+    base = synthetic_ohlcv(4 * 10 + 2, seed=8)  # последняя 1h-свеча: две 15m из четырёх
+    data.db.upsert_ohlcv_bulk("X/USDT", "15m", base.iloc[:-1])
+    now_ms = int(index_to_ms(base.index)[-1]) + 60_000
+    data.derive_timeframes("X/USDT", ["1h"], base_tf="15m", now_ms=now_ms)
+    got = data.db.load_ohlcv("X/USDT", "1h")
+    assert len(got) == 11 and got["close"].iloc[-1] == base["close"].iloc[-2]
+
+    data.db.upsert_ohlcv_bulk("X/USDT", "15m", base.iloc[-1:])
+    data.derive_timeframes("X/USDT", ["1h"], base_tf="15m", now_ms=now_ms)
+    got = data.db.load_ohlcv("X/USDT", "1h")
+    assert len(got) == 11 and got["close"].iloc[-1] == base["close"].iloc[-1]
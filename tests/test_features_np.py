@@ -0,0 +1,35 @@
+from numpy.testing import assert_allclose
+from benchmarks import synthetic_ohlcv
+from features import build_features
+from features_np import FEATURE_COLUMNS, build_features_np, build_features_panel
+
+# допуск как в benchmarks.py: |a - b| / (|b| + 1)
+RTOL = ATOL = 1e-6
+
+def _check(got, ref):
+    assert list(got.columns) == list(ref.columns) == FEATURE_COLUMNS
+    assert got.index.equals(ref.index)
+    assert_allclose(got.to_numpy(), ref.to_numpy(), rtol=RTOL, atol=ATOL)
+
+def test_kernel_matches_build_features(ohlcv):
+    _check(build_features_np(ohlcv), build_features(ohlcv))
+
+def test_short_series_without_full_window():
+    # меньше 20 свечей: sma/bb не считаются и заполняются нулями, как в build_features
+    df = synthetic_ohlcv(15, seed=3)
+    _check(build_features_np(df), build_features(df))
+
+def test_panel_of_unequal_lengths_matches_per_symbol():
+    frames = {"A/USDT": synthetic_ohlcv(2000, seed=1),
+              "B/USDT": synthetic_ohlcv(700, start="2021-01-10", seed=2),
+              "C/USDT": synthetic_ohlcv(10, seed=3),
+              "D/USDT": synthetic_ohlcv(5, seed=4).iloc[:0]}
+    got = build_features_panel(frames)
+    assert list(got) == list(frames)
+    for sym in ("A/USDT", "B/USDT", "C/USDT"):
+        _check(got[sym], build_features(frames[sym]))
+    # ряд без свечей — пустой фрейм с теми же колонками
+    assert got["D/USDT"].empty and list(got["D/USDT"].columns) == FEATURE_COLUMNS
+
+def test_empty_panel():
+    assert build_features_panel({}) == {}
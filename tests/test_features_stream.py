@@ -0,0 +1,63 @@
+import pandas as pd
+import pytest
+from numpy.testing import assert_allclose
+from features import build_features
+from features_stream import EXACT_BARS, FEATURE_COLUMNS, FeatureStream, stream_features
+
+# допуск как в benchmarks.py: |a - b| / (|b| + 1)
+RTOL = ATOL = 1e-6
+
+def test_stream_features_match_build_features(ohlcv):
+    ref = build_features(ohlcv)
+    got = stream_features(ohlcv)
+    assert list(got.columns) == list(ref.columns) == FEATURE_COLUMNS
+    assert_allclose(got.to_numpy(), ref.to_numpy(), rtol=RTOL, atol=ATOL)
+
+def test_latest_matches_build_features_per_tick(ohlcv):
+    window = EXACT_BARS + 100
+    fs = FeatureStream()
+    for end in range(window, window + 200):
+        w = ohlcv.iloc[end - window:end]
+        assert_allclose(fs.latest("X", "15m", w), build_features(w).values[-1:], rtol=RTOL, atol=ATOL)
+    # длинное окно сдвигалось на одну свечу — состояние строилось один раз
+    assert fs.stats()["rebuilds"] == 1
+
+@pytest.mark.parametrize("window", [26, 60, 200])
+def test_short_sliding_window_matches_build_features(ohlcv, window):
+    # окна старших TF (1w за 180 дней ~ 26 свечей): EMA должны стартовать с первой свечи окна
+    fs = FeatureStream()
+    for end in range(window, window + 100):
+        w = ohlcv.iloc[end - window:end]
+        assert_allclose(fs.latest("X", "1w", w), build_features(w).values[-1:], rtol=RTOL, atol=ATOL)
+
+def test_growing_short_window_is_incremental(ohlcv):
+    # начало окна не двигается — пересборки не нужны
+    fs = FeatureStream()
+    for end in range(30, 130):
+        w = ohlcv.iloc[:end]
+        assert_allclose(fs.latest("X", "1w", w), build_features(w).values[-1:], rtol=RTOL, atol=ATOL)
+    assert fs.stats()["rebuilds"] == 1
+
+def test_unclosed_candle_does_not_change_state(ohlcv):
+    fs = FeatureStream()
+    w = ohlcv.iloc[:500]
+    first = fs.latest("X", "15m", w)
+    # последняя свеча окна обновилась (ещё не закрыта) — состояние не должно было её запомнить
+    changed = w.copy()
+    changed.iloc[-1, changed.columns.get_loc("close")] *= 1.01
+    changed.iloc[-1, changed.columns.get_loc("high")] = max(changed["high"].iloc[-1], changed["close"].iloc[-1])
+    assert_allclose(fs.latest("X", "15m", changed), build_features(changed).values[-1:], rtol=RTOL, atol=ATOL)
+    assert_allclose(fs.latest("X", "15m", w), first, rtol=0, atol=0)
+    assert fs.stats()["rebuilds"] == 1
+
+def test_gap_in_window_rebuilds_state(ohlcv):
+    fs = FeatureStream()
+    fs.latest("X", "15m", ohlcv.iloc[:400])
+    w = ohlcv.iloc[1000:1400]
+    assert_allclose(fs.latest("X", "15m", w), build_features(w).values[-1:], rtol=RTOL, atol=ATOL)
+    assert fs.stats()["rebuilds"] == 2
+    fs.reset("X")
+    assert fs.stats()["states"] == 0
+
+def test_empty_window():
+    assert FeatureStream().latest("X", "15m", pd.DataFrame()).shape == (0, len(FEATURE_COLUMNS))
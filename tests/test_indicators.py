@@ -0,0 +1,41 @@
+import numpy as np
+import pytest
+from numpy.testing import assert_allclose
+from features import build_features
+from indicators import DEFAULT_PLAN, INDICATORS, plan_for, resolve
+
+# допуск как в benchmarks.py: |a - b| / (|b| + 1)
+RTOL = ATOL = 1e-6
+
+def test_default_plan_matches_build_features(ohlcv):
+    ref = build_features(ohlcv)
+    got = DEFAULT_PLAN(ohlcv)
+    assert list(got.columns) == list(ref.columns)
+    assert_allclose(got.to_numpy(), ref.to_numpy(), rtol=RTOL, atol=ATOL)
+
+def test_subset_plan_matches_default_columns(ohlcv):
+    ref = DEFAULT_PLAN(ohlcv)
+    plan = plan_for({n: {"enabled": n in ("rsi", "macd")} for n in INDICATORS})
+    got = plan(ohlcv)
+    assert list(got.columns) == ["rsi_14", "macd", "macd_sig", "macd_hist"]
+    assert_allclose(got.to_numpy(), ref[got.columns].to_numpy(), rtol=0, atol=0)
+
+def test_custom_params_rename_columns(ohlcv):
+    plan = plan_for({"sma": {"params": {"n": 50}}, "bollinger": {"params": {"n": 50}}})
+    got = plan(ohlcv)
+    assert {"sma_50", "bb_50_2_mid"} <= set(got.columns)
+    assert np.isfinite(got.to_numpy()).all()
+    assert_allclose(got["sma_50"].iloc[60:], ohlcv["close"].rolling(50).mean().iloc[60:], rtol=RTOL, atol=ATOL)
+
+@pytest.mark.parametrize("settings, message", [
+    ({"bogus": {}}, "unknown indicators"),
+    ({"sma": {"params": {"x": 1}}}, "unknown parameter"),
+    ({"sma": {"params": {"n": 0}}}, "must be positive"),
+    ({"macd": {"params": {"fast": 26, "slow": 12}}}, "fast must be less than slow"),
+    ({"sma": {"params": {"n": 1}}}, "rolling window must be at least 2"),
+    ({"bollinger": {"params": {"n": 1}}}, "rolling window must be at least 2"),
+    ({n: {"enabled": False} for n in INDICATORS}, "at least one indicator"),
+])
+def test_resolve_rejects_invalid_settings(settings, message):
+    with pytest.raises(ValueError, match=message):
+        resolve(settings)
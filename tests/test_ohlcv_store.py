@@ -0,0 +1,49 @@
+import os
+import numpy as np
+import pandas as pd
+from benchmarks import synthetic_ohlcv
+from config import Config
+from database import DatabaseManager
+from ohlcv_store import ColumnarOHLCVStore
+
+def test_read_frames_survive_updates(tmp_path):
+    store = ColumnarOHLCVStore(str(tmp_path / "col"))
+    df = synthetic_ohlcv(500)
+    store.write("X/USDT", "15m", df)
+    before = store.read("X/USDT", "15m")
+    snapshot = before.copy()
+
+    # обновление последней свечи и середины истории + новые свечи
+    upd = df.iloc[[100, -1]].copy()
+    upd["close"] *= 1.5
+    more = synthetic_ohlcv(510).iloc[500:]
+    store.write("X/USDT", "15m", pd.concat([upd, more]))
+
+    pd.testing.assert_frame_equal(before, snapshot)
+    after = store.read("X/USDT", "15m")
+    assert len(after) == 510
+    assert after["close"].iloc[100] == upd["close"].iloc[0]
+    assert after["close"].iloc[499] == upd["close"].iloc[1]
+    np.testing.assert_array_equal(after["close"].iloc[500:], more["close"])
+
+def test_unchanged_rows_do_not_rewrite_file(tmp_path):
+    store = ColumnarOHLCVStore(str(tmp_path / "col"))
+    df = synthetic_ohlcv(100)
+    store.write("X/USDT", "15m", df)
+    p = store.path("X/USDT", "15m")
+    ino = os.stat(p).st_ino
+    store.write("X/USDT", "15m", df.iloc[-5:])
+    assert os.stat(p).st_ino == ino
+
+def test_each_database_gets_its_own_columnar_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(Config, "OHLCV_BACKEND", "columnar")
+    monkeypatch.setattr(Config, "COLUMNAR_DIR", "")
+    a = DatabaseManager(str(tmp_path / "a.db"))
+    b = DatabaseManager(str(tmp_path / "b.db"))
+    assert a.columnar.base_dir != b.columnar.base_dir
+    a.upsert_ohlcv_bulk("X/USDT", "15m", synthetic_ohlcv(50, seed=1))
+    b.upsert_ohlcv_bulk("X/USDT", "15m", synthetic_ohlcv(30, seed=2))
+    assert len(a.load_ohlcv("X/USDT", "15m")) == 50
+    assert len(b.load_ohlcv("X/USDT", "15m")) == 30
+    a.close()
+    b.close()
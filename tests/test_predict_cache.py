@@ -0,0 +1,71 @@
+import pandas as pd
+from conftest import FixedModel, windows_until
+from config import Config
+from features_stream import FEATURE_COLUMNS
+from training_pool import CLASSES
+
+END = pd.Timestamp("2024-06-03")  # понедельник 00:00 — начало свечи любого ТФ
+MS_H = 3_600_000
+
+def _ms(ts):
+    return int(pd.Timestamp(ts).value // 10**6)
+
+def _save(db, symbol, tf, model):
+    db.save_model(symbol, tf, "Fixed", model, CLASSES, FEATURE_COLUMNS)
+
+def test_closed_candle_key_hits_until_close_or_new_version(manager):
+    db = manager.db
+    _save(db, "X/USDT", "4h", FixedModel(0.1, 0.2, 0.7))
+    w = windows_until(END, ["4h"])
+    forming = {"4h": w["4h"]}
+
+    manager.predict_hierarchical("X/USDT", ["4h"], forming, now_ms=_ms(END) + MS_H)
+    assert manager.prediction_stats()["computed"] == 1
+    # та же незакрытая свеча обновилась — ответ из кэша
+    moved = w["4h"].copy()
+    moved.iloc[-1, moved.columns.get_loc("close")] *= 1.05
+    res = manager.predict_hierarchical("X/USDT", ["4h"], {"4h": moved}, now_ms=_ms(END) + 2 * MS_H)
+    stats = manager.prediction_stats()
+    assert stats["computed"] == 1 and stats["cache_hits"] == 1
+    assert res["consensus"] == 1
+
+    # свеча закрылась — ключ сменился
+    manager.predict_hierarchical("X/USDT", ["4h"], {"4h": moved}, now_ms=_ms(END) + 4 * MS_H)
+    assert manager.prediction_stats()["computed"] == 2
+    # новая версия модели — промах, ответ уже новой модели
+    _save(db, "X/USDT", "4h", FixedModel(0.7, 0.2, 0.1))
+    res = manager.predict_hierarchical("X/USDT", ["4h"], {"4h": moved}, now_ms=_ms(END) + 4 * MS_H)
+    assert manager.prediction_stats()["computed"] == 3
+    assert res["consensus"] == -1
+
+def test_lazy_hierarchy_matches_eager_consensus(manager, monkeypatch):
+    db = manager.db
+    tfs = ["1d", "4h", "1h", "15m"]
+    models = {
+        "AGREE/USDT": {tf: FixedModel(0.1, 0.3, 0.6) for tf in tfs},
+        "BREAK/USDT": {"1d": FixedModel(0.6, 0.3, 0.1), "4h": FixedModel(0.1, 0.3, 0.6),
+                       "1h": FixedModel(0.6, 0.3, 0.1), "15m": FixedModel(0.6, 0.3, 0.1)},
+        "HOLD/USDT": {tf: FixedModel(0.2, 0.6, 0.2) for tf in tfs},
+        "MISSING/USDT": {tf: FixedModel(0.1, 0.3, 0.6) for tf in ("1d", "1h", "15m")},
+    }
+    for symbol, per_tf in models.items():
+        for tf, m in per_tf.items():
+            _save(db, symbol, tf, m)
+    windows = {s: windows_until(END, tfs, seed=i) for i, s in enumerate(models)}
+    # все свечи окна закрыты: кэш не отбрасывает ни одной
+    now = _ms(END) + 24 * MS_H
+
+    monkeypatch.setattr(Config, "PREDICT_CACHE", False)
+    eager = {s: manager.predict_hierarchical(s, tfs, windows[s], now_ms=now) for s in models}
+    assert manager.prediction_stats()["skipped"] == 0
+    monkeypatch.setattr(Config, "PREDICT_CACHE", True)
+    for _ in range(2):  # второй проход — из кэша старших ТФ
+        lazy = {s: manager.predict_hierarchical(s, tfs, windows[s], now_ms=now) for s in models}
+        for s in models:
+            assert lazy[s]["consensus"] == eager[s]["consensus"]
+            assert lazy[s]["confidence"] == eager[s]["confidence"]
+    stats = manager.prediction_stats()
+    assert stats["skipped"] > 0 and stats["cache_hits"] > 0
+    assert eager["AGREE/USDT"]["consensus"] == 1 and eager["BREAK/USDT"]["consensus"] == 0
+    # обрыв цепочки: младшие ТФ не считаются
+    assert lazy["BREAK/USDT"]["preds"]["15m"] is None and eager["BREAK/USDT"]["preds"]["15m"] == -1
@@ -0,0 +1,167 @@
+import threading
+import time
+import pytest
+from config import Config
+from database import DatabaseManager
+from training_pool import TrainingCancelled
+from training_scheduler import TrainingScheduler
+
+class StubModels:
+    # train_pair без данных: пары из gates ждут своего Event, обучение идёт "чанками" с проверкой should_stop
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = []
+        self.gates = {}
+        self.active = {}
+        self.max_active = {}
+        self.started = threading.Condition(self.lock)
+
+    def gate(self, symbol, timeframe="15m"):
+        ev = self.gates[(symbol, timeframe)] = threading.Event()
+        return ev
+
+    def train_pair(self, symbol, timeframe, should_stop=None):
+        key = (symbol, timeframe)
+        with self.lock:
+            self.calls.append(key)
+            self.active[key] = self.active.get(key, 0) + 1
+            self.max_active[key] = max(self.max_active.get(key, 0), self.active[key])
+            self.started.notify_all()
+        try:
+            gate = self.gates.get(key)
+            for _ in range(500):
+                if should_stop is not None and should_stop():
+                    raise TrainingCancelled()
+                if gate is None or gate.is_set():
+                    break
+                time.sleep(0.01)
+            return {"prepare_sec": 0.0, "fit_sec": 0.001, "save_sec": 0.0, "pid": threading.get_ident()}
+        finally:
+            with self.lock:
+                self.active[key] -= 1
+
+    def wait_started(self, key, n=1, timeout=5):
+        with self.lock:
+            assert self.started.wait_for(lambda: self.calls.count(key) >= n, timeout)
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    monkeypatch.setattr(Config, "TRAIN_MODE", "thread")
+    db = DatabaseManager(str(tmp_path / "train.db"))
+    yield db
+    db.close()
+
+def _wait_status(db, job_id, timeout=5):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = db.get_training_job(job_id)
+        if job["status"] in ("finished", "error", "cancelled"):
+            return job
+        time.sleep(0.01)
+    raise AssertionError(f"job {job_id} did not finish: {db.get_training_job(job_id)}")
+
+def test_duplicate_pending_pair_is_trained_once(db):
+    models = StubModels()
+    block = models.gate("BLOCK")
+    sched = TrainingScheduler(db, models, workers=1)
+    try:
+        sched.submit(["BLOCK"], ["15m"], priority="full")
+        models.wait_started(("BLOCK", "15m"))
+        a = sched.submit(["X"], ["15m"], priority="full")
+        b = sched.submit(["X"], ["15m"], priority="full")
+        assert sched.stats()["queue_depth"] == 1
+        block.set()
+        assert _wait_status(db, a)["status"] == "finished"
+        assert _wait_status(db, b)["status"] == "finished"
+        assert models.calls.count(("X", "15m")) == 1
+    finally:
+        sched.stop()
+
+def test_more_urgent_request_bumps_pending_pair(db):
+    models = StubModels()
+    block = models.gate("BLOCK")
+    sched = TrainingScheduler(db, models, workers=1)
+    try:
+        sched.submit(["BLOCK"], ["15m"], priority="full")
+        models.wait_started(("BLOCK", "15m"))
+        first = sched.submit(["A"], ["15m"], priority="full")
+        second = sched.submit(["B"], ["15m"], priority="full")
+        sched.submit(["B"], ["15m"], priority="high")
+        block.set()
+        _wait_status(db, first)
+        _wait_status(db, second)
+        assert models.calls[1:] == [("B", "15m"), ("A", "15m")]
+    finally:
+        sched.stop()
+
+def test_running_pair_is_not_started_twice_in_parallel(db):
+    models = StubModels()
+    gate = models.gate("P")
+    sched = TrainingScheduler(db, models, workers=3)
+    try:
+        first = sched.submit(["P"], ["15m"], priority="full")
+        models.wait_started(("P", "15m"))
+        second = sched.submit(["P"], ["15m"], priority="high")
+        other = sched.submit(["Q"], ["15m"], priority="full")
+        # свободные потоки берут другие пары, но не второй экземпляр P
+        assert _wait_status(db, other)["status"] == "finished"
+        assert models.calls.count(("P", "15m")) == 1
+        gate.set()
+        _wait_status(db, first)
+        _wait_status(db, second)
+        assert models.calls.count(("P", "15m")) == 2
+        assert models.max_active[("P", "15m")] == 1
+    finally:
+        sched.stop()
+
+def test_cancel_stops_running_pair_between_chunks(db):
+    models = StubModels()
+    models.gate("P")  # не отпускаем: задачу остановит только отмена
+    sched = TrainingScheduler(db, models, workers=1)
+    try:
+        job = sched.submit(["P", "Q"], ["15m"], priority="full")
+        models.wait_started(("P", "15m"))
+        assert sched.cancel(job)
+        assert _wait_status(db, job)["status"] == "cancelled"
+        deadline = time.time() + 5
+        while sched.stats()["running"] and time.time() < deadline:
+            time.sleep(0.01)
+        assert sched.stats()["running"] == [] and sched.stats()["queue_depth"] == 0
+        assert ("Q", "15m") not in models.calls
+        assert not sched.cancel(job)
+    finally:
+        sched.stop()
+
+class _PausingDB:
+    # прокси БД: останавливает _task_done между проверкой cancelled и записью итога
+    def __init__(self, db):
+        self._db = db
+        self.paused = threading.Event()
+        self.resume = threading.Event()
+
+    def __getattr__(self, name):
+        return getattr(self._db, name)
+
+    def update_training_job(self, job_id, **kw):
+        if kw == {"tasks_done": 1}:
+            self.paused.set()
+            self.resume.wait(5)
+        return self._db.update_training_job(job_id, **kw)
+
+def test_cancel_racing_with_completion_keeps_finished_status(db):
+    proxy = _PausingDB(db)
+    models = StubModels()
+    sched = TrainingScheduler(proxy, models, workers=1)
+    try:
+        job = sched.submit(["P"], ["15m"], priority="full")
+        assert proxy.paused.wait(5)
+        result = {}
+        t = threading.Thread(target=lambda: result.update(cancelled=sched.cancel(job)))
+        t.start()
+        time.sleep(0.05)
+        proxy.resume.set()
+        t.join(5)
+        assert result == {"cancelled": False}
+        assert _wait_status(db, job)["status"] == "finished"
+    finally:
+        sched.stop()
@@ -0,0 +1,35 @@
+import threading
+import pytest
+from config import Config
+from database import DatabaseManager
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    monkeypatch.setattr(Config, "DB_WRITE_BEHIND", True)
+    db = DatabaseManager(str(tmp_path / "wb.db"))
+    yield db
+    db.close()
+
+def _flush_in_thread(db):
+    t = threading.Thread(target=db.flush_writes, daemon=True)
+    t.start()
+    t.join(5)
+    return not t.is_alive()
+
+def test_flush_commits_pending_writes(db):
+    fut = db.add_bot("X/USDT", "running")
+    db.flush_writes(timeout=5)
+    assert fut.done()
+    assert any(b["symbol"] == "X/USDT" for b in db.bots_summary())
+
+def test_flush_after_close_returns(db):
+    db.add_bot("X/USDT", "running")
+    db.writer.close()
+    assert _flush_in_thread(db)
+    with pytest.raises(RuntimeError):
+        db.writer.submit(lambda c: None)
+
+def test_close_is_idempotent(db):
+    db.close()
+    db.close()
+    assert _flush_in_thread(db)
@@ -0,0 +1,125 @@
+import os
+import time
+import logging
+import threading
+import multiprocessing as mp
+from multiprocessing import shared_memory
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from sklearn.linear_model import SGDClassifier
+from sklearn.preprocessing import StandardScaler
+from sklearn.pipeline import Pipeline
+from sklearn.metrics import accuracy_score
+from config import Config
+
+logger = logging.getLogger("training_pool")
+
+CLASSES = np.array([-1, 0, 1], dtype=int)
+
+# Обучение без обращения к БД и признакам: эти функции выполняются и в потоках ModelManager,
+# и в процессах пула. Матрицы признаков передаются процессам через shared memory — в задаче
+# только имя сегмента и раскладка массивов, модель (несколько КБ) идёт обычным pickle.
+
+class TrainingCancelled(Exception):
+    pass
+
+def make_pipeline():
+    # Инкрементально обучаемый пайплайн: scaler + SGDClassifier (log loss, probas)
+    # with_mean=True для плотных данных
+    return Pipeline([
+        ("scaler", StandardScaler(with_mean=True)),
+        ("clf", SGDClassifier(loss="log_loss", max_iter=1, tol=None, random_state=42))
+    ])
+
+def partial_fit(model, X, y, classes=None):
+    # У Pipeline нет partial_fit: обновляем статистики scaler'а и дообучаем классификатор на масштабированных данных
+    scaler = model.named_steps["scaler"]
+    scaler.partial_fit(X)
+    model.named_steps["clf"].partial_fit(scaler.transform(X), y, classes=classes)
+
+def fit_model(X, y, model=None, should_stop=None):
+    # model=None — полное обучение, иначе дообучение на новых строках; -> (model, accuracy).
+    # should_stop() проверяется между чанками partial_fit — отмена без порчи сохранённой модели
+    def check():
+        if should_stop is not None and should_stop():
+            raise TrainingCancelled()
+
+    check()
+    if model is not None:
+        partial_fit(model, X, y, classes=CLASSES)
+        # оценка на последних N новых выборок
+        N = min(500, len(X))
+    else:
+        model = make_pipeline()
+        # Если мало данных, обучаем целиком за один проход
+        if len(X) <= 1024:
+            partial_fit(model, X, y, classes=CLASSES)
+        else:
+            # Warm start на первом чанке
+            first_chunk = min(256, len(X))
+            partial_fit(model, X[:first_chunk], y[:first_chunk], classes=CLASSES)
+            # Остальные чанки
+            for start in range(first_chunk, len(X), 1024):
+                check()
+                end = min(len(X), start + 1024)
+                partial_fit(model, X[start:end], y[start:end])
+        N = min(1000, len(X))
+    yhat = model.predict(X[-N:])
+    return model, float(accuracy_score(y[-N:], yhat))
+
+def share_arrays(**arrays):
+    # массивы -> один сегмент shared memory; -> (shm, desc). Сегмент освобождает создатель (close + unlink)
+    layout, offset = [], 0
+    for key, a in arrays.items():
+        a = np.ascontiguousarray(a)
+        layout.append((key, offset, a.shape, a.dtype.str))
+        offset += -(-a.nbytes // 64) * 64
+    shm = shared_memory.SharedMemory(create=True, size=max(offset, 1))
+    for (key, off, shape, dtype), a in zip(layout, arrays.values()):
+        np.ndarray(shape, dtype=dtype, buffer=shm.buf, offset=off)[...] = a
+    return shm, (shm.name, layout)
+
+def _attach(desc):
+    name, layout = desc
+    shm = shared_memory.SharedMemory(name=name)
+    return shm, {key: np.ndarray(shape, dtype=dtype, buffer=shm.buf, offset=off) for key, off, shape, dtype in layout}
+
+def fit_shared(desc, model=None):
+    # точка входа процесса пула: X/y читаются прямо из сегмента родителя, без копии через pipe;
+    # время — CPU процесса: при конкуренции за ядра wall завысил бы работу
+    t0 = time.process_time()
+    shm, arrs = _attach(desc)
+    try:
+        model, acc = fit_model(arrs["X"], arrs["y"], model)
+    finally:
+        # ссылки на буфер должны исчезнуть до close
+        arrs = None
+        shm.close()
+    return model, acc, time.process_time() - t0, os.getpid()
+
+class TrainingPool:
+    # Пул процессов для обучения. Родитель держит потоки (write-behind, WS, asyncio) и пул соединений
+    # SQLite — fork такого процесса может унести захваченные блокировки, поэтому по умолчанию forkserver
+    # (чистый процесс-сервер с заранее импортированным sklearn; воркеры — его fork) или spawn.
+    def __init__(self, processes=None, start_method=None):
+        self.processes = processes or Config.TRAIN_PROCESSES or os.cpu_count() or 1
+        self.start_method = start_method or Config.TRAIN_START_METHOD
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def executor(self):
+        with self._lock:
+            if self._executor is None:
+                method = self.start_method if self.start_method in mp.get_all_start_methods() else "spawn"
+                ctx = mp.get_context(method)
+                if method == "forkserver":
+                    ctx.set_forkserver_preload(["training_pool"])
+                self._executor = ProcessPoolExecutor(max_workers=self.processes, mp_context=ctx)
+                logger.info("training pool: %d processes (%s)", self.processes, method)
+            return self._executor
+
+    def shutdown(self):
+        with self._lock:
+            ex, self._executor = self._executor, None
+        if ex is not None:
+            ex.shutdown(wait=True, cancel_futures=True)
@@ -0,0 +1,279 @@
+import heapq
+import itertools
+import threading
+import time
+import logging
+from config import Config
+from training_pool import TrainingCancelled
+
+logger = logging.getLogger("training_scheduler")
+
+# Классы приоритета: меньше — раньше. Дообучение (модель пары уже есть) — секунды, полное — минуты
+PRIORITIES = {"high": 0, "incremental": 1, "full": 2}
+
+class _Task:
+    # обучение одной пары (symbol, timeframe); одна задача может обслуживать несколько training_jobs
+    def __init__(self, symbol, timeframe, priority, seq):
+        self.symbol = symbol
+        self.timeframe = timeframe
+        self.priority = priority
+        self.seq = seq
+        self.jobs = set()
+        self.cancel = threading.Event()
+        self.running = False
+
+    @property
+    def key(self):
+        return (self.symbol, self.timeframe)
+
+class _Job:
+    def __init__(self, job_id, total):
+        self.id = job_id
+        self.total = total
+        self.done = 0
+        self.trained = 0
+        self.failed = []
+        self.cancelled = False
+        # итоговый статус записан (_finish): поздняя отмена его не перезаписывает
+        self.finished = False
+        self.enqueued_at = None
+        self.started = False
+        self.started_at = None
+        # суммарное время пар (последовательная работа) и процессы/потоки, где шло обучение
+        self.prepare_sec = 0.0
+        self.fit_sec = 0.0
+        self.save_sec = 0.0
+        self.pids = set()
+        # порядок записей прогресса в БД: поздний "11/12" не должен перезаписать итог
+        self.lock = threading.Lock()
+
+class TrainingScheduler:
+    # Очередь обучения перед ModelManager: приоритеты (дообучение раньше полного), ограниченное число
+    # одновременных пар, не больше одной задачи на пару в очереди — повторный запрос присоединяется к уже
+    # ждущей задаче. Пара, которая сейчас обучается, не запускается второй раз параллельно (save_model не
+    # гоняется): новая задача ждёт её окончания. Отмена — кооперативная, между чанками partial_fit.
+    def __init__(self, db, models, workers=None):
+        self.db = db
+        self.models = models
+        # Ёмкость обучения: в режиме process одновременно обучается не больше пар, чем процессов пула;
+        # потоков очереди вдвое больше — пока процессы обучают, потоки готовят признаки следующих пар
+        process = Config.TRAIN_MODE == "process"
+        self.capacity = models.train_pool.processes if process else None
+        self.workers = workers or Config.TRAIN_CONCURRENCY or (2 * self.capacity if process else Config.MAX_WORKERS)
+        self.capacity = self.capacity or self.workers
+        self._cv = threading.Condition()
+        self._heap = []
+        self._seq = itertools.count()
+        self._pending = {}   # (symbol, timeframe) -> _Task в очереди
+        self._running = {}   # (symbol, timeframe) -> _Task в работе
+        self._jobs = {}      # job_id -> _Job (незавершённые)
+        self._stop = False
+        stale = self.db.fail_unfinished_training_jobs()
+        if stale:
+            logger.info("marked %s unfinished training jobs from previous run as error", stale)
+        self._threads = [threading.Thread(target=self._worker, name=f"train-{i}", daemon=True) for i in range(self.workers)]
+        for t in self._threads:
+            t.start()
+
+    def submit(self, symbols, timeframes, priority=None, before=None, label=None):
+        # -> job_id. before() (например, ожидание синхронизации истории) выполняется в отдельном потоке,
+        # пары попадают в очередь после него. priority: "high" | "incremental" | "full" | None (по наличию модели)
+        pairs = [(s, tf) for s in symbols for tf in timeframes]
+        if priority is not None and priority not in PRIORITIES:
+            raise ValueError(f"priority must be one of {sorted(PRIORITIES)}")
+        with self._cv:
+            depth = len(self._pending)
+        job_id = self.db.create_training_job(label or ",".join(symbols), timeframes, priority=priority or "auto", queue_depth=depth)
+        job = _Job(job_id, len(pairs))
+        with self._cv:
+            self._jobs[job_id] = job
+        self.db.update_training_job(job_id, tasks_total=len(pairs), tasks_done=0,
+                                    message="waiting for history sync" if before else None)
+        if before is None:
+            self._enqueue(job, pairs, priority)
+        else:
+            threading.Thread(target=self._enqueue_after, args=(job, pairs, priority, before), daemon=True).start()
+        return job_id
+
+    def _enqueue_after(self, job, pairs, priority, before):
+        try:
+            before()
+        except Exception as e:
+            logger.exception("training job %s: preparation failed", job.id)
+            with job.lock:
+                self._finish(job, "error", str(e))
+            return
+        self._enqueue(job, pairs, priority)
+
+    def _priority(self, symbol, timeframe, priority):
+        if priority is not None:
+            return PRIORITIES[priority]
+        return PRIORITIES["incremental" if self.db.get_model_version(symbol, timeframe) is not None else "full"]
+
+    def _enqueue(self, job, pairs, priority):
+        prios = {p: self._priority(p[0], p[1], priority) for p in pairs}
+        coalesced = 0
+        with self._cv:
+            if job.cancelled:
+                return
+            job.enqueued_at = time.time()
+            for key in pairs:
+                task = self._pending.get(key)
+                if task is not None:
+                    # пара уже ждёт в очереди — присоединяемся; более срочный запрос поднимает задачу
+                    coalesced += 1
+                    if prios[key] < task.priority:
+                        task.priority = prios[key]
+                        heapq.heappush(self._heap, (task.priority, task.seq, task))
+                else:
+                    task = self._pending[key] = _Task(key[0], key[1], prios[key], next(self._seq))
+                    heapq.heappush(self._heap, (task.priority, task.seq, task))
+                task.jobs.add(job)
+            depth = len(self._pending)
+            self._cv.notify_all()
+        self.db.update_training_job(job.id, message=f"queued {len(pairs)} pairs ({coalesced} joined pending), queue depth {depth}")
+        if not pairs:
+            with job.lock:
+                self._finish(job, "finished", "nothing to train")
+
+    def _next_task(self):
+        # вызывается под self._cv: самая приоритетная ждущая пара, которая сейчас не обучается
+        deferred = []
+        task = None
+        while self._heap:
+            prio, seq, cand = heapq.heappop(self._heap)
+            if self._pending.get(cand.key) is not cand or prio != cand.priority:
+                continue  # устаревшая запись кучи: задача отменена, запущена или поднята в приоритете
+            if cand.key in self._running:
+                deferred.append((prio, seq, cand))
+                continue
+            task = cand
+            break
+        for item in deferred:
+            heapq.heappush(self._heap, item)
+        return task
+
+    def _worker(self):
+        while True:
+            with self._cv:
+                task = self._next_task()
+                while task is None and not self._stop:
+                    self._cv.wait()
+                    task = self._next_task()
+                if self._stop:
+                    return
+                del self._pending[task.key]
+                self._running[task.key] = task
+                task.running = True
+                now = time.time()
+                starting = [j for j in task.jobs if not j.started]
+                for j in starting:
+                    j.started = True
+                    j.started_at = now
+            for j in starting:
+                self.db.update_training_job(j.id, status="running", wait_sec=round(now - j.enqueued_at, 3))
+            error = None
+            trained = None
+            try:
+                trained = self.models.train_pair(task.symbol, task.timeframe, should_stop=task.cancel.is_set)
+            except TrainingCancelled:
+                logger.info("training %s %s cancelled", task.symbol, task.timeframe)
+            except Exception as e:
+                logger.exception("training %s %s failed", task.symbol, task.timeframe)
+                error = f"{task.symbol} {task.timeframe}: {e}"
+            with self._cv:
+                del self._running[task.key]
+                jobs = list(task.jobs)
+                self._cv.notify_all()
+            for job in jobs:
+                self._task_done(job, trained, error)
+
+    def _task_done(self, job, trained, error):
+        # trained: тайминги train_pair или None (учить нечего / ошибка / отмена)
+        with job.lock:
+            with self._cv:
+                if job.cancelled:
+                    return
+                job.done += 1
+                if trained:
+                    job.trained += 1
+                    job.prepare_sec += trained["prepare_sec"]
+                    job.fit_sec += trained["fit_sec"]
+                    job.save_sec += trained["save_sec"]
+                    job.pids.add(trained["pid"])
+                if error:
+                    job.failed.append(error)
+                done, total = job.done, job.total
+            if done < total:
+                self.db.update_training_job(job.id, progress=done / total, tasks_done=done, message=f"{done}/{total} finished")
+                return
+            message = f"trained {job.trained}/{total}"
+            if job.trained:
+                message += "; " + self._scaling(job)
+            if job.failed:
+                message += "; failed: " + "; ".join(job.failed)
+            self.db.update_training_job(job.id, tasks_done=done)
+            self._finish(job, "error" if job.failed else "finished", message)
+
+    def _scaling(self, job):
+        # эффективность: CPU-время пар (подготовка + обучение + запись) / (wall * ёмкость); CPU, а не wall
+        # пар — иначе конкурирующие за ядро потоки/процессы завышают "последовательное" время
+        wall = time.time() - job.started_at
+        serial = job.prepare_sec + job.fit_sec + job.save_sec
+        speedup = serial / wall if wall > 0 else 0.0
+        logger.info("training job %s: wall %.2fs, prepare %.2fs, fit %.2fs, save %.2fs, workers used %d",
+                    job.id, wall, job.prepare_sec, job.fit_sec, job.save_sec, len(job.pids))
+        mode = f"{self.capacity} processes" if Config.TRAIN_MODE == "process" else f"{self.workers} threads"
+        return f"{wall:.1f}s on {mode}, speedup x{speedup:.2f}, efficiency {speedup / self.capacity:.2f}"
+
+    def _finish(self, job, status, message):
+        # вызывается под job.lock; -> False, если итог уже записан (например, отмена разминулась с последней парой)
+        with self._cv:
+            if job.finished:
+                return False
+            job.finished = True
+            self._jobs.pop(job.id, None)
+        self.db.update_training_job(job.id, status=status, progress=1.0, message=message)
+        logger.info("training job %s %s: %s", job.id, status, message)
+        return True
+
+    def cancel(self, job_id):
+        # -> False, если задача уже завершена. Пары, нужные только этой задаче, снимаются с очереди,
+        # обучающиеся — прерываются на ближайшей границе чанка
+        with self._cv:
+            job = self._jobs.get(job_id)
+            if job is None or job.finished:
+                return False
+            job.cancelled = True
+            for key, task in list(self._pending.items()) + list(self._running.items()):
+                if job not in task.jobs:
+                    continue
+                task.jobs.discard(job)
+                if not task.jobs:
+                    if task.running:
+                        task.cancel.set()
+                    else:
+                        del self._pending[key]
+        # _task_done мог уже пройти проверку cancelled и дописывает итог под job.lock — тогда отмена опоздала
+        with job.lock:
+            return self._finish(job, "cancelled", "cancelled by user")
+
+    def stats(self):
+        with self._cv:
+            return {
+                "workers": self.workers,
+                "mode": Config.TRAIN_MODE,
+                "capacity": self.capacity,
+                "queue_depth": len(self._pending),
+                "running": [f"{s}|{tf}" for s, tf in self._running],
+                "jobs": len(self._jobs),
+            }
+
+    def stop(self):
+        with self._cv:
+            self._stop = True
+            for task in self._running.values():
+                task.cancel.set()
+            self._cv.notify_all()
+        for t in self._threads:
+            t.join(timeout=5)
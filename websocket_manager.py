@@ -14,8 +14,9 @@ def norm_stream_symbol(symbol: str):
     return symbol.replace("/","").lower()
 
 class WebsocketManager:
-    def __init__(self, cache_max=None):
+    def __init__(self, cache_max=None, url=None):
         self.cache_max = cache_max or Config.WS_CACHE_MAX
+        self.url = url or Config.WS_URL
         self._loop = None
         self._thread = None
         self._stop = threading.Event()
@@ -92,8 +93,7 @@ class WebsocketManager:
             self._task = None
         if not self._streams:
             return
-        base = "wss://stream.binance.com:9443/stream?streams="
-        uri = base + "/".join(sorted(self._streams))
+        uri = self.url + "/".join(sorted(self._streams))
         self._task = asyncio.create_task(self._combined(uri))
 
     async def _combined(self, uri):
@@ -0,0 +1,169 @@
+import queue
+import threading
+import time
+import logging
+from concurrent.futures import Future
+from config import Config
+
+logger = logging.getLogger("write_queue")
+
+_STOP = object()
+
+class WriteBehindQueue:
+    # Единственный поток-писатель: мутации DatabaseManager ставятся в очередь и коммитятся
+    # группами (до batch_size штук или раз в flush_interval), вместо транзакции на каждый вызов.
+    # Каждая мутация — fn(cursor, *args) в своём SAVEPOINT: ошибка одной не откатывает соседей.
+    # Вызывающий получает Future; Future в аргументах (id из add_trade) разрешается писателем.
+    def __init__(self, pool, flush_ms=None, batch_size=None):
+        self.pool = pool
+        self.flush_interval = (Config.DB_WRITE_FLUSH_MS if flush_ms is None else flush_ms) / 1000.0
+        self.batch_size = max(1, batch_size or Config.DB_WRITE_BATCH)
+        self._q = queue.Queue()
+        self._lock = threading.Lock()
+        self._closed = False
+        self._stats = {"submitted": 0, "committed": 0, "failed": 0, "batches": 0, "max_batch": 0, "commit_time_sec": 0.0}
+        self._thread = threading.Thread(target=self._run, name="db-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, fn, *args):
+        fut = Future()
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("write-behind queue is closed")
+            self._stats["submitted"] += 1
+            # в очередь под той же блокировкой: иначе запись может встать после _STOP и потеряться
+            self._q.put((fn, args, fut))
+        return fut
+
+    def flush(self, timeout=None):
+        # барьер: возвращается, когда всё поставленное ранее закоммичено
+        fut = Future()
+        with self._lock:
+            closed = self._closed
+            if not closed:
+                self._q.put((None, (), fut))
+        if closed:
+            # очередь больше никто не читает; писатель дописывает остаток до выхода — ждём его
+            self._thread.join(timeout)
+            if self._thread.is_alive():
+                raise TimeoutError("write-behind queue is still draining")
+            return None
+        return fut.result(timeout)
+
+    def close(self, timeout=None):
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._q.put(_STOP)
+        self._thread.join(timeout)
+
+    def pending(self):
+        return self._q.qsize()
+
+    def stats(self):
+        with self._lock:
+            out = dict(self._stats)
+        out.update(pending=self._q.qsize(), flush_ms=self.flush_interval * 1000, batch_size=self.batch_size)
+        return out
+
+    def _run(self):
+        stop = False
+        while not stop:
+            item = self._q.get()
+            if item is _STOP:
+                break
+            batch = [item]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                try:
+                    item = self._q.get(timeout=remaining) if remaining > 0 else self._q.get_nowait()
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stop = True
+                    break
+                batch.append(item)
+                if item[0] is None:
+                    # flush() не ждёт окончания интервала
+                    break
+            self._commit(batch)
+        # всё, что успели поставить до close(), дописываем и сбрасываем WAL в основной файл
+        rest = []
+        while True:
+            try:
+                item = self._q.get_nowait()
+            except queue.Empty:
+                break
+            if item is not _STOP:
+                rest.append(item)
+        for i in range(0, len(rest), self.batch_size):
+            self._commit(rest[i:i + self.batch_size])
+        self._checkpoint()
+
+    def _commit(self, batch):
+        t0 = time.perf_counter()
+        results = []
+        done = {}
+        conn = self.pool.acquire()
+        try:
+            c = conn.cursor()
+            c.execute("BEGIN IMMEDIATE")
+            for fn, args, fut in batch:
+                if fn is None:
+                    results.append((fut, None, None))
+                    continue
+                c.execute("SAVEPOINT wb")
+                try:
+                    args = tuple(self._resolve(a, done) for a in args)
+                    res = fn(c, *args)
+                    c.execute("RELEASE wb")
+                    done[id(fut)] = (res, None)
+                    results.append((fut, res, None))
+                except Exception as e:
+                    c.execute("ROLLBACK TO wb")
+                    c.execute("RELEASE wb")
+                    logger.warning("write-behind %s failed: %s", getattr(fn, "__name__", fn), e)
+                    done[id(fut)] = (None, e)
+                    results.append((fut, None, e))
+            conn.commit()
+        except Exception as e:
+            logger.exception("write-behind batch of %d failed", len(batch))
+            results = [(fut, None, e) for _, _, fut in batch]
+        finally:
+            conn.close()
+        failed = 0
+        for fut, res, err in results:
+            if err is not None:
+                failed += 1
+                fut.set_exception(err)
+            else:
+                fut.set_result(res)
+        with self._lock:
+            self._stats["batches"] += 1
+            self._stats["committed"] += len(results) - failed
+            self._stats["failed"] += failed
+            self._stats["max_batch"] = max(self._stats["max_batch"], len(batch))
+            self._stats["commit_time_sec"] += time.perf_counter() - t0
+
+    @staticmethod
+    def _resolve(arg, done):
+        if not isinstance(arg, Future):
+            return arg
+        # Future из этой же пачки ещё не выставлен (выставляем после commit) — берём результат напрямую
+        if id(arg) in done:
+            res, err = done[id(arg)]
+            if err is not None:
+                raise err
+            return res
+        return arg.result()
+
+    def _checkpoint(self):
+        conn = self.pool.acquire()
+        try:
+            conn.execute("PRAGMA wal_checkpoint(FULL)")
+        except Exception as e:
+            logger.warning("wal checkpoint on close failed: %s", e)
+        finally:
+            conn.close()